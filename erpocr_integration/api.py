@@ -1,9 +1,19 @@
 # Copyright (c) 2025, ERPNext OCR Integration Contributors
 # For license information, please see license.txt
 
+import os
+import time
+from collections import defaultdict, deque
+from types import SimpleNamespace
+
 import frappe
 from frappe import _
 
+# Hoisted: matching runs once per invoice and gemini_extract once per job. Both
+# import only frappe/requests. Drive (googleapiclient) and auto-draft stay
+# lazy — optional features whose imports are heavy or rarely needed.
+from erpocr_integration.tasks import gemini_extract, matching
+
 # Supported file types for upload (extension → MIME type for Gemini API)
 SUPPORTED_FILE_TYPES = {
 	".pdf": "application/pdf",
@@ -14,22 +24,83 @@ SUPPORTED_FILE_TYPES = {
 
 # Magic byte signatures for file type validation
 _MAGIC_BYTES = {
-	"application/pdf": (b"%PDF-", 5),
-	"image/jpeg": (b"\xff\xd8", 2),
-	"image/png": (b"\x89PNG", 4),
+	"application/pdf": b"%PDF-",
+	"image/jpeg": b"\xff\xd8",
+	"image/png": b"\x89PNG",
 }
 
+MAX_UPLOAD_SIZE = 10 * 1024 * 1024  # 10MB
+# Content-Length covers the whole multipart body (boundaries, part headers),
+# so the header pre-check allows this much on top of MAX_UPLOAD_SIZE.
+_MULTIPART_OVERHEAD = 64 * 1024
+MAX_PENDING_PER_USER = 20
+
+
+# In-process OCR Settings snapshot, keyed by site (one worker can serve several
+# sites). Saves the Redis round-trip get_cached_doc makes on every upload and
+# every extraction job. OCRSettings.on_update clears this process's entry;
+# other workers pick up a change within _SETTINGS_TTL seconds.
+_SETTINGS_TTL = 30
+_settings_cache: dict = {}
+
+
+def get_ocr_settings():
+	"""Return OCR Settings, reusing this process's copy for up to _SETTINGS_TTL seconds.
+
+	Read-only: the returned doc is shared between requests/jobs in this worker.
+	"""
+	site = getattr(frappe.local, "site", None)
+	cached = _settings_cache.get(site)
+	now = time.monotonic()
+	if cached and cached[1] > now:
+		return cached[0]
+	settings = frappe.get_cached_doc("OCR Settings")
+	_settings_cache[site] = (settings, now + _SETTINGS_TTL)
+	return settings
+
+
+def clear_ocr_settings_cache():
+	"""Drop this process's OCR Settings snapshot for the current site."""
+	_settings_cache.pop(getattr(frappe.local, "site", None), None)
+
+
+def mime_type_for_filename(filename: str | None) -> str | None:
+	"""MIME type for a supported upload filename (by extension), or None if unsupported."""
+	return SUPPORTED_FILE_TYPES.get(os.path.splitext(filename or "")[1].lower())
+
+
+def confidence_percent(value) -> float:
+	"""Gemini's 0.0-1.0 confidence as a 0-100 percent; unparseable values count as 0."""
+	try:
+		raw_confidence = float(value or 0.0)
+	except (ValueError, TypeError):
+		return 0.0
+	return max(0.0, min(100.0, raw_confidence * 100))
+
 
 def validate_file_magic_bytes(content: bytes, mime_type: str) -> bool:
 	"""Check file content starts with the expected magic bytes for the given MIME type.
 
 	Returns True if valid (or if MIME type has no known signature), False if mismatch.
 	"""
-	sig = _MAGIC_BYTES.get(mime_type)
-	if not sig:
+	magic = _MAGIC_BYTES.get(mime_type)
+	if not magic:
+		return True
+	return content.startswith(magic)
+
+
+def validate_upload_header(file, mime_type: str) -> bool:
+	"""Magic-byte check on an uploaded file stream, reading only the signature.
+
+	Spoofed extensions are rejected before the body is read into memory. The
+	stream is rewound so the caller can read it in full afterwards.
+	"""
+	magic = _MAGIC_BYTES.get(mime_type)
+	if not magic:
 		return True
-	magic, length = sig
-	return content[:length] == magic
+	head = file.read(len(magic))
+	file.seek(0)
+	return validate_file_magic_bytes(head, mime_type)
 
 
 def is_image_decodable(content: bytes) -> bool:
@@ -62,6 +133,22 @@ def is_image_decodable(content: bytes) -> bool:
 		return False
 
 
+def _count_pending_imports(user: str) -> int:
+	"""Pending OCR Imports for `user`, counted only up to MAX_PENDING_PER_USER.
+
+	The limit check only needs to know whether the cap is reached, so the
+	query stops at the cap instead of COUNT(*)-ing the user's whole backlog.
+	"""
+	return len(
+		frappe.get_all(
+			"OCR Import",
+			filters={"status": "Pending", "uploaded_by": user},
+			pluck="name",
+			limit=MAX_PENDING_PER_USER,
+		)
+	)
+
+
 @frappe.whitelist(methods=["POST"])
 def upload_pdf():
 	"""
@@ -79,12 +166,21 @@ def upload_pdf():
 	if not frappe.has_permission("OCR Import", "create"):
 		frappe.throw(_("You do not have permission to upload invoices"))
 
+	# Reject obviously oversized bodies from the header alone. Frappe/Werkzeug has
+	# already parsed the multipart body by now, so this only saves the pending
+	# count query; the read itself is bounded by the web server's body-size limit.
+	# Chunked requests carry no Content-Length and fall through to the exact
+	# per-file check below.
+	content_length = (frappe.request.content_length if frappe.request else None) or 0
+	if content_length > MAX_UPLOAD_SIZE + _MULTIPART_OVERHEAD:
+		frappe.throw(
+			_("File too large. Maximum size is 10MB. Your file is {0:.2f}MB").format(
+				content_length / (1024 * 1024)
+			)
+		)
+
 	# Per-user pending limit — prevents a single user from flooding the queue
-	MAX_PENDING_PER_USER = 20
-	user_pending = frappe.db.count(
-		"OCR Import",
-		filters={"status": "Pending", "uploaded_by": frappe.session.user},
-	)
+	user_pending = _count_pending_imports(frappe.session.user)
 	if user_pending >= MAX_PENDING_PER_USER:
 		frappe.throw(
 			_(
@@ -102,32 +198,31 @@ def upload_pdf():
 
 	# Validate file type
 	filename = file.filename
-	file_ext = "." + filename.rsplit(".", 1)[-1].lower() if "." in filename else ""
-	mime_type = SUPPORTED_FILE_TYPES.get(file_ext)
+	mime_type = mime_type_for_filename(filename)
 	if not mime_type:
 		supported = ", ".join(SUPPORTED_FILE_TYPES.keys())
 		frappe.throw(_("Unsupported file type. Accepted formats: {0}").format(supported))
 
-	# Validate file size (10MB max)
+	# Validate file size (10MB max). Werkzeug has already spooled the part to a
+	# temp file by now, so seek/tell is an lseek — nothing is read or buffered,
+	# and an oversized body is refused without ever entering memory.
 	file.seek(0, 2)  # Seek to end
 	file_size = file.tell()
 	file.seek(0)  # Reset to beginning
 
-	max_size = 10 * 1024 * 1024  # 10MB
-	if file_size > max_size:
+	if file_size > MAX_UPLOAD_SIZE:
 		frappe.throw(
 			_("File too large. Maximum size is 10MB. Your file is {0:.2f}MB").format(
 				file_size / (1024 * 1024)
 			)
 		)
 
-	# Read file content
-	file_content = file.read()
-
-	# Validate file magic bytes
-	if not validate_file_magic_bytes(file_content, mime_type):
+	# Validate file magic bytes from the header alone, then read the body
+	if not validate_upload_header(file, mime_type):
 		frappe.throw(_("File content does not match its file type. The file may be corrupted."))
 
+	file_content = file.read()
+
 	# Decode-verify images (v1.8.0, Q7b) — magic bytes prove only the header;
 	# an undecodable body would 500 later inside PIL. Same gate as
 	# upload_fleet_slip. PDFs are not raster-decoded by PIL, so they skip this.
@@ -135,7 +230,7 @@ def upload_pdf():
 		frappe.throw(_("That image couldn't be read — it may be corrupted. Please re-scan or re-export it."))
 
 	# Get company from OCR Settings
-	settings = frappe.get_single("OCR Settings")
+	settings = get_ocr_settings()
 	if not settings.default_company:
 		frappe.throw(_("Please set Default Company in OCR Settings"))
 
@@ -151,10 +246,9 @@ def upload_pdf():
 		}
 	)
 	ocr_import.insert(ignore_permissions=True)
-	frappe.db.commit()
 
 	# Save file as private attachment for retry capability
-	frappe.get_doc(
+	file_doc = frappe.get_doc(
 		{
 			"doctype": "File",
 			"file_name": filename,
@@ -164,19 +258,28 @@ def upload_pdf():
 			"is_private": 1,
 		}
 	).insert(ignore_permissions=True)
+
+	# One commit for placeholder + attachment: the worker must see both rows
+	# before it starts, and a failed File insert leaves no orphan placeholder.
+	# Not enqueue_after_commit: that pushes the job from an after-commit hook,
+	# where a Redis failure can no longer reach the except below and the
+	# placeholder would sit as Pending with no job behind it.
 	frappe.db.commit()
 
 	# Enqueue background processing. Stagger is handled at ingestion callers
 	# (Drive scan, email monitor) by sleeping between successive enqueues. The
 	# 600s timeout covers extraction plus the worst-case retry shape in
 	# gemini_extract._call_gemini_api (5 attempts, up to 225s of backoff +
-	# 5 * 60s request timeouts).
+	# 5 * 60s request timeouts). The job reads the bytes back from the File
+	# attachment — pickling up to 10MB into the Redis job payload would cost
+	# that much memory per queued upload in Redis and again in the worker.
 	try:
 		frappe.enqueue(
 			"erpocr_integration.api.gemini_process",
 			queue="long",
 			timeout=600,
-			pdf_content=file_content,
+			pdf_content=None,
+			file_doc_name=file_doc.name,
 			filename=filename,
 			ocr_import_name=ocr_import.name,
 			source_type="Gemini Manual Upload",
@@ -196,13 +299,101 @@ def upload_pdf():
 	return {"ocr_import": ocr_import.name, "status": "processing"}
 
 
+def _extraction_config(settings) -> SimpleNamespace:
+	"""Snapshot of the OCR Settings fields the per-invoice helpers read, resolved once per job.
+
+	Defaults (matching threshold, blank default item) are applied here so
+	_run_matching and _populate_ocr_import don't re-derive them per invoice.
+	"""
+	return SimpleNamespace(
+		default_company=settings.default_company,
+		default_tax_template=settings.default_tax_template,
+		non_vat_tax_template=settings.non_vat_tax_template,
+		import_tax_template=settings.get("import_tax_template"),
+		matching_threshold=settings.matching_threshold or 80,
+		default_item=(settings.get("default_item") or "").strip(),
+	)
+
+
+def _new_ocr_import_doc(placeholder_doc, filename: str, source_type: str, uploaded_by: str | None, settings):
+	"""Unsaved OCR Import for an additional invoice in a multi-invoice file.
+
+	Copies the placeholder's source metadata so dedup (email/Drive) and the
+	Drive retry cap see every record from the same file.
+	"""
+	return frappe.get_doc(
+		{
+			"doctype": "OCR Import",
+			"status": "Pending",
+			"source_filename": filename,
+			"source_type": source_type,
+			"uploaded_by": uploaded_by or frappe.session.user,
+			"company": settings.default_company,
+			"email_message_id": placeholder_doc.email_message_id,
+			"drive_file_id": placeholder_doc.drive_file_id,
+			"drive_retry_count": placeholder_doc.drive_retry_count,
+		}
+	)
+
+
+def _load_source_content(drive_file_id: str | None, file_doc_name: str | None) -> bytes:
+	"""Fetch the original file for a job enqueued by reference: Drive first, then the attachment."""
+	content = None
+	if drive_file_id:
+		from erpocr_integration.tasks.drive_integration import download_file_from_drive
+
+		content = download_file_from_drive(drive_file_id)
+	if not content and file_doc_name:
+		content = frappe.get_doc("File", file_doc_name).get_content()
+	if not content:
+		raise Exception("Original file not available. Please re-upload the file.")
+	return content
+
+
+class _ProgressEmitter:
+	"""Buffer ``ocr_extraction_progress`` stages and publish them as one frame.
+
+	Each ``publish_realtime`` is a Redis PUBLISH plus a socket.io frame; the
+	extraction job used to fire one per stage. Stages are now buffered with
+	``stage()`` and sent together by ``flush()`` at the job's checkpoints
+	(Gemini about to be called, job finished, job failed). The frame carries the whole
+	``events`` list plus the latest ``status``/``message`` at the top level so
+	a listener that only reads the last stage keeps working.
+	"""
+
+	def __init__(self, ocr_import_name: str, user: str | None):
+		self.ocr_import_name = ocr_import_name
+		self.user = user
+		self.events = []
+
+	def stage(self, status: str, message: str):
+		self.events.append({"status": status, "message": message})
+
+	def flush(self):
+		if not self.events:
+			return
+		events, self.events = self.events, []
+		frappe.publish_realtime(
+			event="ocr_extraction_progress",
+			message={
+				"ocr_import": self.ocr_import_name,
+				"status": events[-1]["status"],
+				"message": events[-1]["message"],
+				"events": events,
+			},
+			user=self.user,
+		)
+
+
 def gemini_process(
-	pdf_content: bytes,
+	pdf_content: bytes | None,
 	filename: str,
 	ocr_import_name: str,
 	source_type: str = "Gemini Manual Upload",
 	uploaded_by: str | None = None,
 	mime_type: str = "application/pdf",
+	file_doc_name: str | None = None,
+	drive_file_id: str | None = None,
 ):
 	"""
 	Background job to process PDF/image via Gemini API and create OCR Import(s).
@@ -212,54 +403,60 @@ def gemini_process(
 	Additional invoices create new OCR Import records.
 
 	Args:
-		pdf_content: Raw file bytes (PDF or image)
+		pdf_content: Raw file bytes (PDF or image), or None when file_doc_name is given
 		filename: Original filename
 		ocr_import_name: Name of the OCR Import record to update
 		source_type: "Gemini Manual Upload", "Gemini Email", or "Gemini Drive Scan"
 		uploaded_by: User who initiated the upload
 		mime_type: MIME type for Gemini API (e.g., "application/pdf", "image/jpeg")
+		file_doc_name: File attachment to read the bytes from (manual upload, retry)
+		drive_file_id: Drive file to download the bytes from (retry); tried before file_doc_name
 	"""
 	# Run as the uploading user (not Administrator) for audit trail.
-	# Individual calls use ignore_permissions where needed.
-	frappe.set_user(uploaded_by or "Administrator")
+	# Individual calls use ignore_permissions where needed. Skipped when the
+	# worker is already that user — set_user clears the session's permission state.
+	run_as = uploaded_by or "Administrator"
+	if frappe.session.user != run_as:
+		frappe.set_user(run_as)
+	progress = _ProgressEmitter(ocr_import_name, uploaded_by)
 
 	try:
-		# Update status to "Extracting"
-		frappe.db.set_value("OCR Import", ocr_import_name, "status", "Pending")
-		frappe.db.commit()
+		# Every caller inserts the placeholder as "Pending" — no status write needed here
 
-		# Publish realtime update
-		frappe.publish_realtime(
-			event="ocr_extraction_progress",
-			message={
-				"ocr_import": ocr_import_name,
-				"status": "Extracting",
-				"message": "Calling Gemini API...",
-			},
-			user=uploaded_by,
-		)
+		progress.stage("Extracting", "Calling Gemini API...")
 
-		# Call Gemini API — returns list of invoices (usually 1, but may be multiple)
-		from erpocr_integration.tasks.gemini_extract import extract_invoice_data
+		if pdf_content is None:
+			pdf_content = _load_source_content(drive_file_id, file_doc_name)
+
+		settings = get_ocr_settings()
 
-		invoice_list = extract_invoice_data(pdf_content, filename, mime_type=mime_type)
+		# Call Gemini API — returns list of invoices (usually 1, but may be multiple)
+		# Born-digital PDFs can go as text; None falls back to the vision path
+		text_content = None
+		if mime_type == "application/pdf" and settings.get("use_pdf_text_layer"):
+			text_content = gemini_extract.extract_pdf_text(pdf_content)
+
+		# Sent on its own before the slowest step, so the user sees the job is
+		# running while Gemini works (often 10-60s)
+		progress.flush()
+		invoice_list = gemini_extract.extract_invoice_data(
+			pdf_content, filename, mime_type=mime_type, text_content=text_content
+		)
 
 		# Publish realtime update
 		invoice_count = len(invoice_list)
 		msg = "Matching suppliers and items..."
 		if invoice_count > 1:
 			msg = f"Found {invoice_count} invoices. Matching suppliers and items..."
-		frappe.publish_realtime(
-			event="ocr_extraction_progress",
-			message={"ocr_import": ocr_import_name, "status": "Processing", "message": msg},
-			user=uploaded_by,
-		)
+		progress.stage("Processing", msg)
 
-		settings = frappe.get_cached_doc("OCR Settings")
+		# Loaded once: the Drive branch reads its drive_file_id and the first
+		# invoice is written onto it
+		placeholder_doc = frappe.get_doc("OCR Import", ocr_import_name)
 
 		# Drive: upload new file now, or defer move for scan files until after processing
 		drive_result = {"file_id": None, "shareable_link": None, "folder_path": None}
-		existing_drive_file_id = frappe.db.get_value("OCR Import", ocr_import_name, "drive_file_id")
+		existing_drive_file_id = placeholder_doc.drive_file_id
 		first_header = invoice_list[0].get("header_fields", {}) if invoice_list else {}
 
 		if not existing_drive_file_id:
@@ -283,36 +480,30 @@ def gemini_process(
 			# Drive scan: keep file_id reference, move to archive after processing succeeds
 			drive_result = {"file_id": existing_drive_file_id, "shareable_link": None, "folder_path": None}
 
-		# Process each invoice and collect all created OCR Import names
-		placeholder_doc = frappe.get_doc("OCR Import", ocr_import_name)
-		all_ocr_import_names = []
+		# Populate + match every invoice first: the placeholder carries the first
+		# one, each further invoice gets a sibling record with the same source
+		cfg = _extraction_config(settings)
+		ocr_imports = []
 		for idx, extracted_data in enumerate(invoice_list):
-			if idx == 0:
-				ocr_import = placeholder_doc
-			else:
-				# Additional invoices create new records — copy source metadata
-				ocr_import = frappe.get_doc(
-					{
-						"doctype": "OCR Import",
-						"status": "Pending",
-						"source_filename": filename,
-						"source_type": source_type,
-						"uploaded_by": uploaded_by or frappe.session.user,
-						"company": settings.default_company,
-						"email_message_id": placeholder_doc.email_message_id,
-						"drive_file_id": placeholder_doc.drive_file_id,
-						"drive_retry_count": placeholder_doc.drive_retry_count,
-					}
-				)
-
-			_populate_ocr_import(ocr_import, extracted_data, settings, drive_result)
-			_run_matching(ocr_import, extracted_data.get("header_fields", {}), settings)
-
-			if idx == 0:
+			ocr_import = (
+				placeholder_doc
+				if idx == 0
+				else _new_ocr_import_doc(placeholder_doc, filename, source_type, uploaded_by, cfg)
+			)
+			_populate_ocr_import(ocr_import, extracted_data, cfg, drive_result)
+			_run_matching(ocr_import, extracted_data.get("header_fields", {}), cfg)
+			ocr_imports.append(ocr_import)
+
+		# Then write them all in one pass. Links are still validated on write:
+		# default item, tax template and fuzzy matches come from process-level
+		# caches and may be up to a minute stale. A raw bulk_insert is not an
+		# option: it would skip before_save (_update_status) and the naming series.
+		all_ocr_import_names = []
+		for ocr_import in ocr_imports:
+			if ocr_import is placeholder_doc:
 				ocr_import.save(ignore_permissions=True)
 			else:
 				ocr_import.insert(ignore_permissions=True)
-
 			all_ocr_import_names.append(ocr_import.name)
 
 		frappe.db.commit()
@@ -329,21 +520,16 @@ def gemini_process(
 				)
 				if drive_result.get("folder_path"):
 					frappe.logger().info(f"Moved {filename} to Drive archive: {drive_result['folder_path']}")
-					# Update all OCR Imports from this PDF with archive info
-					for doc_name in frappe.get_all(
+					# Update all OCR Imports from this PDF with archive info — one
+					# filtered UPDATE however many invoices the PDF held
+					frappe.db.set_value(
 						"OCR Import",
-						filters={"drive_file_id": existing_drive_file_id},
-						pluck="name",
-						ignore_permissions=True,
-					):
-						frappe.db.set_value(
-							"OCR Import",
-							doc_name,
-							{
-								"drive_link": drive_result.get("shareable_link"),
-								"drive_folder_path": drive_result.get("folder_path"),
-							},
-						)
+						{"drive_file_id": existing_drive_file_id},
+						{
+							"drive_link": drive_result.get("shareable_link"),
+							"drive_folder_path": drive_result.get("folder_path"),
+						},
+					)
 					frappe.db.commit()
 			except Exception as e:
 				frappe.log_error(
@@ -371,7 +557,13 @@ def gemini_process(
 		# now, so a notification failure must NOT reach the except handler —
 		# that would roll back nothing but still mark a successful run Error.
 		try:
-			ocr_import_first = frappe.get_doc("OCR Import", ocr_import_name)
+			# Only auto-draft rewrites records after our save; otherwise the
+			# placeholder in memory is already current (status set by before_save)
+			ocr_import_first = (
+				frappe.get_doc("OCR Import", ocr_import_name)
+				if getattr(settings, "enable_auto_draft", 0)
+				else placeholder_doc
+			)
 			if getattr(ocr_import_first, "auto_drafted", 0):
 				msg = "Auto-drafted! Document created automatically. Please review and submit."
 				if invoice_count > 1:
@@ -380,15 +572,8 @@ def gemini_process(
 				msg = "Extraction complete! Please review and confirm matches."
 				if invoice_count > 1:
 					msg = f"Extraction complete! {invoice_count} invoices created. Please review."
-			frappe.publish_realtime(
-				event="ocr_extraction_progress",
-				message={
-					"ocr_import": ocr_import_name,
-					"status": ocr_import_first.status,
-					"message": msg,
-				},
-				user=uploaded_by,
-			)
+			progress.stage(ocr_import_first.status, msg)
+			progress.flush()
 		except Exception:
 			frappe.log_error(
 				title="OCR Notification Error",
@@ -410,21 +595,16 @@ def gemini_process(
 				title="OCR Integration Error",
 				message=f"Gemini extraction failed for {filename}\n{frappe.get_traceback()}",
 			)
+			# By-name set_value is a single UPDATE. placeholder_doc.db_set would
+			# cost more: it re-reads the row (load_doc_before_save), runs the
+			# change hooks, and the in-memory doc holds rolled-back field values.
 			frappe.db.set_value(
 				"OCR Import", ocr_import_name, {"status": "Error", "error_log": error_log.name}
 			)
 			frappe.db.commit()
 
-			# Publish realtime update
-			frappe.publish_realtime(
-				event="ocr_extraction_progress",
-				message={
-					"ocr_import": ocr_import_name,
-					"status": "Error",
-					"message": f"Extraction failed: {e!s}",
-				},
-				user=uploaded_by,
-			)
+			progress.stage("Error", f"Extraction failed: {e!s}")
+			progress.flush()
 		except Exception:
 			# Even error handling failed
 			frappe.log_error(title="OCR Integration Critical Error", message=frappe.get_traceback())
@@ -494,11 +674,7 @@ def _populate_ocr_import(ocr_import, extracted_data: dict, settings, drive_resul
 	ocr_import.tax_amount = header_fields.get("tax_amount", 0.0)
 	ocr_import.total_amount = header_fields.get("total_amount", 0.0)
 	ocr_import.currency = header_fields.get("currency", "")
-	try:
-		raw_confidence = float(header_fields.get("confidence") or 0.0)
-	except (ValueError, TypeError):
-		raw_confidence = 0.0
-	ocr_import.confidence = max(0.0, min(100.0, raw_confidence * 100))  # Clamp to 0-100
+	ocr_import.confidence = confidence_percent(header_fields.get("confidence"))
 	ocr_import.raw_payload = extracted_data.get("raw_response", "")
 
 	# Auto-set tax template based on whether tax was detected (and, for
@@ -508,7 +684,9 @@ def _populate_ocr_import(ocr_import, extracted_data: dict, settings, drive_resul
 	subtotal = float(header_fields.get("subtotal") or 0)
 	ocr_import.tax_template = _select_tax_template(settings, subtotal, tax_amount)
 
-	# Add line items
+	# Add line items. Appended row by row on purpose: Document.set("items", rows)
+	# is set([]) + extend(), and extend() calls append() per row — the child
+	# Document construction per line is the same either way.
 	ocr_import.items = []
 	for line in line_items:
 		description = line.get("description", "")
@@ -538,34 +716,29 @@ def _run_matching(ocr_import, header_fields: dict, settings):
 
 	Item matching pipeline (precedence order; v1.8.0 split the alias tier):
 	  1. `match_item_by_supplier_part` — Item Supplier lookup (supplier, product_code)
-	  2. `match_item` — supplier-scoped alias → global alias → Item.item_name /
+	  2. `match_items_bulk` — supplier-scoped alias → global alias → Item.item_name /
 	     Item.name exact match on description (Q7c: a supplier-scoped alias
-	     beats the global one; every pre-v1.8.0 alias stays global)
+	     beats the global one; every pre-v1.8.0 alias stays global). Same tiers
+	     as `match_item`, resolved for all lines in one pass
 	  3. `match_service_item` — pattern-based service mapping
 	  4. `match_item_fuzzy` — difflib similarity on description
 	  5. `default_item` fallback — set in OCR Settings, status "Suggested"
-	"""
-	from erpocr_integration.tasks.matching import (
-		match_item,
-		match_item_by_supplier_part,
-		match_item_fuzzy,
-		match_service_item,
-		match_supplier,
-		match_supplier_fuzzy,
-	)
 
-	fuzzy_threshold = settings.matching_threshold or 80
-	default_item = (settings.get("default_item") or "").strip()
+	`settings` is the per-job snapshot from `_extraction_config` (threshold and
+	default item already normalised).
+	"""
+	fuzzy_threshold = settings.matching_threshold
+	default_item = settings.default_item
 
 	# Supplier matching
 	if ocr_import.supplier_name_ocr:
-		matched_supplier, match_status = match_supplier(ocr_import.supplier_name_ocr)
+		matched_supplier, match_status = matching.match_supplier(ocr_import.supplier_name_ocr)
 		if matched_supplier:
 			ocr_import.supplier = matched_supplier
 			ocr_import.supplier_match_status = match_status
 		else:
 			# Fuzzy fallback for supplier
-			fuzzy_supplier, fuzzy_status, _score = match_supplier_fuzzy(
+			fuzzy_supplier, fuzzy_status, _score = matching.match_supplier_fuzzy(
 				ocr_import.supplier_name_ocr, fuzzy_threshold
 			)
 			if fuzzy_supplier:
@@ -578,17 +751,39 @@ def _run_matching(ocr_import, header_fields: dict, settings):
 		ocr_import.supplier = ""
 		ocr_import.supplier_match_status = "Unmatched"
 
+	# Tier 2 for the whole invoice in one pass (one query per sub-tier, not per line)
+	exact_matches = matching.match_items_bulk(
+		[item.description_ocr for item in ocr_import.items],
+		supplier=ocr_import.supplier,
+		supplier_status=ocr_import.supplier_match_status,
+	)
+
+	# Service mappings for this company + supplier, loaded once and shared by
+	# every line's Tier 3 lookup and the accounting-fields pass below
+	service_mappings = matching.load_service_mappings(ocr_import.company, ocr_import.supplier)
+
 	# Item matching for each line
 	for item in ocr_import.items:
 		matched_item, match_status = None, "Unmatched"
 
+		# Service mapping probed once per row: Tier 3 uses it to pick the item,
+		# and matched rows reuse it below for their accounting fields
+		service_match = None
+		if item.description_ocr:
+			service_match = matching.match_service_item(
+				item.description_ocr,
+				company=ocr_import.company,
+				supplier=ocr_import.supplier,
+				mappings=service_mappings,
+			)
+
 		# Tier 1: Item Supplier lookup (supplier, product_code) → item_code.
 		# Highest precision: supplier-scoped, deterministic. Runs first so a
 		# correct supplier-product mapping isn't shadowed by a global (non
 		# supplier-scoped) description alias from OCR Item Alias.
 		# Auto-populated as users confirm matches (see _enqueue_item_supplier_learning).
 		if ocr_import.supplier and item.product_code:
-			supplier_part_item, supplier_part_status = match_item_by_supplier_part(
+			supplier_part_item, supplier_part_status = matching.match_item_by_supplier_part(
 				ocr_import.supplier, item.product_code, supplier_status=ocr_import.supplier_match_status
 			)
 			if supplier_part_item:
@@ -599,28 +794,20 @@ def _run_matching(ocr_import, header_fields: dict, settings):
 
 		# Tier 2: alias (supplier-scoped beats global) / exact name / exact item_code
 		if not matched_item and item.description_ocr:
-			matched_item, match_status = match_item(
-				item.description_ocr,
-				supplier=ocr_import.supplier,
-				supplier_status=ocr_import.supplier_match_status,
-			)
+			matched_item, match_status = exact_matches.get(item.description_ocr.strip(), (None, "Unmatched"))
 
 		# Tier 3: service mapping (pattern → item + name + GL + CC)
-		if not matched_item and item.description_ocr:
-			service_match = match_service_item(
-				item.description_ocr, company=ocr_import.company, supplier=ocr_import.supplier
-			)
-			if service_match:
-				matched_item = service_match["item_code"]
-				match_status = service_match["match_status"]
-				item.expense_account = service_match.get("expense_account")
-				item.cost_center = service_match.get("cost_center")
-				if service_match.get("item_name"):
-					item.item_name = service_match["item_name"]
+		if not matched_item and service_match:
+			matched_item = service_match["item_code"]
+			match_status = service_match["match_status"]
+			item.expense_account = service_match.get("expense_account")
+			item.cost_center = service_match.get("cost_center")
+			if service_match.get("item_name"):
+				item.item_name = service_match["item_name"]
 
 		# Tier 4: fuzzy on description (alias pool scoped: global + this supplier)
 		if not matched_item and item.description_ocr:
-			fuzzy_item, fuzzy_status, _score = match_item_fuzzy(
+			fuzzy_item, fuzzy_status, _score = matching.match_item_fuzzy(
 				item.description_ocr, fuzzy_threshold, supplier=ocr_import.supplier
 			)
 			if fuzzy_item:
@@ -638,15 +825,11 @@ def _run_matching(ocr_import, header_fields: dict, settings):
 			item.match_status = match_status
 
 			# Even when item matched via alias/fuzzy, check service mapping for accounting fields
-			if not item.expense_account and item.description_ocr:
-				service_match = match_service_item(
-					item.description_ocr, company=ocr_import.company, supplier=ocr_import.supplier
-				)
-				if service_match:
-					item.expense_account = service_match.get("expense_account")
-					item.cost_center = service_match.get("cost_center")
-					if service_match.get("item_name"):
-						item.item_name = service_match["item_name"]
+			if not item.expense_account and service_match:
+				item.expense_account = service_match.get("expense_account")
+				item.cost_center = service_match.get("cost_center")
+				if service_match.get("item_name"):
+					item.item_name = service_match["item_name"]
 		else:
 			item.match_status = "Unmatched"
 
@@ -665,11 +848,7 @@ def retry_gemini_extraction(ocr_import: str):
 		frappe.throw(_("You do not have permission to retry this extraction"))
 
 	# Per-user pending limit — same guard as upload_pdf()
-	MAX_PENDING_PER_USER = 20
-	user_pending = frappe.db.count(
-		"OCR Import",
-		filters={"status": "Pending", "uploaded_by": frappe.session.user},
-	)
+	user_pending = _count_pending_imports(frappe.session.user)
 	if user_pending >= MAX_PENDING_PER_USER:
 		frappe.throw(
 			_(
@@ -677,7 +856,16 @@ def retry_gemini_extraction(ocr_import: str):
 			).format(user_pending)
 		)
 
-	ocr_import_doc = frappe.get_doc("OCR Import", ocr_import)
+	# Header fields only — the full doc would also load the items table this
+	# retry is about to delete
+	ocr_import_doc = frappe.db.get_value(
+		"OCR Import",
+		ocr_import,
+		["name", "status", "source_type", "drive_file_id", "source_filename"],
+		as_dict=True,
+	)
+	if not ocr_import_doc:
+		frappe.throw(_("OCR Import {0} not found.").format(ocr_import), frappe.DoesNotExistError)
 
 	if ocr_import_doc.status != "Error":
 		frappe.throw(_("Can only retry failed extractions"))
@@ -685,41 +873,33 @@ def retry_gemini_extraction(ocr_import: str):
 	if ocr_import_doc.source_type not in ("Gemini Manual Upload", "Gemini Email", "Gemini Drive Scan"):
 		frappe.throw(_("Can only retry Gemini extractions"))
 
-	# Get file content: try Drive first, then local attachment
-	pdf_content = None
-
-	if ocr_import_doc.drive_file_id:
-		from erpocr_integration.tasks.drive_integration import download_file_from_drive
-
-		pdf_content = download_file_from_drive(ocr_import_doc.drive_file_id)
-
-	if not pdf_content:
-		# Try reading from attached file
-		attached = frappe.get_all(
-			"File",
-			filters={
-				"attached_to_doctype": "OCR Import",
-				"attached_to_name": ocr_import_doc.name,
-			},
-			fields=["name", "file_url"],
-			limit=1,
-			order_by="creation desc",
-		)
-		if attached:
-			file_doc = frappe.get_doc("File", attached[0].name)
-			pdf_content = file_doc.get_content()
+	# Locate the original file: Drive first, then local attachment. Only the
+	# references are enqueued — the job downloads/reads the bytes itself, so the
+	# web request never buffers the PDF and the Redis payload stays small.
+	attached = frappe.get_all(
+		"File",
+		filters={
+			"attached_to_doctype": "OCR Import",
+			"attached_to_name": ocr_import_doc.name,
+		},
+		fields=["name", "file_url"],
+		limit=1,
+		order_by="creation desc",
+	)
+	file_doc_name = attached[0].name if attached else None
 
-	if not pdf_content:
+	if not ocr_import_doc.drive_file_id and not file_doc_name:
 		frappe.throw(_("Original file not available. Please re-upload the file."))
 
 	# Determine MIME type from original filename
 	source_filename = ocr_import_doc.source_filename or ""
-	file_ext = ("." + source_filename.rsplit(".", 1)[-1].lower()) if "." in source_filename else ""
-	file_mime_type = SUPPORTED_FILE_TYPES.get(file_ext, "application/pdf")
+	file_mime_type = mime_type_for_filename(source_filename) or "application/pdf"
 
 	# Reset status and clear stale links from previous run so re-extraction
 	# starts clean (prevents stale supplier/item matches from persisting).
-	ocr_import_doc.db_set(
+	frappe.db.set_value(
+		"OCR Import",
+		ocr_import_doc.name,
 		{
 			"status": "Pending",
 			"supplier": "",
@@ -727,7 +907,7 @@ def retry_gemini_extraction(ocr_import: str):
 			"purchase_order": "",
 			"purchase_receipt_link": "",
 			"document_type": "",
-		}
+		},
 	)
 	frappe.db.delete("OCR Import Item", {"parent": ocr_import_doc.name})
 	frappe.db.commit()
@@ -738,16 +918,18 @@ def retry_gemini_extraction(ocr_import: str):
 			"erpocr_integration.api.gemini_process",
 			queue="long",
 			timeout=600,
-			pdf_content=pdf_content,
+			pdf_content=None,
 			filename=ocr_import_doc.source_filename,
 			ocr_import_name=ocr_import_doc.name,
 			source_type=ocr_import_doc.source_type,
 			uploaded_by=frappe.session.user,
 			mime_type=file_mime_type,
+			file_doc_name=file_doc_name,
+			drive_file_id=ocr_import_doc.drive_file_id,
 		)
 	except Exception:
 		# Enqueue failed — revert to Error so it doesn't sit as stale Pending
-		ocr_import_doc.db_set("status", "Error")
+		frappe.db.set_value("OCR Import", ocr_import_doc.name, "status", "Error")
 		frappe.db.commit()
 		frappe.log_error(
 			title="OCR Retry Enqueue Error",
@@ -937,28 +1119,17 @@ def get_purchase_receipts_for_po(purchase_order):
 	if not frappe.has_permission("Purchase Receipt", "read"):
 		frappe.throw(_("You don't have permission to view Purchase Receipts."))
 
-	pr_names = frappe.db.sql(
-		"""
-		SELECT DISTINCT pri.parent
-		FROM `tabPurchase Receipt Item` pri
-		INNER JOIN `tabPurchase Receipt` pr ON pr.name = pri.parent
-		WHERE pri.purchase_order = %s
-		  AND pr.docstatus = 1
-		""",
-		purchase_order,
-		as_list=True,
-	)
-
-	if not pr_names:
-		return []
-
-	# Use get_list (not get_all) to respect user-permission restrictions
-	pr_name_list = [r[0] for r in pr_names]
+	# One permission-aware query: get_list joins the child table for the
+	# Purchase Receipt Item filter and applies user-permission conditions
 	return frappe.get_list(
 		"Purchase Receipt",
-		filters={"name": ["in", pr_name_list]},
+		filters=[
+			["Purchase Receipt Item", "purchase_order", "=", purchase_order],
+			["Purchase Receipt", "docstatus", "=", 1],
+		],
 		fields=["name", "posting_date", "status"],
-		order_by="posting_date desc",
+		order_by="`tabPurchase Receipt`.posting_date desc",
+		distinct=True,
 	)
 
 
@@ -968,8 +1139,8 @@ def purchase_receipt_link_query(doctype, txt, searchfield, start, page_len, filt
 
 	Returns PRs linked to the selected PO. Required signature for set_query().
 	Enforces read permission on both Purchase Receipt and Purchase Order,
-	and scopes results to the PO's company. Per-document permission filtering
-	ensures user-permission restrictions are respected.
+	and scopes results to the PO's company. User-permission restrictions on
+	Purchase Receipt are applied by get_list in the query itself.
 	"""
 	if not frappe.has_permission("Purchase Receipt", "read"):
 		return []
@@ -995,38 +1166,25 @@ def purchase_receipt_link_query(doctype, txt, searchfield, start, page_len, filt
 	txt = (txt or "")[:80]
 	txt = txt.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
 
-	# Fetch candidate PR names via SQL (needed for child-table JOIN)
-	# then filter through per-document permission check
-	candidates = frappe.db.sql(
-		"""
-		SELECT DISTINCT pr.name, pr.posting_date, pr.status
-		FROM `tabPurchase Receipt` pr
-		INNER JOIN `tabPurchase Receipt Item` pri ON pri.parent = pr.name
-		WHERE pri.purchase_order = %(purchase_order)s
-		  AND pr.docstatus = 1
-		  AND pr.company = %(company)s
-		  AND pr.name LIKE %(txt)s
-		ORDER BY pr.posting_date DESC
-		""",
-		{
-			"purchase_order": purchase_order,
-			"txt": f"%{txt}%",
-			"company": po_company,
-		},
-		as_dict=True,
+	# get_list joins the child table for the PO filter and applies the
+	# user-permission / permission-query conditions in the same SQL, so rows
+	# come back already filtered and the page can be cut in the query
+	rows = frappe.get_list(
+		"Purchase Receipt",
+		filters=[
+			["Purchase Receipt Item", "purchase_order", "=", purchase_order],
+			["Purchase Receipt", "docstatus", "=", 1],
+			["Purchase Receipt", "company", "=", po_company],
+			["Purchase Receipt", "name", "like", f"%{txt}%"],
+		],
+		fields=["name", "posting_date", "status"],
+		order_by="`tabPurchase Receipt`.posting_date desc",
+		distinct=True,
+		limit_start=int(start or 0),
+		limit_page_length=int(page_len or 20),
 	)
 
-	# Per-document permission filter (respects user-permission restrictions)
-	start = int(start or 0)
-	page_len = int(page_len or 20)
-	results = []
-	for row in candidates:
-		if frappe.has_permission("Purchase Receipt", "read", row.name):
-			results.append([row.name, f"{row.posting_date} — {row.status}"])
-			if len(results) >= start + page_len:
-				break
-
-	return results[start:]
+	return [[row.name, f"{row.posting_date} — {row.status}"] for row in rows]
 
 
 @frappe.whitelist()
@@ -1041,22 +1199,27 @@ def match_po_items(ocr_import, purchase_order):
 		frappe.throw(_("You don't have permission to view this Purchase Order."))
 
 	ocr_doc = frappe.get_doc("OCR Import", ocr_import)
-	po_doc = frappe.get_doc("Purchase Order", purchase_order)
 
-	# Validate supplier and company match
-	if po_doc.supplier != ocr_doc.supplier:
+	# Validate supplier and company match against the PO header before loading
+	# the PO with its items, so a mismatch doesn't pay for the child table
+	po_header = frappe.db.get_value("Purchase Order", purchase_order, ["supplier", "company"], as_dict=True)
+	if not po_header:
+		frappe.throw(_("Purchase Order {0} not found.").format(purchase_order), frappe.DoesNotExistError)
+	if po_header.supplier != ocr_doc.supplier:
 		frappe.throw(
 			_("PO supplier '{0}' does not match OCR Import supplier '{1}'.").format(
-				po_doc.supplier, ocr_doc.supplier
+				po_header.supplier, ocr_doc.supplier
 			)
 		)
-	if po_doc.company != ocr_doc.company:
+	if po_header.company != ocr_doc.company:
 		frappe.throw(
 			_("PO company '{0}' does not match OCR Import company '{1}'.").format(
-				po_doc.company, ocr_doc.company
+				po_header.company, ocr_doc.company
 			)
 		)
 
+	po_doc = frappe.get_doc("Purchase Order", purchase_order)
+
 	# Build a pool of PO items (FIFO for duplicate item_codes)
 	po_items_pool = []
 	for po_item in po_doc.items:
@@ -1071,22 +1234,27 @@ def match_po_items(ocr_import, purchase_order):
 			}
 		)
 
-	# Match OCR items to PO items by item_code (FIFO)
+	# Match OCR items to PO items by item_code (FIFO). Bucketing the pool by
+	# item_code keeps this linear in line count instead of rescanning the pool
+	# for every OCR row; the pool list itself keeps PO order for unmatched_po.
+	po_items_by_code = defaultdict(deque)
+	for po_item in po_items_pool:
+		po_items_by_code[po_item["item_code"]].append(po_item)
+
 	matches = []
 	for item in ocr_doc.items:
 		match = None
-		if item.item_code:
-			for po_item in po_items_pool:
-				if not po_item["matched"] and po_item["item_code"] == item.item_code:
-					po_item["matched"] = True
-					match = {
-						"purchase_order_item": po_item["name"],
-						"po_item_code": po_item["item_code"],
-						"po_item_name": po_item["item_name"],
-						"po_qty": po_item["qty"],
-						"po_rate": po_item["rate"],
-					}
-					break
+		bucket = po_items_by_code.get(item.item_code) if item.item_code else None
+		if bucket:
+			po_item = bucket.popleft()
+			po_item["matched"] = True
+			match = {
+				"purchase_order_item": po_item["name"],
+				"po_item_code": po_item["item_code"],
+				"po_item_name": po_item["item_name"],
+				"po_qty": po_item["qty"],
+				"po_rate": po_item["rate"],
+			}
 
 		matches.append(
 			{
@@ -1159,21 +1327,24 @@ def match_pr_items(ocr_import, purchase_receipt):
 				}
 			)
 
-	# Match OCR items to PR items by item_code (FIFO)
+	# Match OCR items to PR items by item_code (FIFO, bucketed as in match_po_items)
+	pr_items_by_code = defaultdict(deque)
+	for pr_item in pr_items_pool:
+		pr_items_by_code[pr_item["item_code"]].append(pr_item)
+
 	matches = []
 	for item in ocr_doc.items:
 		match = None
-		if item.item_code:
-			for pr_item in pr_items_pool:
-				if not pr_item["matched"] and pr_item["item_code"] == item.item_code:
-					pr_item["matched"] = True
-					match = {
-						"pr_detail": pr_item["name"],
-						"pr_item_code": pr_item["item_code"],
-						"pr_qty": pr_item["qty"],
-						"pr_rate": pr_item["rate"],
-					}
-					break
+		bucket = pr_items_by_code.get(item.item_code) if item.item_code else None
+		if bucket:
+			pr_item = bucket.popleft()
+			pr_item["matched"] = True
+			match = {
+				"pr_detail": pr_item["name"],
+				"pr_item_code": pr_item["item_code"],
+				"pr_qty": pr_item["qty"],
+				"pr_rate": pr_item["rate"],
+			}
 
 		matches.append(
 			{
@@ -107,11 +107,9 @@ def _populate_ocr_dn(ocr_dn, extracted_data: dict, settings):
 	ocr_dn.vehicle_number = header.get("vehicle_number", "")
 	ocr_dn.driver_name = header.get("driver_name", "")
 
-	try:
-		raw_confidence = float(header.get("confidence") or 0.0)
-	except (ValueError, TypeError):
-		raw_confidence = 0.0
-	ocr_dn.confidence = max(0.0, min(100.0, raw_confidence * 100))
+	from erpocr_integration.api import confidence_percent
+
+	ocr_dn.confidence = confidence_percent(header.get("confidence"))
 
 	ocr_dn.raw_payload = extracted_data.get("raw_response", "")
 
@@ -286,7 +284,7 @@ def retry_dn_extraction(ocr_dn: str):
 		frappe.throw(_("Original file not available. Cannot retry."))
 
 	# Determine MIME type from attached file
-	from erpocr_integration.api import SUPPORTED_FILE_TYPES
+	from erpocr_integration.api import mime_type_for_filename
 
 	attached_files = frappe.get_all(
 		"File",
@@ -299,8 +297,7 @@ def retry_dn_extraction(ocr_dn: str):
 		order_by="creation desc",
 	)
 	source_filename = attached_files[0].file_name if attached_files else ""
-	file_ext = "." + source_filename.rsplit(".", 1)[-1].lower() if "." in source_filename else ""
-	file_mime_type = SUPPORTED_FILE_TYPES.get(file_ext, "application/pdf")
+	file_mime_type = mime_type_for_filename(source_filename) or "application/pdf"
 
 	# Reset status and clear stale links from previous run
 	ocr_dn_doc.db_set(
@@ -10,6 +10,7 @@ from erpocr_integration.erpnext_ocr.doctype.ocr_import.ocr_import import (
 	REF_ITEM_FETCH_FIELDS,
 	_inherit_ref_fields,
 	_resolve_ocr_description,
+	_stock_item_codes,
 )
 
 
@@ -57,51 +58,91 @@ class OCRDeliveryNote(Document):
 			if self.supplier_match_status == "Confirmed":
 				self._save_supplier_alias()
 
-		for item in self.items:
-			if item.item_code and item.description_ocr and item.match_status == "Confirmed":
-				self._save_item_alias(item)
+		confirmed = [
+			item
+			for item in self.items
+			if item.item_code and item.description_ocr and item.match_status == "Confirmed"
+		]
+		if confirmed:
+			self._save_item_aliases(confirmed)
 
 	def _save_supplier_alias(self):
-		"""Save supplier alias for future auto-matching."""
+		"""Save supplier alias for future auto-matching.
+
+		The alias is named by ocr_text, so ignore_if_duplicate leaves an existing
+		alias untouched in one INSERT instead of an exists() check first (and a
+		concurrent confirm of the same text can't fail this save).
+		"""
 		ocr_text = self.supplier_name_ocr.strip()
 		if not ocr_text:
 			return
-		if not frappe.db.exists("OCR Supplier Alias", ocr_text):
-			frappe.get_doc(
-				{
-					"doctype": "OCR Supplier Alias",
-					"ocr_text": ocr_text,
-					"supplier": self.supplier,
-					"source": "Auto",
-				}
-			).insert(ignore_permissions=True)
+		frappe.get_doc(
+			{
+				"doctype": "OCR Supplier Alias",
+				"ocr_text": ocr_text,
+				"supplier": self.supplier,
+				"source": "Auto",
+			}
+		).insert(ignore_permissions=True, ignore_if_duplicate=True)
 
-	def _save_item_alias(self, item):
-		"""Save item alias for future auto-matching.
+	def _save_item_aliases(self, items):
+		"""Save item aliases for future auto-matching.
 
 		v1.8.0 (Q7c): OCR Item Alias is hash-named now, so existence MUST be
 		checked by ocr_text + supplier filters, never by document name (the
 		old name-based exists() would always miss post-v1.8.0 rows and insert
 		unbounded duplicates on every DN re-save). Supplier-scoped when the
 		DN's supplier is known — same learning semantics as the invoice side.
+		One query finds the texts already aliased; only the rest are inserted.
 		"""
-		ocr_text = item.description_ocr.strip()
-		if not ocr_text:
-			return
-
 		supplier = (self.supplier or "").strip()
-		filters = {"ocr_text": ocr_text, "supplier": supplier or ["is", "not set"]}
-		if frappe.get_all("OCR Item Alias", filters=filters, limit_page_length=1, ignore_permissions=True):
+		pending = {}
+		for item in items:
+			ocr_text = item.description_ocr.strip()
+			if ocr_text:
+				pending.setdefault(ocr_text.lower(), (ocr_text, item.item_code))
+		if not pending:
 			return
-		frappe.get_doc(
-			{
-				"doctype": "OCR Item Alias",
-				"ocr_text": ocr_text,
-				"supplier": supplier,
-				"item_code": item.item_code,
-				"source": "Auto",
-			}
-		).insert(ignore_permissions=True)
+
+		# ocr_text compares case-insensitively in the database, hence lower()
+		existing = frappe.get_all(
+			"OCR Item Alias",
+			filters={
+				"ocr_text": ["in", sorted(text for text, _item_code in pending.values())],
+				"supplier": supplier or ["is", "not set"],
+			},
+			pluck="ocr_text",
+			ignore_permissions=True,
+		)
+		for text in existing:
+			pending.pop(text.lower(), None)
+
+		for ocr_text, item_code in pending.values():
+			frappe.get_doc(
+				{
+					"doctype": "OCR Item Alias",
+					"ocr_text": ocr_text,
+					"supplier": supplier,
+					"item_code": item_code,
+					"source": "Auto",
+				}
+			).insert(ignore_permissions=True)
+
+	def _lock_for_create(self):
+		"""Row-lock this delivery note and refuse if a document was already created.
+
+		Cheap precondition checks run before this so a request that would fail
+		anyway never takes the lock.
+		"""
+		current = frappe.db.get_value(
+			"OCR Delivery Note",
+			self.name,
+			["purchase_order_result", "purchase_receipt"],
+			as_dict=True,
+			for_update=True,
+		)
+		if current.purchase_order_result or current.purchase_receipt:
+			frappe.throw(_("A document has already been created for this delivery note."))
 
 	# Stale field clearing: when supplier changes, clear PO and item-level refs
 	# (handled client-side in ocr_delivery_note.js — same pattern as OCR Import)
@@ -123,22 +164,14 @@ class OCRDeliveryNote(Document):
 		if self.document_type != "Purchase Order":
 			frappe.throw(_("Document Type must be 'Purchase Order' to create a Purchase Order."))
 
-		# Row-lock to prevent duplicate creation
-		current = frappe.db.get_value(
-			"OCR Delivery Note",
-			self.name,
-			["purchase_order_result", "purchase_receipt"],
-			as_dict=True,
-			for_update=True,
-		)
-		if current.purchase_order_result or current.purchase_receipt:
-			frappe.throw(_("A document has already been created for this delivery note."))
-
 		if not self.supplier:
 			frappe.throw(_("Please select a Supplier before creating a Purchase Order."))
 
+		self._lock_for_create()
+
 		settings = frappe.get_cached_doc("OCR Settings")
 		schedule_date = self.delivery_date or frappe.utils.today()
+		warehouse = settings.get("dn_default_warehouse") or settings.get("default_warehouse")
 
 		po_items = []
 		skipped_unmatched = 0
@@ -155,7 +188,6 @@ class OCRDeliveryNote(Document):
 				"description": item.description_ocr or item.item_name or "OCR Scanned Item",
 			}
 
-			warehouse = settings.get("dn_default_warehouse") or settings.get("default_warehouse")
 			if warehouse:
 				po_item["warehouse"] = warehouse
 
@@ -190,9 +222,7 @@ class OCRDeliveryNote(Document):
 		self._copy_scan_to_document("Purchase Order", po.name)
 
 		# Link PO back to this delivery note
-		self.purchase_order_result = po.name
-		self.status = "Draft Created"
-		self.save()
+		self.db_set({"purchase_order_result": po.name, "status": "Draft Created"})
 
 		msg = _("Purchase Order {0} created as draft (rates need to be filled in).").format(
 			frappe.utils.get_link_to_form("Purchase Order", po.name)
@@ -220,20 +250,11 @@ class OCRDeliveryNote(Document):
 		if self.document_type != "Purchase Receipt":
 			frappe.throw(_("Document Type must be 'Purchase Receipt' to create a Purchase Receipt."))
 
-		# Row-lock to prevent duplicate creation
-		current = frappe.db.get_value(
-			"OCR Delivery Note",
-			self.name,
-			["purchase_order_result", "purchase_receipt"],
-			as_dict=True,
-			for_update=True,
-		)
-		if current.purchase_order_result or current.purchase_receipt:
-			frappe.throw(_("A document has already been created for this delivery note."))
-
 		if not self.supplier:
 			frappe.throw(_("Please select a Supplier before creating a Purchase Receipt."))
 
+		self._lock_for_create()
+
 		settings = frappe.get_cached_doc("OCR Settings")
 
 		# Build PO item lookup for auto-matching when item-level refs are missing
@@ -251,6 +272,8 @@ class OCRDeliveryNote(Document):
 		pr_items = []
 		skipped_unmatched = 0
 		non_stock_warnings = []
+		stock_items = _stock_item_codes(item.item_code for item in self.items)
+		warehouse = settings.get("dn_default_warehouse") or settings.get("default_warehouse")
 		for item in self.items:
 			if not item.item_code:
 				skipped_unmatched += 1
@@ -291,11 +314,9 @@ class OCRDeliveryNote(Document):
 				"description": item.description_ocr or item.item_name or "OCR Scanned Item",
 			}
 
-			is_stock = frappe.db.get_value("Item", item.item_code, "is_stock_item")
-			if not is_stock:
+			if item.item_code not in stock_items:
 				non_stock_warnings.append(item.item_code)
 
-			warehouse = settings.get("dn_default_warehouse") or settings.get("default_warehouse")
 			if warehouse:
 				pr_item["warehouse"] = warehouse
 
@@ -335,9 +356,7 @@ class OCRDeliveryNote(Document):
 		self._copy_scan_to_document("Purchase Receipt", pr.name)
 
 		# Link PR back to this delivery note
-		self.purchase_receipt = pr.name
-		self.status = "Draft Created"
-		self.save()
+		self.db_set({"purchase_receipt": pr.name, "status": "Draft Created"})
 
 		msg = _("Purchase Receipt {0} created as draft.").format(
 			frappe.utils.get_link_to_form("Purchase Receipt", pr.name)
@@ -261,9 +261,7 @@ class OCRFleetSlip(Document):
 		self._copy_scan_to_document("Purchase Invoice", pi.name)
 
 		# Link back
-		self.purchase_invoice = pi.name
-		self.status = "Draft Created"
-		self.save()
+		self.db_set({"purchase_invoice": pi.name, "status": "Draft Created"})
 
 		frappe.msgprint(
 			_("Purchase Invoice {0} created as draft.").format(
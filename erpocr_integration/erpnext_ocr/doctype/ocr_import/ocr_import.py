@@ -6,7 +6,7 @@ import re
 import frappe
 from frappe import _
 from frappe.model.document import Document
-from frappe.utils import flt
+from frappe.utils import escape_html, flt, get_link_to_form, getdate, today
 
 # Month names used by _extract_service_pattern to strip variable date parts
 _MONTH_NAMES = frozenset(
@@ -43,6 +43,30 @@ _STOP_WORDS = frozenset(
 	{"for", "of", "on", "in", "at", "to", "the", "a", "an", "and", "or", "is", "by", "from", "with"}
 )
 
+# Statuses _update_status must never overwrite
+_SETTLED_STATUSES = frozenset({"Completed", "Draft Created", "No Action", "Error"})
+
+# Statuses _update_status itself derives from the match state
+_DERIVED_STATUSES = frozenset({"Matched", "Needs Review"})
+
+# Last-resort PI/PR row description when neither OCR text nor item name is set
+_DEFAULT_ITEM_DESCRIPTION = "OCR Imported Item"
+
+# Purchase Taxes and Charges columns copied from the template onto a PI/PR
+_TAX_ROW_FIELDS = (
+	"category",
+	"add_deduct_tax",
+	"charge_type",
+	"row_id",
+	"account_head",
+	"description",
+	"rate",
+	"cost_center",
+	"account_currency",
+	"included_in_print_rate",
+	"included_in_paid_amount",
+)
+
 
 def _resolve_ocr_description(ocr_item) -> str:
 	"""Pick the description to restore onto a created PI/PR row.
@@ -176,6 +200,82 @@ def _inherit_ref_fields(target: dict, ref) -> None:
 		target["project"] = project
 
 
+def _stock_item_codes(item_codes) -> set:
+	"""The subset of `item_codes` that are stock items, in one query.
+
+	Replaces a per-row `db.get_value("Item", code, "is_stock_item")`. A code
+	missing from the Item master counts as non-stock, as that lookup's None did.
+	"""
+	codes = sorted({code for code in item_codes if code})
+	if not codes:
+		return set()
+	return set(
+		frappe.get_all(
+			"Item",
+			filters={"name": ["in", codes], "is_stock_item": 1},
+			pluck="name",
+		)
+	)
+
+
+def _account_details(accounts) -> dict:
+	"""Account name -> company/is_group/disabled/account_type, in one query.
+
+	An account missing from the map does not exist.
+	"""
+	names = sorted({account for account in accounts if account})
+	if not names:
+		return {}
+	rows = frappe.get_all(
+		"Account",
+		filters={"name": ["in", names]},
+		fields=["name", "company", "is_group", "disabled", "account_type"],
+	)
+	return {row.name: row for row in rows}
+
+
+def _account_company(account):
+	"""Company of `account`, memoised for the rest of the request.
+
+	Learning and mapping validation hit the same few expense accounts once per
+	row; frappe.local_cache is cleared with frappe.local at the end of the request.
+	"""
+	return frappe.local_cache(
+		"erpocr_account_company",
+		account,
+		lambda: frappe.db.get_value("Account", account, "company"),
+	)
+
+
+def _drive_link_comment(drive_link, drive_folder_path) -> str:
+	"""Comment HTML pointing a created PI/PR/JE at the archived invoice PDF.
+
+	Empty unless the Drive link is https — anything else is never rendered
+	as a link. Both values are escaped.
+	"""
+	if not (drive_link and drive_link.startswith("https://")):
+		return ""
+	safe_link = escape_html(drive_link)
+	safe_path = escape_html(drive_folder_path or "N/A")
+	return (
+		f"<b>Original Invoice PDF:</b> <a href='{safe_link}' target='_blank' rel='noopener noreferrer'>View in Google Drive</a><br>"
+		f"<small>Archive path: {safe_path}</small>"
+	)
+
+
+def _status_inputs(doc) -> tuple:
+	"""Every field of an OCR Import that _update_status reads."""
+	return (
+		doc.status,
+		doc.supplier,
+		doc.supplier_name_ocr,
+		doc.purchase_invoice,
+		doc.purchase_receipt,
+		doc.journal_entry,
+		tuple((item.item_code, item.match_status, item.expense_account) for item in doc.items),
+	)
+
+
 def _detect_tax_inclusive_rates(ocr_import) -> bool:
 	"""Detect whether OCR-extracted item rates already include tax.
 
@@ -249,28 +349,13 @@ def _build_taxes_from_template(
 			)
 		)
 
-	taxes = [
-		{
-			"category": tax_row.category,
-			"add_deduct_tax": tax_row.add_deduct_tax,
-			"charge_type": tax_row.charge_type,
-			"row_id": tax_row.row_id,
-			"account_head": tax_row.account_head,
-			"description": tax_row.description,
-			"rate": tax_row.rate,
-			"cost_center": tax_row.cost_center,
-			"account_currency": tax_row.account_currency,
+	taxes = [{field: getattr(tax_row, field) for field in _TAX_ROW_FIELDS} for tax_row in template.taxes]
+	if rates_include_tax:
+		for row in taxes:
 			# Never force included_in_print_rate onto an Actual row — ERPNext's
 			# validate_inclusive_tax rejects Actual + inclusive at insert time.
-			"included_in_print_rate": (
-				1
-				if (rates_include_tax and tax_row.charge_type != "Actual")
-				else tax_row.included_in_print_rate
-			),
-			"included_in_paid_amount": tax_row.included_in_paid_amount,
-		}
-		for tax_row in template.taxes
-	]
+			if row["charge_type"] != "Actual":
+				row["included_in_print_rate"] = 1
 
 	# Actual-charge templates (customs/import VAT — e.g. "9 - Import with Std VAT")
 	# carry no percentage; the tax IS the extracted amount. Inject it into the
@@ -308,7 +393,7 @@ class OCRImport(Document):
 	def _update_status(self):
 		"""Auto-update status based on match states."""
 		# Don't change status if already completed, draft created, no action, or in error
-		if self.status in ("Completed", "Draft Created", "No Action", "Error"):
+		if self.status in _SETTLED_STATUSES:
 			return
 
 		# If PI, PR, or JE already created, mark as Draft Created
@@ -316,33 +401,43 @@ class OCRImport(Document):
 			self.status = "Draft Created"
 			return
 
+		# No rows (e.g. the first insert before extraction lands): Matched is
+		# impossible, so skip the row checks and the before-save comparison.
+		items = self.items
+		if not items:
+			if self.supplier_name_ocr:
+				self.status = "Needs Review"
+			return
+
+		# A save that touched none of the inputs (cost center, PO link, notes...)
+		# keeps the status this method derived last time. Anything else — e.g.
+		# the "Pending" Unlink & Reset writes before re-saving — is recomputed.
+		if self.status in _DERIVED_STATUSES:
+			try:
+				doc_before = self.get_doc_before_save()
+				if doc_before and _status_inputs(doc_before) == _status_inputs(self):
+					return
+			except Exception:
+				pass
+
 		# Check supplier match — if user has set the Supplier link, treat as matched
 		# regardless of match_status (user may have selected supplier manually)
 		supplier_matched = bool(self.supplier)
 
 		# Check item matches
-		all_items_matched = True
-		all_items_ready = True  # Ready includes having expense_account for service items
+		all_items_matched = all(item.item_code or item.match_status != "Unmatched" for item in items)
 
-		for item in self.items:
-			# Check if item is matched
-			if item.match_status == "Unmatched" and not item.item_code:
-				all_items_matched = False
-				all_items_ready = False
-				break
-
-			# For matched items, check if service items have expense_account
-			# (Items without expense_account are assumed to be stock items that get GL from item master)
-			if item.item_code and not item.expense_account:
-				# Check if this is a non-stock item that requires expense_account
-				is_stock = frappe.db.get_value("Item", item.item_code, "is_stock_item")
-				if not is_stock:
-					# Non-stock item without expense_account → needs review
-					all_items_ready = False
-
-		if supplier_matched and all_items_matched and all_items_ready and self.items:
+		# Ready also needs an expense_account on every non-stock row (stock items
+		# get their GL from the item master). Only worth the Item query when
+		# nothing else already keeps the doc in review.
+		all_items_ready = all_items_matched
+		if supplier_matched and all_items_matched:
+			needs_check = {item.item_code for item in items if item.item_code and not item.expense_account}
+			all_items_ready = needs_check <= _stock_item_codes(needs_check)
+
+		if supplier_matched and all_items_matched and all_items_ready:
 			self.status = "Matched"
-		elif self.supplier_name_ocr or self.items:
+		else:
 			# Data was extracted but not fully matched/ready — needs user review
 			self.status = "Needs Review"
 
@@ -352,6 +447,16 @@ class OCRImport(Document):
 			if self.supplier_match_status == "Confirmed":
 				self._save_supplier_alias()
 
+		# Nothing confirmed means nothing to learn — skip the settings read and
+		# the before-save snapshot entirely.
+		learn_rows = [
+			item
+			for item in self.items
+			if item.item_code and item.description_ocr and item.match_status == "Confirmed"
+		]
+		if not learn_rows:
+			return
+
 		default_item = (frappe.get_cached_doc("OCR Settings").get("default_item") or "").strip()
 
 		# Which item rows actually changed in THIS save? Confirmed persists on a
@@ -369,32 +474,45 @@ class OCRImport(Document):
 		except Exception:
 			prev_rows = {}
 
-		for item in self.items:
-			if item.item_code and item.description_ocr and item.match_status == "Confirmed":
-				row_changed = not prev_rows or prev_rows.get(item.name) != (
-					item.item_code or "",
-					item.match_status or "",
-				)
-				if item.item_code == default_item:
-					# Catch-all item: a description→item alias is useless (the item is
-					# always the default) and Item-Supplier learning would point a product
-					# code at the catch-all. But the GL coding IS worth learning — save the
-					# (supplier, pattern) → expense-account service mapping so the line
-					# auto-codes (and so auto-draft can fire) next time. Skip only the
-					# alias + Item-Supplier learning.
-					if item.expense_account:
-						self._save_service_mapping(item)
-					continue
-
-				self._save_item_alias(item, allow_update=row_changed)
+		# Existing aliases / service mappings for every confirmed row, fetched in
+		# one query each instead of one lookup per row
+		known_aliases = self._load_item_aliases(
+			[item.description_ocr for item in learn_rows if item.item_code != default_item]
+		)
+		known_mappings = self._load_service_mappings(
+			[item.description_ocr for item in learn_rows if item.expense_account]
+		)
 
-				# Only save service mapping alongside explicit item confirmation
+		new_aliases = []
+		for item in learn_rows:
+			row_changed = not prev_rows or prev_rows.get(item.name) != (
+				item.item_code or "",
+				item.match_status or "",
+			)
+			if item.item_code == default_item:
+				# Catch-all item: a description→item alias is useless (the item is
+				# always the default) and Item-Supplier learning would point a product
+				# code at the catch-all. But the GL coding IS worth learning — save the
+				# (supplier, pattern) → expense-account service mapping so the line
+				# auto-codes (and so auto-draft can fire) next time. Skip only the
+				# alias + Item-Supplier learning.
 				if item.expense_account:
-					self._save_service_mapping(item)
+					self._save_service_mapping(item, known_mappings=known_mappings)
+				continue
 
-				# Enqueue Item Supplier learning (tier 2 input for future invoices)
-				if self.supplier and item.product_code:
-					self._enqueue_item_supplier_learning(item)
+			self._save_item_alias(
+				item, allow_update=row_changed, known_aliases=known_aliases, new_aliases=new_aliases
+			)
+
+			# Only save service mapping alongside explicit item confirmation
+			if item.expense_account:
+				self._save_service_mapping(item, known_mappings=known_mappings)
+
+			# Enqueue Item Supplier learning (tier 2 input for future invoices)
+			if self.supplier and item.product_code:
+				self._enqueue_item_supplier_learning(item)
+
+		self._insert_item_aliases(new_aliases)
 
 	def _enqueue_item_supplier_learning(self, item):
 		"""Enqueue a background job to write the (supplier, product_code) → item_code
@@ -458,6 +576,8 @@ class OCRImport(Document):
 		# so a row never carries NULL) and "changed?".
 		existing_supplier = frappe.db.get_value("OCR Supplier Alias", ocr_text, "supplier")
 		if existing_supplier is None:
+			# Named by ocr_text: a concurrent confirm that inserted the same text
+			# after our read must not fail this save — first writer wins.
 			frappe.get_doc(
 				{
 					"doctype": "OCR Supplier Alias",
@@ -465,11 +585,108 @@ class OCRImport(Document):
 					"supplier": self.supplier,
 					"source": "Auto",
 				}
-			).insert(ignore_permissions=True)
+			).insert(ignore_permissions=True, ignore_if_duplicate=True)
 		elif existing_supplier != self.supplier:
 			frappe.db.set_value("OCR Supplier Alias", ocr_text, {"supplier": self.supplier, "source": "Auto"})
 
-	def _save_item_alias(self, item, allow_update=True):
+	def _alias_supplier_filter(self):
+		"""(supplier, filter value) the item-alias lookups are scoped to — see _save_item_alias."""
+		supplier = (self.supplier or "").strip()
+		return supplier, (supplier or ["is", "not set"])
+
+	def _load_item_aliases(self, descriptions):
+		"""Existing item aliases for `descriptions` in this record's supplier scope.
+
+		Returns {ocr_text.lower(): {"name", "item_code"}} holding the most recently
+		modified row per text — the same row _save_item_alias's single lookup would
+		return. Keys are lower-cased because ocr_text compares case-insensitively
+		in the database.
+		"""
+		texts = sorted({d.strip() for d in descriptions if d and d.strip()})
+		if not texts:
+			return {}
+
+		_supplier, supplier_filter = self._alias_supplier_filter()
+		rows = frappe.get_all(
+			"OCR Item Alias",
+			filters={"ocr_text": ["in", texts], "supplier": supplier_filter},
+			fields=["name", "ocr_text", "item_code"],
+			order_by="modified desc, name asc",
+			ignore_permissions=True,
+		)
+		known = {}
+		for row in rows:
+			known.setdefault(row.ocr_text.lower(), {"name": row.name, "item_code": row.item_code})
+		return known
+
+	def _insert_item_aliases(self, new_aliases):
+		"""Write the aliases on_update queued in one multi-row INSERT.
+
+		OCR Item Alias is hash-named with a pass-only controller, so a
+		per-row Document.insert buys nothing but N INSERTs. bulk_insert skips
+		Link validation, so rows whose item_code or supplier no longer exists
+		are dropped here with one lookup per Link doctype — the check
+		Document.insert would have made row by row.
+		"""
+		if not new_aliases:
+			return
+
+		item_codes = {row["item_code"] for row in new_aliases}
+		suppliers = {row["supplier"] for row in new_aliases if row["supplier"]}
+		existing_items = set(
+			frappe.get_all("Item", filters={"name": ["in", sorted(item_codes)]}, pluck="name")
+		)
+		existing_suppliers = (
+			set(frappe.get_all("Supplier", filters={"name": ["in", sorted(suppliers)]}, pluck="name"))
+			if suppliers
+			else set()
+		)
+		new_aliases = [
+			row
+			for row in new_aliases
+			if row["item_code"] in existing_items
+			and (not row["supplier"] or row["supplier"] in existing_suppliers)
+		]
+		if not new_aliases:
+			return
+
+		now = frappe.utils.now()
+		user = frappe.session.user
+		frappe.db.bulk_insert(
+			"OCR Item Alias",
+			fields=[
+				"name",
+				"creation",
+				"modified",
+				"owner",
+				"modified_by",
+				"ocr_text",
+				"supplier",
+				"item_code",
+				"source",
+			],
+			values=[
+				(
+					frappe.generate_hash(length=10),
+					now,
+					now,
+					user,
+					user,
+					row["ocr_text"],
+					row["supplier"],
+					row["item_code"],
+					"Auto",
+				)
+				for row in new_aliases
+			],
+		)
+
+		# bulk_insert skips doc_events, so drop the fuzzy pools on_update would have
+		from erpocr_integration.tasks.matching import clear_fuzzy_cache
+
+		clear_fuzzy_cache()
+
+	def _save_item_alias(self, item, allow_update=True, known_aliases=None, new_aliases=None):
 		"""Save (or correct) the item alias for future auto-matching.
 
 		Upserts for the same reason as _save_supplier_alias — a user correcting
@@ -485,45 +702,94 @@ class OCRImport(Document):
 		the mapping supplier B relies on. Global rows (all pre-v1.8.0 aliases,
 		plus confirms without a supplier) are never rewritten by a
 		supplier-scoped confirm — they stay the fallback tier.
+
+		`known_aliases` is on_update's prefetch from _load_item_aliases; it is
+		kept current as rows are inserted/corrected so a repeated description
+		later in the same save sees the earlier write. With `new_aliases`, a
+		missing alias is queued there for _insert_item_aliases instead of being
+		inserted on the spot.
 		"""
 		ocr_text = item.description_ocr.strip()
 		if not ocr_text:
 			return
 
-		supplier = (self.supplier or "").strip()
-		if supplier:
-			filters = {"ocr_text": ocr_text, "supplier": supplier}
+		supplier, supplier_filter = self._alias_supplier_filter()
+
+		if known_aliases is not None:
+			existing = known_aliases.get(ocr_text.lower())
 		else:
-			filters = {"ocr_text": ocr_text, "supplier": ["is", "not set"]}
+			# order_by is load-bearing (R8): duplicates are possible now that the
+			# ocr_text unique index is gone. Corrections must target the SAME row
+			# match_item's read returns (most recently modified), or a correction
+			# could land on a row the matcher never surfaces.
+			rows = frappe.get_all(
+				"OCR Item Alias",
+				filters={"ocr_text": ocr_text, "supplier": supplier_filter},
+				fields=["name", "item_code"],
+				order_by="modified desc, name asc",
+				limit_page_length=1,
+				ignore_permissions=True,
+			)
+			existing = {"name": rows[0].name, "item_code": rows[0].item_code} if rows else None
 
-		# order_by is load-bearing (R8): duplicates are possible now that the
-		# ocr_text unique index is gone. Corrections must target the SAME row
-		# match_item's read returns (most recently modified), or a correction
-		# could land on a row the matcher never surfaces.
-		existing = frappe.get_all(
-			"OCR Item Alias",
-			filters=filters,
-			fields=["name", "item_code"],
-			order_by="modified desc, name asc",
-			limit_page_length=1,
-			ignore_permissions=True,
-		)
 		if not existing:
-			frappe.get_doc(
-				{
-					"doctype": "OCR Item Alias",
+			if new_aliases is not None:
+				# Queued: "name" stays None until _insert_item_aliases writes it
+				existing = {
+					"name": None,
 					"ocr_text": ocr_text,
 					"supplier": supplier,
 					"item_code": item.item_code,
-					"source": "Auto",
 				}
-			).insert(ignore_permissions=True)
-		elif allow_update and existing[0].item_code != item.item_code:
-			frappe.db.set_value(
-				"OCR Item Alias", existing[0].name, {"item_code": item.item_code, "source": "Auto"}
-			)
+				new_aliases.append(existing)
+			else:
+				alias = frappe.get_doc(
+					{
+						"doctype": "OCR Item Alias",
+						"ocr_text": ocr_text,
+						"supplier": supplier,
+						"item_code": item.item_code,
+						"source": "Auto",
+					}
+				).insert(ignore_permissions=True)
+				existing = {"name": alias.name, "item_code": item.item_code}
+			if known_aliases is not None:
+				known_aliases[ocr_text.lower()] = existing
+		elif allow_update and existing["item_code"] != item.item_code:
+			if existing["name"]:
+				frappe.db.set_value(
+					"OCR Item Alias", existing["name"], {"item_code": item.item_code, "source": "Auto"}
+				)
+			existing["item_code"] = item.item_code
 
-	def _save_service_mapping(self, item):
+	def _service_mapping_scope(self):
+		"""(company, supplier) a learned service mapping is keyed on."""
+		return self.get("company") or frappe.defaults.get_user_default("Company"), self.supplier
+
+	def _load_service_mappings(self, descriptions):
+		"""Existing service mappings for the patterns of `descriptions` in this
+		record's company/supplier scope, as {pattern.lower(): name}."""
+		patterns = sorted({_extract_service_pattern(d.strip()) for d in descriptions if d and d.strip()})
+		if not patterns:
+			return {}
+
+		company, supplier = self._service_mapping_scope()
+		rows = frappe.get_all(
+			"OCR Service Mapping",
+			filters={
+				"description_pattern": ["in", patterns],
+				"company": company,
+				"supplier": supplier or "",  # Empty string for NULL check
+			},
+			fields=["name", "description_pattern"],
+			ignore_permissions=True,
+		)
+		known = {}
+		for row in rows:
+			known.setdefault(row.description_pattern.lower(), row.name)
+		return known
+
+	def _save_service_mapping(self, item, known_mappings=None):
 		"""
 		Save service mapping for future auto-matching.
 
@@ -534,6 +800,7 @@ class OCRImport(Document):
 		- Supplier (optional, for supplier-specific mappings)
 
 		Create a mapping so future invoices with similar descriptions auto-fill these fields.
+		`known_mappings` is on_update's prefetch from _load_service_mappings.
 		"""
 		description = item.description_ocr.strip()
 		if not description or not item.item_code or not item.expense_account:
@@ -542,33 +809,47 @@ class OCRImport(Document):
 		# Extract a reusable pattern (strips dates, months, years)
 		pattern = _extract_service_pattern(description)
 
-		company = self.get("company") or frappe.defaults.get_user_default("Company")
-		supplier = self.supplier  # Link to supplier for supplier-specific mappings
+		# Supplier links the mapping for supplier-specific matching
+		company, supplier = self._service_mapping_scope()
 
 		# Check if a mapping already exists for this pattern + company + supplier
-		existing = frappe.db.get_value(
-			"OCR Service Mapping",
-			{
-				"description_pattern": pattern,
-				"company": company,
-				"supplier": supplier or "",  # Empty string for NULL check
-			},
-			"name",
-		)
+		if known_mappings is not None:
+			existing = known_mappings.get(pattern.lower())
+		else:
+			existing = frappe.db.get_value(
+				"OCR Service Mapping",
+				{
+					"description_pattern": pattern,
+					"company": company,
+					"supplier": supplier or "",  # Empty string for NULL check
+				},
+				"name",
+			)
 
 		if existing:
-			# Update existing mapping
-			doc = frappe.get_doc("OCR Service Mapping", existing)
-			doc.item_code = item.item_code
-			doc.item_name = item.item_name
-			doc.expense_account = item.expense_account
-			doc.cost_center = item.cost_center
-			doc.supplier = supplier
-			doc.source = "Auto"
-			doc.save(ignore_permissions=True)
+			# Update existing mapping in place. Pattern and company are the lookup
+			# key, so of OCRServiceMapping.validate only the account check applies.
+			if _account_company(item.expense_account) != company:
+				frappe.throw(
+					_("Expense Account {0} does not belong to company {1}").format(
+						item.expense_account, company
+					)
+				)
+			frappe.db.set_value(
+				"OCR Service Mapping",
+				existing,
+				{
+					"item_code": item.item_code,
+					"item_name": item.item_name,
+					"expense_account": item.expense_account,
+					"cost_center": item.cost_center,
+					"supplier": supplier,
+					"source": "Auto",
+				},
+			)
 		else:
 			# Create new mapping
-			frappe.get_doc(
+			mapping = frappe.get_doc(
 				{
 					"doctype": "OCR Service Mapping",
 					"description_pattern": pattern,
@@ -581,6 +862,25 @@ class OCRImport(Document):
 					"source": "Auto",
 				}
 			).insert(ignore_permissions=True)
+			if known_mappings is not None:
+				known_mappings[pattern.lower()] = mapping.name
+
+	def _apply_tax_template(self, target: dict):
+		"""Set taxes_and_charges + taxes on a PI/PR dict from this import's tax template.
+
+		The template is user-editable and auto-set during extraction. Q9: the
+		inclusive-rate detector reads the full doc (items/subtotal/total), so it is
+		computed here on the invoice side and passed in explicitly — and only when
+		there is a template to apply it to.
+		"""
+		if not self.tax_template:
+			return
+		tax_template, taxes = _build_taxes_from_template(
+			self.tax_template, self.company, self.tax_amount, _detect_tax_inclusive_rates(self)
+		)
+		if tax_template:
+			target["taxes_and_charges"] = tax_template
+			target["taxes"] = taxes
 
 	@frappe.whitelist(methods=["POST"])
 	def create_purchase_invoice(self):
@@ -604,36 +904,37 @@ class OCRImport(Document):
 		if self.document_type != "Purchase Invoice":
 			frappe.throw(_("Document Type must be 'Purchase Invoice' to create a Purchase Invoice."))
 
-		# Row-lock to prevent duplicate creation from concurrent calls
-		current = frappe.db.get_value(
-			"OCR Import",
-			self.name,
-			["purchase_invoice", "purchase_receipt", "journal_entry"],
-			as_dict=True,
-			for_update=True,
-		)
-		if current.purchase_invoice or current.purchase_receipt or current.journal_entry:
-			frappe.throw(_("A document has already been created for this import."))
-
 		if not self.supplier:
 			frappe.throw(_("Please select a Supplier before creating a Purchase Invoice."))
 
+		self._lock_for_create()
+
 		settings = frappe.get_cached_doc("OCR Settings")
 
 		# Validate PO/PR linkage integrity before building items
 		if self.purchase_receipt_link and not self.purchase_order:
 			frappe.throw(_("Cannot link Purchase Receipt without a Purchase Order. Select a PO first."))
+		# The PR's rows against this PO both prove the PR/PO link and seed the
+		# FIFO auto-match below — one query instead of an exists() probe first
+		pr_items_by_code = {}
 		if self.purchase_receipt_link and self.purchase_order:
-			pr_has_po_link = frappe.db.exists(
+			pr_items = frappe.get_all(
 				"Purchase Receipt Item",
-				{"parent": self.purchase_receipt_link, "purchase_order": self.purchase_order},
+				filters={
+					"parent": self.purchase_receipt_link,
+					"purchase_order": self.purchase_order,
+				},
+				fields=["name", "item_code", "uom", "conversion_factor", "project"],
+				order_by="idx",
 			)
-			if not pr_has_po_link:
+			if not pr_items:
 				frappe.throw(
 					_("Purchase Receipt '{0}' is not linked to Purchase Order '{1}'.").format(
 						self.purchase_receipt_link, self.purchase_order
 					)
 				)
+			for pr_item in pr_items:
+				pr_items_by_code.setdefault(pr_item.item_code, []).append(pr_item)
 
 		# Build PO/PR item lookup maps for auto-matching when item-level refs are missing
 		# (user selected PO/PR at header but didn't run "Match PO Items" dialog)
@@ -647,54 +948,44 @@ class OCRImport(Document):
 			):
 				po_items_by_code.setdefault(po_item.item_code, []).append(po_item)
 
-		pr_items_by_code = {}
-		if self.purchase_receipt_link and self.purchase_order:
-			for pr_item in frappe.get_all(
-				"Purchase Receipt Item",
-				filters={
-					"parent": self.purchase_receipt_link,
-					"purchase_order": self.purchase_order,
-				},
-				fields=["name", "item_code", "uom", "conversion_factor", "project"],
-				order_by="idx",
-			):
-				pr_items_by_code.setdefault(pr_item.item_code, []).append(pr_item)
+		# Loop-invariant defaults, resolved once instead of per row.
+		# Cost Center precedence: line override → doc-level parent → OCR Settings default
+		default_item = settings.default_item
+		default_expense_account = settings.default_expense_account
+		default_cost_center = self.cost_center or settings.default_cost_center
+		default_warehouse = settings.default_warehouse
 
 		pi_items = []
 		for item in self.items:
 			pi_item = {
 				"qty": item.qty or 1,
 				"rate": item.rate or 0,
-				"description": item.description_ocr or item.item_name or "OCR Imported Item",
+				"description": item.description_ocr or item.item_name or _DEFAULT_ITEM_DESCRIPTION,
 			}
 
 			if item.item_code:
 				pi_item["item_code"] = item.item_code
-			elif settings.default_item:
+			elif default_item:
 				# Use configured default item, keep OCR description
-				pi_item["item_code"] = settings.default_item
+				pi_item["item_code"] = default_item
 			else:
 				# No matched item and no default — use description only
-				fallback_name = item.item_name or item.description_ocr or "OCR Imported Item"
+				fallback_name = item.item_name or item.description_ocr or _DEFAULT_ITEM_DESCRIPTION
 				pi_item["item_name"] = fallback_name[:140]
 
 			# Row-level accounting fields (from service mapping) take precedence over defaults
 			if item.expense_account:
 				pi_item["expense_account"] = item.expense_account
-			elif settings.default_expense_account and not item.item_code:
+			elif default_expense_account and not item.item_code:
 				# Only use default expense account if no item_code (items have their own defaults)
-				pi_item["expense_account"] = settings.default_expense_account
+				pi_item["expense_account"] = default_expense_account
 
-			# Cost Center precedence: line override → doc-level parent → OCR Settings default
-			if item.cost_center:
-				pi_item["cost_center"] = item.cost_center
-			elif self.cost_center:
-				pi_item["cost_center"] = self.cost_center
-			elif settings.default_cost_center:
-				pi_item["cost_center"] = settings.default_cost_center
+			cost_center = item.cost_center or default_cost_center
+			if cost_center:
+				pi_item["cost_center"] = cost_center
 
-			if settings.default_warehouse:
-				pi_item["warehouse"] = settings.default_warehouse
+			if default_warehouse:
+				pi_item["warehouse"] = default_warehouse
 
 			# PO refs (links PI item back to PO item — marks PO as billed).
 			# Use saved item-level ref, or auto-match by item_code (FIFO) as fallback.
@@ -772,7 +1063,7 @@ class OCRImport(Document):
 			"company": self.company,
 			"currency": self.currency or frappe.get_cached_value("Company", self.company, "default_currency"),
 			"set_posting_time": 1,
-			"posting_date": self.invoice_date or frappe.utils.today(),
+			"posting_date": self.invoice_date or today(),
 			"bill_no": self.invoice_number,
 			"bill_date": self.invoice_date,
 			"items": pi_items,
@@ -800,19 +1091,11 @@ class OCRImport(Document):
 			pi_dict["custom_ocr_import"] = self.name
 
 		# Only set due_date if it's on or after the posting_date
-		posting_date = pi_dict["posting_date"]
-		if self.due_date and str(self.due_date) >= str(posting_date):
+		# (compared as dates: either side may be a date object or an ISO string)
+		if self.due_date and getdate(self.due_date) >= getdate(pi_dict["posting_date"]):
 			pi_dict["due_date"] = self.due_date
 
-		# Apply tax template from OCR Import (user-editable, auto-set during extraction).
-		# Q9: the inclusive-rate detector reads the full doc (items/subtotal/total) and
-		# is computed here, at the invoice call site, then passed in explicitly.
-		tax_template, taxes = _build_taxes_from_template(
-			self.tax_template, self.company, self.tax_amount, _detect_tax_inclusive_rates(self)
-		)
-		if tax_template:
-			pi_dict["taxes_and_charges"] = tax_template
-			pi_dict["taxes"] = taxes
+		self._apply_tax_template(pi_dict)
 
 		pi = frappe.get_doc(pi_dict)
 		# ignore_mandatory needed because OCR data may be incomplete (creating a draft for review)
@@ -831,26 +1114,15 @@ class OCRImport(Document):
 				pi_item.db_set({"item_name": ocr_desc[:140], "description": ocr_desc})
 
 		# Add comment with original invoice link (if available from Drive)
-		if self.drive_link and self.drive_link.startswith("https://"):
-			from frappe.utils import escape_html
-
-			safe_link = escape_html(self.drive_link)
-			safe_path = escape_html(self.drive_folder_path or "N/A")
-			pi.add_comment(
-				"Comment",
-				f"<b>Original Invoice PDF:</b> <a href='{safe_link}' target='_blank' rel='noopener noreferrer'>View in Google Drive</a><br>"
-				f"<small>Archive path: {safe_path}</small>",
-			)
+		drive_comment = _drive_link_comment(self.drive_link, self.drive_folder_path)
+		if drive_comment:
+			pi.add_comment("Comment", drive_comment)
 
 		# Link PI back to this import
-		self.purchase_invoice = pi.name
-		self.status = "Draft Created"
-		self.save()
+		self.db_set({"purchase_invoice": pi.name, "status": "Draft Created"})
 
 		frappe.msgprint(
-			_("Purchase Invoice {0} created as draft.").format(
-				frappe.utils.get_link_to_form("Purchase Invoice", pi.name)
-			),
+			_("Purchase Invoice {0} created as draft.").format(get_link_to_form("Purchase Invoice", pi.name)),
 			indicator="green",
 		)
 
@@ -875,20 +1147,11 @@ class OCRImport(Document):
 		if self.document_type != "Purchase Receipt":
 			frappe.throw(_("Document Type must be 'Purchase Receipt' to create a Purchase Receipt."))
 
-		# Row-lock to prevent duplicate creation from concurrent calls
-		current = frappe.db.get_value(
-			"OCR Import",
-			self.name,
-			["purchase_invoice", "purchase_receipt", "journal_entry"],
-			as_dict=True,
-			for_update=True,
-		)
-		if current.purchase_invoice or current.purchase_receipt or current.journal_entry:
-			frappe.throw(_("A document has already been created for this import."))
-
 		if not self.supplier:
 			frappe.throw(_("Please select a Supplier before creating a Purchase Receipt."))
 
+		self._lock_for_create()
+
 		settings = frappe.get_cached_doc("OCR Settings")
 
 		# Build PO item lookup for auto-matching when item-level refs are missing
@@ -902,8 +1165,14 @@ class OCRImport(Document):
 			):
 				po_items_by_code.setdefault(po_item.item_code, []).append(po_item)
 
+		# Loop-invariant defaults, resolved once instead of per row.
+		# Cost Center precedence: line override → doc-level parent → OCR Settings default
+		default_cost_center = self.cost_center or settings.default_cost_center
+		default_warehouse = settings.default_warehouse
+
 		pr_items = []
 		non_stock_warnings = []
+		stock_items = _stock_item_codes(item.item_code for item in self.items)
 		skipped_unmatched = 0
 		for item in self.items:
 			if not item.item_code:
@@ -915,24 +1184,19 @@ class OCRImport(Document):
 				"item_code": item.item_code,
 				"qty": item.qty or 1,
 				"rate": item.rate or 0,
-				"description": item.description_ocr or item.item_name or "OCR Imported Item",
+				"description": item.description_ocr or item.item_name or _DEFAULT_ITEM_DESCRIPTION,
 			}
 
 			# Warn if non-stock item is on a PR
-			is_stock = frappe.db.get_value("Item", item.item_code, "is_stock_item")
-			if not is_stock:
+			if item.item_code not in stock_items:
 				non_stock_warnings.append(item.item_code)
 
-			# Cost Center precedence: line override → doc-level parent → OCR Settings default
-			if item.cost_center:
-				pr_item["cost_center"] = item.cost_center
-			elif self.cost_center:
-				pr_item["cost_center"] = self.cost_center
-			elif settings.default_cost_center:
-				pr_item["cost_center"] = settings.default_cost_center
+			cost_center = item.cost_center or default_cost_center
+			if cost_center:
+				pr_item["cost_center"] = cost_center
 
-			if settings.default_warehouse:
-				pr_item["warehouse"] = settings.default_warehouse
+			if default_warehouse:
+				pr_item["warehouse"] = default_warehouse
 
 			# PO refs (links PR item back to PO item — marks PO as received).
 			# Note: PR uses field name `purchase_order_item`, not `po_detail` (ERPNext v15 schema).
@@ -979,7 +1243,7 @@ class OCRImport(Document):
 			"company": self.company,
 			"currency": self.currency or frappe.get_cached_value("Company", self.company, "default_currency"),
 			"set_posting_time": 1,
-			"posting_date": self.invoice_date or frappe.utils.today(),
+			"posting_date": self.invoice_date or today(),
 			"items": pr_items,
 		}
 
@@ -987,13 +1251,7 @@ class OCRImport(Document):
 		if frappe.get_meta("Purchase Receipt").has_field("custom_ocr_import"):
 			pr_dict["custom_ocr_import"] = self.name
 
-		# Apply tax template from OCR Import (Q9: explicit args; detector at call site)
-		tax_template, taxes = _build_taxes_from_template(
-			self.tax_template, self.company, self.tax_amount, _detect_tax_inclusive_rates(self)
-		)
-		if tax_template:
-			pr_dict["taxes_and_charges"] = tax_template
-			pr_dict["taxes"] = taxes
+		self._apply_tax_template(pr_dict)
 
 		pr = frappe.get_doc(pr_dict)
 		pr.flags.ignore_mandatory = True
@@ -1008,24 +1266,15 @@ class OCRImport(Document):
 				pr_item.db_set({"item_name": ocr_desc[:140], "description": ocr_desc})
 
 		# Add comment with original invoice link (if available from Drive)
-		if self.drive_link and self.drive_link.startswith("https://"):
-			from frappe.utils import escape_html
-
-			safe_link = escape_html(self.drive_link)
-			safe_path = escape_html(self.drive_folder_path or "N/A")
-			pr.add_comment(
-				"Comment",
-				f"<b>Original Invoice PDF:</b> <a href='{safe_link}' target='_blank' rel='noopener noreferrer'>View in Google Drive</a><br>"
-				f"<small>Archive path: {safe_path}</small>",
-			)
+		drive_comment = _drive_link_comment(self.drive_link, self.drive_folder_path)
+		if drive_comment:
+			pr.add_comment("Comment", drive_comment)
 
 		# Link PR back to this import
-		self.purchase_receipt = pr.name
-		self.status = "Draft Created"
-		self.save()
+		self.db_set({"purchase_receipt": pr.name, "status": "Draft Created"})
 
 		msg = _("Purchase Receipt {0} created as draft.").format(
-			frappe.utils.get_link_to_form("Purchase Receipt", pr.name)
+			get_link_to_form("Purchase Receipt", pr.name)
 		)
 		warnings = []
 		if skipped_unmatched:
@@ -1057,20 +1306,11 @@ class OCRImport(Document):
 		if self.document_type != "Journal Entry":
 			frappe.throw(_("Document Type must be 'Journal Entry' to create a Journal Entry."))
 
-		# Row-lock to prevent duplicate creation from concurrent calls
-		current = frappe.db.get_value(
-			"OCR Import",
-			self.name,
-			["purchase_invoice", "purchase_receipt", "journal_entry"],
-			as_dict=True,
-			for_update=True,
-		)
-		if current.purchase_invoice or current.purchase_receipt or current.journal_entry:
-			frappe.throw(_("A document has already been created for this import."))
-
 		if not self.supplier:
 			frappe.throw(_("Please select a Supplier before creating a Journal Entry."))
 
+		self._lock_for_create()
+
 		settings = frappe.get_cached_doc("OCR Settings")
 
 		# Determine credit account
@@ -1083,8 +1323,26 @@ class OCRImport(Document):
 				)
 			)
 
+		# Loop-invariant defaults, resolved once instead of per row
+		default_expense_account = settings.get("default_expense_account")
+		default_cost_center = self.cost_center or settings.get("default_cost_center")
+
+		# Tax rows of the template (only booked when tax was detected)
+		tax_rows = []
+		if self.tax_template and flt(self.tax_amount) > 0:
+			template = frappe.get_cached_doc("Purchase Taxes and Charges Template", self.tax_template)
+			tax_rows = [row for row in template.taxes if row.account_head]
+
+		# Every account the JE touches — credit, per-row expense, tax heads —
+		# fetched in one query instead of two get_value calls per line.
+		account_info = _account_details(
+			[credit_account]
+			+ [item.expense_account or default_expense_account for item in self.items]
+			+ [row.account_head for row in tax_rows]
+		)
+
 		# Validate credit account
-		self._validate_account(credit_account, _("Credit Account"))
+		self._validate_account(credit_account, _("Credit Account"), account_info)
 
 		# Build debit lines
 		accounts = []
@@ -1105,7 +1363,7 @@ class OCRImport(Document):
 		)
 
 		for item in self.items:
-			expense_account = item.expense_account or settings.get("default_expense_account")
+			expense_account = item.expense_account or default_expense_account
 			if not expense_account:
 				frappe.throw(
 					_(
@@ -1117,6 +1375,7 @@ class OCRImport(Document):
 			self._validate_account(
 				expense_account,
 				_("Expense Account for '{0}'").format(item.description_ocr or item.item_name),
+				account_info,
 			)
 
 			amount = flt(item.amount or (item.qty or 1) * (item.rate or 0), 2)
@@ -1131,12 +1390,11 @@ class OCRImport(Document):
 				"account": expense_account,
 				"debit_in_account_currency": amount,
 				"credit_in_account_currency": 0,
-				"cost_center": item.cost_center or self.cost_center or settings.get("default_cost_center"),
+				"cost_center": item.cost_center or default_cost_center,
 			}
 
 			# Add party info if account is payable/receivable type
-			account_type = frappe.db.get_value("Account", expense_account, "account_type")
-			if account_type in ("Payable", "Receivable"):
+			if account_info[expense_account].account_type in ("Payable", "Receivable"):
 				debit_line["party_type"] = "Supplier"
 				debit_line["party"] = self.supplier
 
@@ -1148,62 +1406,58 @@ class OCRImport(Document):
 		# Tax line(s) (if tax detected). A multi-row template (e.g. VAT input +
 		# a separate levy) must NOT collapse everything onto the first account —
 		# split the extracted tax_amount proportionally by the rows' rates.
-		if self.tax_template and flt(self.tax_amount) > 0:
-			template = frappe.get_cached_doc("Purchase Taxes and Charges Template", self.tax_template)
-			tax_rows = [row for row in template.taxes if row.account_head]
-
-			if tax_rows:
-				tax_amt = flt(self.tax_amount, 2)
-				if len(tax_rows) == 1:
-					allocations = [(tax_rows[0], tax_amt)]
-				elif all(flt(row.rate) > 0 for row in tax_rows):
-					# Proportional by rate; last row takes the rounding remainder
-					# so the allocations sum exactly to tax_amt.
-					total_rate = sum(flt(row.rate) for row in tax_rows)
-					allocations = []
-					allocated = 0.0
-					for row in tax_rows[:-1]:
-						share = flt(tax_amt * flt(row.rate) / total_rate, 2)
-						allocations.append((row, share))
-						allocated = flt(allocated + share, 2)
-					remainder = flt(tax_amt - allocated, 2)
-					if remainder < 0:
-						# Rounding overshoot (possible with 3+ rows): a negative
-						# remainder would be dropped by the amount<=0 skip below
-						# and booked tax would exceed tax_amt. Absorb it into the
-						# largest earlier share so the sum stays exact.
-						biggest = max(range(len(allocations)), key=lambda i: allocations[i][1])
-						row_i, amt_i = allocations[biggest]
-						allocations[biggest] = (row_i, flt(amt_i + remainder, 2))
-						remainder = 0.0
-					allocations.append((tax_rows[-1], remainder))
-				else:
-					# Multi-row template with zero-rate (Actual) rows — allocation
-					# can't be inferred from rates. Book to the first account and
-					# warn loudly so the user reviews the draft's tax split.
-					allocations = [(tax_rows[0], tax_amt)]
-					frappe.msgprint(
-						_(
-							"Tax template '{0}' has multiple tax accounts but the split "
-							"cannot be inferred — the full tax amount was booked to '{1}'. "
-							"Review the tax lines on the draft."
-						).format(self.tax_template, tax_rows[0].account_head),
-						indicator="orange",
-					)
+		if tax_rows:
+			tax_amt = flt(self.tax_amount, 2)
+			if len(tax_rows) == 1:
+				allocations = [(tax_rows[0], tax_amt)]
+			elif all(flt(row.rate) > 0 for row in tax_rows):
+				# Proportional by rate; last row takes the rounding remainder
+				# so the allocations sum exactly to tax_amt.
+				total_rate = sum(flt(row.rate) for row in tax_rows)
+				allocations = []
+				allocated = 0.0
+				for row in tax_rows[:-1]:
+					share = flt(tax_amt * flt(row.rate) / total_rate, 2)
+					allocations.append((row, share))
+					allocated = flt(allocated + share, 2)
+				remainder = flt(tax_amt - allocated, 2)
+				if remainder < 0:
+					# Rounding overshoot (possible with 3+ rows): a negative
+					# remainder would be dropped by the amount<=0 skip below
+					# and booked tax would exceed tax_amt. Absorb it into the
+					# largest earlier share so the sum stays exact.
+					biggest = max(range(len(allocations)), key=lambda i: allocations[i][1])
+					row_i, amt_i = allocations[biggest]
+					allocations[biggest] = (row_i, flt(amt_i + remainder, 2))
+					remainder = 0.0
+				allocations.append((tax_rows[-1], remainder))
+			else:
+				# Multi-row template with zero-rate (Actual) rows — allocation
+				# can't be inferred from rates. Book to the first account and
+				# warn loudly so the user reviews the draft's tax split.
+				allocations = [(tax_rows[0], tax_amt)]
+				frappe.msgprint(
+					_(
+						"Tax template '{0}' has multiple tax accounts but the split "
+						"cannot be inferred — the full tax amount was booked to '{1}'. "
+						"Review the tax lines on the draft."
+					).format(self.tax_template, tax_rows[0].account_head),
+					indicator="orange",
+				)
 
-				for tax_row, amount in allocations:
-					if amount <= 0:
-						continue
-					self._validate_account(tax_row.account_head, _("Tax Account"))
-					total_debit += amount
-					accounts.append(
-						{
-							"account": tax_row.account_head,
-							"debit_in_account_currency": amount,
-							"credit_in_account_currency": 0,
-							"cost_center": self.cost_center or settings.get("default_cost_center"),
-						}
-					)
+			for tax_row, amount in allocations:
+				if amount <= 0:
+					continue
+				self._validate_account(tax_row.account_head, _("Tax Account"), account_info)
+				total_debit += amount
+				accounts.append(
+					{
+						"account": tax_row.account_head,
+						"debit_in_account_currency": amount,
+						"credit_in_account_currency": 0,
+						"cost_center": default_cost_center,
+					}
+				)
 
 		# Credit line (balances total debits)
 		credit_line = {
@@ -1213,15 +1467,12 @@ class OCRImport(Document):
 		}
 
 		# Add party info if credit account is payable/receivable type
-		credit_account_type = frappe.db.get_value("Account", credit_account, "account_type")
-		if credit_account_type in ("Payable", "Receivable"):
+		if account_info[credit_account].account_type in ("Payable", "Receivable"):
 			credit_line["party_type"] = "Supplier"
 			credit_line["party"] = self.supplier
 
-		if self.cost_center:
-			credit_line["cost_center"] = self.cost_center
-		elif settings.get("default_cost_center"):
-			credit_line["cost_center"] = settings.default_cost_center
+		if default_cost_center:
+			credit_line["cost_center"] = default_cost_center
 
 		accounts.append(credit_line)
 
@@ -1231,12 +1482,12 @@ class OCRImport(Document):
 				"voucher_type": "Journal Entry",
 				"company": self.company,
 				"set_posting_time": 1,
-				"posting_date": self.invoice_date or frappe.utils.today(),
+				"posting_date": self.invoice_date or today(),
 				"cheque_no": self.invoice_number,
 				"cheque_date": self.invoice_date,
 				"user_remark": "OCR Import: {} — {}".format(
 					self.name,
-					frappe.utils.escape_html(self.supplier_name_ocr or self.supplier or ""),
+					escape_html(self.supplier_name_ocr or self.supplier or ""),
 				),
 				"accounts": accounts,
 			}
@@ -1248,26 +1499,15 @@ class OCRImport(Document):
 		je.insert()
 
 		# Add comment with original invoice link (if available from Drive)
-		if self.drive_link and self.drive_link.startswith("https://"):
-			from frappe.utils import escape_html
-
-			safe_link = escape_html(self.drive_link)
-			safe_path = escape_html(self.drive_folder_path or "N/A")
-			je.add_comment(
-				"Comment",
-				f"<b>Original Invoice PDF:</b> <a href='{safe_link}' target='_blank' rel='noopener noreferrer'>View in Google Drive</a><br>"
-				f"<small>Archive path: {safe_path}</small>",
-			)
+		drive_comment = _drive_link_comment(self.drive_link, self.drive_folder_path)
+		if drive_comment:
+			je.add_comment("Comment", drive_comment)
 
 		# Link JE back to this import
-		self.journal_entry = je.name
-		self.status = "Draft Created"
-		self.save()
+		self.db_set({"journal_entry": je.name, "status": "Draft Created"})
 
 		frappe.msgprint(
-			_("Journal Entry {0} created as draft.").format(
-				frappe.utils.get_link_to_form("Journal Entry", je.name)
-			),
+			_("Journal Entry {0} created as draft.").format(get_link_to_form("Journal Entry", je.name)),
 			indicator="green",
 		)
 
@@ -1378,11 +1618,33 @@ class OCRImport(Document):
 			indicator="blue",
 		)
 
-	def _validate_account(self, account, label):
-		"""Validate that an account belongs to this company, is not a group, and is not disabled."""
-		account_details = frappe.db.get_value(
-			"Account", account, ["company", "is_group", "disabled"], as_dict=True
+	def _lock_for_create(self):
+		"""Row-lock this import and refuse if any document was already created.
+
+		The one SELECT ... FOR UPDATE both takes the lock and reads the three
+		links, so concurrent create_* calls serialise here and the loser sees
+		the winner's link. Everything else the create paths read is in memory
+		or the cached OCR Settings, so nothing further is re-read under the lock.
+		"""
+		current = frappe.db.get_value(
+			"OCR Import",
+			self.name,
+			["purchase_invoice", "purchase_receipt", "journal_entry"],
+			as_dict=True,
+			for_update=True,
 		)
+		if current.purchase_invoice or current.purchase_receipt or current.journal_entry:
+			frappe.throw(_("A document has already been created for this import."))
+
+	def _validate_account(self, account, label, account_info=None):
+		"""Validate that an account belongs to this company, is not a group, and is not disabled.
+
+		``account_info`` is an optional prefetched map from ``_account_details``;
+		without it the account is looked up on its own.
+		"""
+		if account_info is None:
+			account_info = _account_details([account])
+		account_details = account_info.get(account)
 		if not account_details:
 			frappe.throw(_("{0}: Account '{1}' does not exist.").format(label, account))
 		if account_details.company != self.company:
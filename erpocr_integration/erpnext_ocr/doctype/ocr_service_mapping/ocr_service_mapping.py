@@ -31,8 +31,9 @@ class OCRServiceMapping(Document):
 
 		# Validate expense account belongs to company
 		if self.expense_account:
-			account_company = frappe.db.get_value("Account", self.expense_account, "company")
-			if account_company != self.company:
+			from erpocr_integration.erpnext_ocr.doctype.ocr_import.ocr_import import _account_company
+
+			if _account_company(self.expense_account) != self.company:
 				frappe.throw(
 					_("Expense Account {0} does not belong to company {1}").format(
 						self.expense_account, self.company
@@ -6,4 +6,7 @@ from frappe.model.document import Document
 
 
 class OCRSettings(Document):
-	pass
+	def on_update(self):
+		from erpocr_integration.api import clear_ocr_settings_cache
+
+		clear_ocr_settings_cache()
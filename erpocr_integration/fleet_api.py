@@ -94,11 +94,15 @@ def fleet_gemini_process(
 					supplier_name="Fleet Slips",
 					invoice_date=ocr_fleet.transaction_date,
 				)
+				# Archive fields written in one UPDATE rather than one per field
+				archive_values = {}
 				if archive_result.get("shareable_link"):
-					ocr_fleet.db_set("drive_link", archive_result["shareable_link"])
-					ocr_fleet.db_set("drive_file_id", archive_result["file_id"])
+					archive_values["drive_link"] = archive_result["shareable_link"]
+					archive_values["drive_file_id"] = archive_result["file_id"]
 				if archive_result.get("folder_path"):
-					ocr_fleet.db_set("drive_folder_path", archive_result["folder_path"])
+					archive_values["drive_folder_path"] = archive_result["folder_path"]
+				if archive_values:
+					ocr_fleet.db_set(archive_values)
 				frappe.db.commit()  # nosemgrep
 			except Exception:
 				frappe.log_error(
@@ -141,11 +145,9 @@ def _populate_ocr_fleet(ocr_fleet, extracted_data: dict, settings):
 	ocr_fleet.vehicle_registration = header.get("vehicle_registration", "")
 
 	# Confidence: convert 0.0-1.0 to 0-100 percent
-	try:
-		raw_confidence = float(header.get("confidence") or 0.0)
-	except (ValueError, TypeError):
-		raw_confidence = 0.0
-	ocr_fleet.confidence = max(0.0, min(100.0, raw_confidence * 100))
+	from erpocr_integration.api import confidence_percent
+
+	ocr_fleet.confidence = confidence_percent(header.get("confidence"))
 
 	# Fuel details
 	ocr_fleet.litres = fuel.get("litres", 0)
@@ -511,7 +513,7 @@ def upload_fleet_slip(
 	"""
 	_enforce_upload_csrf()
 
-	from erpocr_integration.api import SUPPORTED_FILE_TYPES, validate_file_magic_bytes
+	from erpocr_integration.api import SUPPORTED_FILE_TYPES, mime_type_for_filename, validate_upload_header
 
 	# ── Permission: OCR-Fleet-Slip create OR plain Driver ──────────────────
 	# Deliberately NOT gated on OCR Import create — this endpoint can never open
@@ -541,8 +543,7 @@ def upload_fleet_slip(
 		frappe.throw(_("No file found in request."))
 
 	filename = file.filename or ""
-	file_ext = "." + filename.rsplit(".", 1)[-1].lower() if "." in filename else ""
-	mime_type = SUPPORTED_FILE_TYPES.get(file_ext)
+	mime_type = mime_type_for_filename(filename)
 	if not mime_type:
 		supported = ", ".join(SUPPORTED_FILE_TYPES.keys())
 		frappe.throw(_("Unsupported file type. Accepted formats: {0}").format(supported))
@@ -556,9 +557,9 @@ def upload_fleet_slip(
 				"File too large. Maximum size is 2MB. Your file is {0:.2f}MB. Compress before uploading."
 			).format(file_size / (1024 * 1024))
 		)
-	file_content = file.read()
-	if not validate_file_magic_bytes(file_content, mime_type):
+	if not validate_upload_header(file, mime_type):
 		frappe.throw(_("File content does not match its file type. The file may be corrupted."))
+	file_content = file.read()
 	# Second gate (images only): magic bytes prove just the HEADER. An image with
 	# a valid header but a truncated/corrupt body passes the check above, then
 	# 500s when Frappe/PIL decodes it (thumbnail/preview). Decode-verify here so
@@ -787,7 +788,9 @@ def retry_fleet_extraction(ocr_fleet_name: str):
 		file_doc = frappe.get_doc("File", files[0].name)
 		file_content = file_doc.get_content()
 		filename = files[0].file_name
-		mime_type = _mime_type_from_filename(filename)
+		from erpocr_integration.api import mime_type_for_filename
+
+		mime_type = mime_type_for_filename(filename) or "application/pdf"
 	elif ocr_fleet.drive_file_id:
 		# Try to download from Drive
 		from erpocr_integration.tasks.drive_integration import download_file_from_drive
@@ -971,7 +974,9 @@ def route_to_invoice_pipeline(ocr_fleet_name: str):
 	source_file = frappe.get_doc("File", files[0].name)
 	file_content = source_file.get_content()
 	filename = source_file.file_name
-	mime_type = _mime_type_from_filename(filename)
+	from erpocr_integration.api import mime_type_for_filename
+
+	mime_type = mime_type_for_filename(filename) or "application/pdf"
 
 	# Create OCR Import placeholder
 	ocr_import = frappe.get_doc(
@@ -1051,14 +1056,3 @@ def route_to_invoice_pipeline(ocr_fleet_name: str):
 	frappe.db.commit()  # nosemgrep
 
 	return ocr_import.name
-
-
-def _mime_type_from_filename(filename: str) -> str:
-	"""Determine MIME type from filename extension."""
-	ext = ("." + filename.rsplit(".", 1)[-1].lower()) if "." in filename else ""
-	return {
-		".pdf": "application/pdf",
-		".jpg": "image/jpeg",
-		".jpeg": "image/jpeg",
-		".png": "image/png",
-	}.get(ext, "application/pdf")
@@ -138,6 +138,23 @@ doc_events = {
 		"on_submit": "erpocr_integration.api.update_ocr_import_on_submit",
 		"on_cancel": "erpocr_integration.api.update_ocr_import_on_cancel",
 	},
+	# Fuzzy-match candidate pools are cached per process (tasks/matching.py)
+	"Supplier": {
+		"on_update": "erpocr_integration.tasks.matching.clear_fuzzy_cache",
+		"on_trash": "erpocr_integration.tasks.matching.clear_fuzzy_cache",
+	},
+	"Item": {
+		"on_update": "erpocr_integration.tasks.matching.clear_fuzzy_cache",
+		"on_trash": "erpocr_integration.tasks.matching.clear_fuzzy_cache",
+	},
+	"OCR Supplier Alias": {
+		"on_update": "erpocr_integration.tasks.matching.clear_fuzzy_cache",
+		"on_trash": "erpocr_integration.tasks.matching.clear_fuzzy_cache",
+	},
+	"OCR Item Alias": {
+		"on_update": "erpocr_integration.tasks.matching.clear_fuzzy_cache",
+		"on_trash": "erpocr_integration.tasks.matching.clear_fuzzy_cache",
+	},
 }
 
 # Scheduled Tasks
@@ -311,14 +311,18 @@ frappe.ui.form.on('OCR Import', {
 			// Bind new handler
 			frappe.realtime.on('ocr_extraction_progress', function(data) {
 				if (data.ocr_import === frm.doc.name) {
+					// One frame may batch several stages; the last one is current
+					let events = data.events && data.events.length ? data.events : [data];
+					let latest = events[events.length - 1];
+
 					// Show alert
 					frappe.show_alert({
-						message: __(data.message || data.status),
-						indicator: data.status === 'Error' ? 'red' : 'blue'
+						message: __(latest.message || latest.status),
+						indicator: latest.status === 'Error' ? 'red' : 'blue'
 					});
 
 					// Reload form when status changes
-					if (!['Extracting', 'Processing'].includes(data.status)) {
+					if (!['Extracting', 'Processing'].includes(latest.status)) {
 						setTimeout(function() {
 							frm.reload_doc();
 						}, 1000);
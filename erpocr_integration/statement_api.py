@@ -13,7 +13,9 @@ def statement_gemini_process(
 	mime_type: str = "application/pdf",
 ):
 	"""Background job: extract statement data via Gemini, populate OCR Statement, reconcile."""
-	frappe.set_user(uploaded_by or "Administrator")
+	run_as = uploaded_by or "Administrator"
+	if frappe.session.user != run_as:
+		frappe.set_user(run_as)
 
 	try:
 		frappe.db.set_value("OCR Statement", ocr_statement_name, "status", "Extracting")
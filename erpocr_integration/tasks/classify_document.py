@@ -9,7 +9,6 @@ import base64
 import json
 
 import frappe
-import requests
 
 _CLASSIFICATION_PROMPT = """Classify this document as one of:
 - "invoice": A single invoice or a PDF containing multiple invoices. Has line items with quantities, unit prices, and amounts. May have a single supplier and invoice number.
@@ -45,7 +44,7 @@ def classify_document(
 	Returns (doc_type, confidence). Defaults to ('invoice', 0.0) on any error.
 	"""
 	try:
-		settings = frappe.get_single("OCR Settings")
+		settings = frappe.get_cached_doc("OCR Settings")
 		api_key = settings.get_password("gemini_api_key")
 		if not api_key:
 			return "invoice", 0.0
@@ -95,7 +94,9 @@ def _call_classification_api(
 
 	headers = {"Content-Type": "application/json", "x-goog-api-key": api_key}
 
-	response = requests.post(url, json=payload, headers=headers, timeout=30)
+	from erpocr_integration.tasks.gemini_extract import get_gemini_session
+
+	response = get_gemini_session().post(url, json=payload, headers=headers, timeout=30)
 	response.raise_for_status()
 
 	data = response.json()
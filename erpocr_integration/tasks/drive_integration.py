@@ -12,19 +12,53 @@ This module handles:
 - Scanning a Drive inbox folder for new invoice files
 """
 
+import hashlib
 import json
+import time
+from datetime import datetime
+from io import BytesIO
 
 import frappe
 from frappe import _
 from google.oauth2 import service_account
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
-from googleapiclient.http import MediaInMemoryUpload
+from googleapiclient.http import MediaInMemoryUpload, MediaIoBaseDownload
 
 SCOPES = ["https://www.googleapis.com/auth/drive"]
 MAX_PDF_SIZE_BYTES = 10 * 1024 * 1024  # 10MB
 MAX_DRIVE_RETRIES = 3  # Stop retrying Drive files after this many extraction failures
 
+# Authenticated Drive services are reused per worker process, keyed by site and
+# a digest of the service-account JSON (so rotating the key builds a fresh one).
+# Token refresh is handled by the credentials object; the TTL only bounds how
+# long a stale client can live.
+_SERVICE_TTL = 1800
+_service_cache: dict = {}
+
+# Archive folder IDs are memoised in Redis as (parent, name) -> id, so successive
+# uploads in the same month skip the Year/Month/Supplier files.list calls. If a
+# cached folder has since been deleted, Drive answers 404 and the callers drop
+# the memo and resolve the path again.
+_FOLDER_CACHE_PREFIX = "erpocr_drive_folder:"
+_FOLDER_CACHE_TTL = 6 * 3600
+_FOLDER_CREATE_ATTEMPTS = 3
+_FOLDER_CREATE_RETRY_STATUSES = (409, 429, 500, 502, 503, 504)
+# Drive reports per-user/project quota hits as 403 with one of these reasons
+_RATE_LIMIT_REASONS = {"rateLimitExceeded", "userRateLimitExceeded"}
+
+
+def _drive_settings():
+	"""OCR Settings for this request/job — read once, shared by every Drive call in it."""
+	return frappe.local_cache("erpocr_drive", "settings", lambda: frappe.get_single("OCR Settings"))
+
+
+def _service_account_json(settings) -> str | None:
+	"""Decrypted service-account JSON, decrypted at most once per request/job."""
+	return frappe.local_cache(
+		"erpocr_drive", "service_account_json", lambda: settings.get_password("drive_service_account_json")
+	)
+
 
 def _record_drive_scan_failure(
 	*,
@@ -35,6 +69,7 @@ def _record_drive_scan_failure(
 	settings,
 	error_title: str,
 	error_message: str,
+	stale_rows=(),
 ) -> None:
 	"""Log the failure AND persist an Error placeholder so the retry cap engages.
 
@@ -65,11 +100,18 @@ def _record_drive_scan_failure(
 	elif err_log_name:
 		doc_data["error_log"] = err_log_name
 
+	savepoint = "drive_scan_failure"
+	frappe.db.savepoint(savepoint)
 	try:
+		_delete_stale_rows(stale_rows)
 		placeholder = frappe.get_doc(doc_data)
 		placeholder.insert(ignore_permissions=True)
 		frappe.db.commit()  # nosemgrep
 	except Exception as insert_exc:
+		# Undo the stale-row deletes (keeping the Error Log): without a placeholder
+		# the old rows are what carry drive_retry_count, so they must survive.
+		frappe.db.rollback(save_point=savepoint)
+		frappe.db.commit()  # nosemgrep
 		# Don't let placeholder-creation failure mask the underlying problem.
 		frappe.logger().warning(
 			f"Drive scan: could not persist failure placeholder for {filename} "
@@ -77,6 +119,49 @@ def _record_drive_scan_failure(
 		)
 
 
+def _delete_stale_rows(stale_rows) -> None:
+	"""Delete the failed (doctype, name) rows a retry replaces — left uncommitted so
+	they land in the same commit as the replacement placeholder."""
+	for doctype, name in stale_rows:
+		frappe.delete_doc(doctype, name, force=True, ignore_permissions=True)
+
+
+def _claim_drive_file(placeholder, drive_file_id: str, filename: str, doctypes: tuple, stale_rows) -> bool:
+	"""Swap the replaced rows for ``placeholder`` in one commit, re-checking this file first.
+
+	The poller's dedup rows are read once per listing and can be minutes old
+	by the time a later file is reached; an indexed exists() here stops a
+	concurrent poll or manual retry from slipping past them. Returns False
+	(with the deletes rolled back) if the file has been taken in the meantime.
+	If the insert fails the deletes are rolled back too, so the old rows keep
+	their retry count.
+	"""
+	_delete_stale_rows(stale_rows)
+	if any(frappe.db.exists(doctype, {"drive_file_id": drive_file_id}) for doctype in doctypes):
+		frappe.db.rollback()
+		frappe.logger().info(f"Drive scan: {filename} was picked up by another run — skipping")
+		return False
+	try:
+		placeholder.insert(ignore_permissions=True)
+	except Exception:
+		frappe.db.rollback()
+		raise
+	frappe.db.commit()  # nosemgrep
+	return True
+
+
+def _rows_by_drive_file(doctype: str, file_ids: list[str]) -> dict[str, list]:
+	"""Existing rows of ``doctype`` for a scan batch, grouped by drive_file_id (one query)."""
+	rows_by_file = {file_id: [] for file_id in file_ids}
+	for row in frappe.get_all(
+		doctype,
+		filters={"drive_file_id": ["in", file_ids]},
+		fields=["name", "status", "drive_retry_count", "drive_file_id"],
+	):
+		rows_by_file.setdefault(row.drive_file_id, []).append(row)
+	return rows_by_file
+
+
 def _validate_scan_content(
 	*,
 	content: bytes,
@@ -87,6 +172,7 @@ def _validate_scan_content(
 	filename: str,
 	retry_count: int,
 	settings,
+	stale_rows=(),
 ) -> bool:
 	"""Shared pre-enqueue content gate for all three Drive pipelines (v1.8.0).
 
@@ -106,6 +192,7 @@ def _validate_scan_content(
 			filename=filename,
 			retry_count=retry_count,
 			settings=settings,
+			stale_rows=stale_rows,
 			error_title=error_title,
 			error_message=f"File '{filename}' content does not match expected type ({file_mime_type}). Skipping.",
 		)
@@ -118,6 +205,7 @@ def _validate_scan_content(
 			filename=filename,
 			retry_count=retry_count,
 			settings=settings,
+			stale_rows=stale_rows,
 			error_title=error_title,
 			error_message=f"File '{filename}' image content is not decodable. Skipping.",
 		)
@@ -126,17 +214,6 @@ def _validate_scan_content(
 	return True
 
 
-def _mime_type_from_filename(filename: str) -> str:
-	"""Determine MIME type from filename extension."""
-	ext = ("." + filename.rsplit(".", 1)[-1].lower()) if "." in filename else ""
-	return {
-		".pdf": "application/pdf",
-		".jpg": "image/jpeg",
-		".jpeg": "image/jpeg",
-		".png": "image/png",
-	}.get(ext, "application/pdf")
-
-
 def upload_invoice_to_drive(
 	pdf_content: bytes, filename: str, supplier_name: str | None = None, invoice_date: str | None = None
 ) -> dict:
@@ -159,7 +236,7 @@ def upload_invoice_to_drive(
 	Raises:
 		Exception: If Drive integration is disabled or credentials are invalid
 	"""
-	settings = frappe.get_single("OCR Settings")
+	settings = _drive_settings()
 
 	if not settings.drive_integration_enabled:
 		frappe.log_error(
@@ -168,7 +245,7 @@ def upload_invoice_to_drive(
 		)
 		return {"file_id": None, "shareable_link": None, "folder_path": None}
 
-	sa_json = settings.get_password("drive_service_account_json")
+	sa_json = _service_account_json(settings)
 	if not sa_json or not settings.drive_archive_folder_id:
 		frappe.log_error(
 			title="Drive Configuration Missing",
@@ -185,17 +262,25 @@ def upload_invoice_to_drive(
 			service, settings.drive_archive_folder_id, supplier_name, invoice_date
 		)
 
-		# Upload PDF to the target folder
-		file_metadata = {"name": filename, "parents": [parent_folder_id]}
-
-		media = MediaInMemoryUpload(pdf_content, mimetype=_mime_type_from_filename(filename), resumable=True)
+		from erpocr_integration.api import mime_type_for_filename
 
-		file = (
-			service.files()
-			.create(body=file_metadata, media_body=media, fields="id, webViewLink", supportsAllDrives=True)
-			.execute()
+		media = MediaInMemoryUpload(
+			pdf_content, mimetype=mime_type_for_filename(filename) or "application/pdf", resumable=True
 		)
 
+		# Upload PDF to the target folder
+		try:
+			file = _create_file(service, filename, parent_folder_id, media)
+		except HttpError as e:
+			if not _is_not_found(e):
+				raise
+			# Memoised folder no longer exists — resolve the path afresh and retry once
+			_forget_folder_ids()
+			folder_path, parent_folder_id = _build_folder_structure(
+				service, settings.drive_archive_folder_id, supplier_name, invoice_date
+			)
+			file = _create_file(service, filename, parent_folder_id, media)
+
 		file_id = file.get("id")
 		web_view_link = file.get("webViewLink")
 
@@ -214,9 +299,25 @@ def upload_invoice_to_drive(
 		return {"file_id": None, "shareable_link": None, "folder_path": None}
 
 
+def _create_file(service, filename: str, parent_folder_id: str, media) -> dict:
+	return (
+		service.files()
+		.create(
+			body={"name": filename, "parents": [parent_folder_id]},
+			media_body=media,
+			fields="id, webViewLink",
+			supportsAllDrives=True,
+		)
+		.execute()
+	)
+
+
 def _get_drive_service(service_account_json: str):
 	"""
-	Create authenticated Google Drive service using service account credentials.
+	Return an authenticated Google Drive service for the given service account.
+
+	The service is cached per process for _SERVICE_TTL seconds, so a scan run
+	parses the key and builds the API client once rather than per file.
 
 	Args:
 		service_account_json: JSON string containing service account credentials
@@ -228,10 +329,20 @@ def _get_drive_service(service_account_json: str):
 		ValueError: If JSON is invalid
 		Exception: If authentication fails
 	"""
+	key = (
+		getattr(frappe.local, "site", None),
+		hashlib.sha256(service_account_json.encode()).hexdigest(),
+	)
+	cached = _service_cache.get(key)
+	now = time.monotonic()
+	if cached and cached["expires"] > now:
+		return cached["service"]
+
 	try:
 		credentials_dict = json.loads(service_account_json)
 		credentials = service_account.Credentials.from_service_account_info(credentials_dict, scopes=SCOPES)
-		service = build("drive", "v3", credentials=credentials)
+		service = build("drive", "v3", credentials=credentials, cache_discovery=False)
+		_service_cache[key] = {"expires": now + _SERVICE_TTL, "service": service}
 		return service
 
 	except json.JSONDecodeError as e:
@@ -257,78 +368,122 @@ def _build_folder_structure(
 		tuple: (folder_path_string, final_folder_id)
 		Example: ("2026/01-January/Google", "folder-id-xyz")
 	"""
-	import datetime
-
-	current_folder_id = root_folder_id
-	path_parts = []
-
-	# Create Year folder (e.g., "2026")
+	# Year folder (e.g., "2026") and Month folder (e.g., "01-January")
 	if invoice_date:
 		try:
-			date_obj = datetime.datetime.strptime(invoice_date, "%Y-%m-%d")
+			date_obj = datetime.strptime(invoice_date, "%Y-%m-%d")
 			year = str(date_obj.year)
 			month_name = date_obj.strftime("%m-%B")  # "01-January"
 		except (ValueError, TypeError):
-			year = str(datetime.datetime.now().year)
-			month_name = datetime.datetime.now().strftime("%m-%B")
+			year = str(datetime.now().year)
+			month_name = datetime.now().strftime("%m-%B")
 	else:
-		year = str(datetime.datetime.now().year)
-		month_name = datetime.datetime.now().strftime("%m-%B")
-
-	year_folder_id = _get_or_create_folder(service, year, current_folder_id)
-	path_parts.append(year)
-	current_folder_id = year_folder_id
+		year = str(datetime.now().year)
+		month_name = datetime.now().strftime("%m-%B")
 
-	# Create Month folder (e.g., "01-January")
-	month_folder_id = _get_or_create_folder(service, month_name, current_folder_id)
-	path_parts.append(month_name)
-	current_folder_id = month_folder_id
-
-	# Create Supplier folder (e.g., "Google") if supplier name provided
+	levels = [year, month_name]
+	# Supplier folder (e.g., "Google") if supplier name provided
 	if supplier_name:
 		# Clean supplier name for folder (remove special characters)
 		clean_supplier = "".join(c for c in supplier_name if c.isalnum() or c in (" ", "-", "_")).strip()
-		if not clean_supplier:
-			clean_supplier = "Unknown"
-
-		supplier_folder_id = _get_or_create_folder(service, clean_supplier, current_folder_id)
-		path_parts.append(clean_supplier)
-		current_folder_id = supplier_folder_id
+		levels.append(clean_supplier or "Unknown")
+
+	for _attempt in range(2):
+		current_folder_id = root_folder_id
+		state = None
+		deepest_cached = None
+		for folder_name in levels:
+			# A folder created just now has no children, so the levels below it
+			# are created without listing first.
+			current_folder_id, state = _get_or_create_folder(
+				service, folder_name, current_folder_id, parent_is_new=state == "created"
+			)
+			if state == "cached":
+				deepest_cached = current_folder_id
+		# A memoised folder may have been trashed in the Drive UI since (Drive
+		# still accepts uploads into it). Trash reaches every descendant, so
+		# checking the deepest memoised level covers the ones above it.
+		if not deepest_cached or _folder_is_live(service, deepest_cached):
+			break
+		_forget_folder_ids()
 
-	folder_path = "/".join(path_parts)
-	return folder_path, current_folder_id
+	return "/".join(levels), current_folder_id
 
 
-def _get_or_create_folder(service, folder_name: str, parent_folder_id: str) -> str:
+def _get_or_create_folder(
+	service, folder_name: str, parent_folder_id: str, parent_is_new: bool = False
+) -> tuple[str, str]:
 	"""
-	Get existing folder or create new one.
+	Get existing folder or create new one, memoising the ID in Redis.
 
 	Handles race conditions: if two concurrent jobs try to create the same
-	folder, one may fail. In that case, re-search for the folder.
+	folder, one may fail with 409. In that case (and after a rate limit or 5xx, with
+	backoff) re-search for the folder before trying again.
 
 	Args:
 		service: Authenticated Drive service
 		folder_name: Name of folder to find/create
 		parent_folder_id: Parent folder ID
+		parent_is_new: Parent was created in this run, so skip the lookup
 
 	Returns:
-		str: Folder ID
+		tuple: (folder_id, state) — state is "cached", "found" or "created"
 	"""
+	cache_key = f"{_FOLDER_CACHE_PREFIX}{parent_folder_id}:{folder_name}"
+	cached = frappe.cache().get_value(cache_key)
+	if cached:
+		return cached, "cached"
+
+	folder_id, created = _find_or_create_folder(service, folder_name, parent_folder_id, parent_is_new)
+	frappe.cache().set_value(cache_key, folder_id, expires_in_sec=_FOLDER_CACHE_TTL)
+	return folder_id, "created" if created else "found"
+
+
+def _forget_folder_ids():
+	"""Drop memoised archive folder IDs (a cached folder was deleted in Drive)."""
+	frappe.cache().delete_keys(_FOLDER_CACHE_PREFIX)
+
+
+def _folder_is_live(service, folder_id: str) -> bool:
+	"""False if the folder has been trashed or deleted in Drive."""
+	try:
+		folder = service.files().get(fileId=folder_id, fields="trashed", supportsAllDrives=True).execute()
+	except HttpError as e:
+		if _is_not_found(e):
+			return False
+		raise
+	return not folder.get("trashed")
+
+
+def _is_rate_limited(error) -> bool:
+	"""True for a 403 whose error reason is a Drive rate limit (not a permission error)."""
+	if getattr(getattr(error, "resp", None), "status", None) != 403:
+		return False
+	try:
+		details = json.loads(error.content or b"{}").get("error", {}).get("errors", [])
+	except (ValueError, AttributeError):
+		return False
+	return any(d.get("reason") in _RATE_LIMIT_REASONS for d in details if isinstance(d, dict))
+
+
+def _is_not_found(error) -> bool:
+	return getattr(error, "resp", None) is not None and error.resp.status == 404
+
+
+def _find_or_create_folder(
+	service, folder_name: str, parent_folder_id: str, parent_is_new: bool = False
+) -> tuple[str, bool]:
+	"""Look the folder up in Drive, creating it if missing (uncached). Returns (id, created)."""
 	# Search for existing folder (escape single quotes to prevent query injection from OCR-extracted names)
 	safe_name = folder_name.replace("\\", "\\\\").replace("'", "\\'")
 	query = f"name='{safe_name}' and '{parent_folder_id}' in parents and mimeType='application/vnd.google-apps.folder' and trashed=false"
 
 	try:
-		results = (
-			service.files()
-			.list(q=query, fields="files(id, name)", supportsAllDrives=True, includeItemsFromAllDrives=True)
-			.execute()
-		)
-		files = results.get("files", [])
+		files = [] if parent_is_new else _list_folder(service, query)
 
 		if files:
 			# Folder exists, return its ID
-			return files[0]["id"]
+			return files[0]["id"], False
 
 		# Folder doesn't exist, create it
 		file_metadata = {
@@ -337,22 +492,25 @@ def _get_or_create_folder(service, folder_name: str, parent_folder_id: str) -> s
 			"parents": [parent_folder_id],
 		}
 
-		try:
-			folder = service.files().create(body=file_metadata, fields="id", supportsAllDrives=True).execute()
-			return folder.get("id")
-		except HttpError:
-			# Race condition: another job may have created the folder — re-search
-			results = (
-				service.files()
-				.list(
-					q=query, fields="files(id, name)", supportsAllDrives=True, includeItemsFromAllDrives=True
+		for attempt in range(_FOLDER_CREATE_ATTEMPTS):
+			try:
+				folder = (
+					service.files().create(body=file_metadata, fields="id", supportsAllDrives=True).execute()
 				)
-				.execute()
-			)
-			files = results.get("files", [])
-			if files:
-				return files[0]["id"]
-			raise  # Re-raise if still no folder found
+				return folder.get("id"), True
+			except HttpError as e:
+				# Only a conflict (another job racing us), rate limit or server error
+				# is worth another look — a 5xx create may still have gone through,
+				# so re-search before retrying. Anything else (other 403s, 404) is final.
+				status = getattr(getattr(e, "resp", None), "status", None)
+				retryable = status in _FOLDER_CREATE_RETRY_STATUSES or _is_rate_limited(e)
+				if not retryable or attempt == _FOLDER_CREATE_ATTEMPTS - 1:
+					raise
+				if status != 409:
+					time.sleep(2**attempt)
+				files = _list_folder(service, query)
+				if files:
+					return files[0]["id"], False
 
 	except HttpError as e:
 		frappe.log_error(
@@ -361,6 +519,22 @@ def _get_or_create_folder(service, folder_name: str, parent_folder_id: str) -> s
 		raise
 
 
+def _list_folder(service, query: str) -> list[dict]:
+	"""First folder matching ``query`` — only its ID is read, so nothing else is fetched."""
+	results = (
+		service.files()
+		.list(
+			q=query,
+			fields="files(id)",
+			pageSize=1,
+			supportsAllDrives=True,
+			includeItemsFromAllDrives=True,
+		)
+		.execute()
+	)
+	return results.get("files", [])
+
+
 def download_file_from_drive(file_id: str) -> bytes | None:
 	"""
 	Download a file from Google Drive by its file ID.
@@ -371,17 +545,13 @@ def download_file_from_drive(file_id: str) -> bytes | None:
 	Returns:
 		bytes: File content, or None on failure
 	"""
-	settings = frappe.get_single("OCR Settings")
-	sa_json = settings.get_password("drive_service_account_json")
+	settings = _drive_settings()
+	sa_json = _service_account_json(settings)
 
 	if not sa_json:
 		return None
 
 	try:
-		from io import BytesIO
-
-		from googleapiclient.http import MediaIoBaseDownload
-
 		service = _get_drive_service(sa_json)
 		request = service.files().get_media(fileId=file_id, supportsAllDrives=True)
 
@@ -407,13 +577,11 @@ def poll_drive_scan_folder():
 	(dedup via drive_file_id), downloads content, and enqueues Gemini extraction.
 	Staggers enqueue calls by 5 seconds to avoid bursting the Gemini rate limit.
 	"""
-	import time
-
-	settings = frappe.get_single("OCR Settings")
+	settings = _drive_settings()
 	if not settings.drive_integration_enabled or not settings.drive_scan_folder_id:
 		return
 
-	sa_json = settings.get_password("drive_service_account_json")
+	sa_json = _service_account_json(settings)
 	if not sa_json:
 		return
 
@@ -429,16 +597,29 @@ def poll_drive_scan_folder():
 
 	frappe.logger().info(f"Drive scan: Found {len(files)} file(s) in scan folder")
 
+	# Dedup rows for the whole batch up front — one query per doctype, not per file
+	file_ids = [f["id"] for f in files]
+	import_rows = _rows_by_drive_file("OCR Import", file_ids)
+	statement_rows = _rows_by_drive_file("OCR Statement", file_ids)
+
 	enqueued_count = 0
 	for file_info in files:
 		try:
-			was_enqueued = _process_scan_file(service, file_info, settings)
+			was_enqueued = _process_scan_file(
+				service,
+				file_info,
+				settings,
+				existing_rows=import_rows[file_info["id"]],
+				existing_statements=statement_rows[file_info["id"]],
+			)
 			if was_enqueued:
 				enqueued_count += 1
 				# Stagger requests: wait 5s between enqueues so background workers
 				# don't all hit Gemini at once (free tier = 10 RPM)
 				time.sleep(5)
 		except Exception as e:
+			# Drop this file's uncommitted work (e.g. retry deletes) before moving on
+			frappe.db.rollback()
 			frappe.log_error(
 				title="Drive Scan Error", message=f"Failed to process {file_info.get('name', '?')}: {e!s}"
 			)
@@ -448,30 +629,43 @@ def poll_drive_scan_folder():
 		frappe.logger().info(f"Drive scan: Enqueued {enqueued_count} file(s) for processing")
 
 
-def _process_scan_file(service, file_info: dict, settings) -> bool:
+def _process_scan_file(
+	service,
+	file_info: dict,
+	settings,
+	existing_rows: list | None = None,
+	existing_statements: list | None = None,
+) -> bool:
 	"""
 	Process a single file (PDF or image) from the Drive scan folder.
 
 	Handles dedup (skips files already processed successfully), auto-retries
 	previously failed extractions, and enqueues new files for Gemini extraction.
 
+	existing_rows / existing_statements are the batch-prefetched dedup rows
+	(see _rows_by_drive_file); when omitted they are queried here.
+
 	Returns:
 		True if a Gemini extraction job was enqueued, False if file was skipped.
 	"""
+	from erpocr_integration.api import mime_type_for_filename
+
 	drive_file_id = file_info["id"]
 	filename = file_info["name"]
-	file_mime_type = file_info.get("mimeType", _mime_type_from_filename(filename))
+	file_mime_type = file_info.get("mimeType", mime_type_for_filename(filename) or "application/pdf")
 
 	# Track retry count (0 for first attempt, incremented on each retry)
 	_next_retry_count = 0
+	stale_rows = []
 
 	# Dedup: check ALL OCR Import rows for this drive_file_id
 	# (multi-invoice PDFs create multiple rows with the same drive_file_id)
-	existing_rows = frappe.get_all(
-		"OCR Import",
-		filters={"drive_file_id": drive_file_id},
-		fields=["name", "status", "drive_retry_count"],
-	)
+	if existing_rows is None:
+		existing_rows = frappe.get_all(
+			"OCR Import",
+			filters={"drive_file_id": drive_file_id},
+			fields=["name", "status", "drive_retry_count"],
+		)
 	if existing_rows:
 		all_error = all(row.status == "Error" for row in existing_rows)
 		if all_error:
@@ -485,9 +679,10 @@ def _process_scan_file(service, file_info: dict, settings) -> bool:
 				return False
 
 			# All records failed and under retry cap — delete so file can be retried
-			for row in existing_rows:
-				frappe.delete_doc("OCR Import", row.name, force=True, ignore_permissions=True)
-			frappe.db.commit()  # nosemgrep
+			# Deleted just before the replacement placeholder is inserted — after the
+			# download and classification — so the row locks are held only briefly
+			# and the deletes share the placeholder's commit
+			stale_rows += [("OCR Import", row.name) for row in existing_rows]
 			_next_retry_count = max_retry_count + 1
 			frappe.logger().info(
 				f"Drive scan: Retrying previously failed {filename} "
@@ -499,20 +694,20 @@ def _process_scan_file(service, file_info: dict, settings) -> bool:
 			return False
 
 	# Also check if this file was already processed as a statement
-	existing_statements = frappe.get_all(
-		"OCR Statement",
-		filters={"drive_file_id": drive_file_id},
-		fields=["name", "status", "drive_retry_count"],
-	)
+	if existing_statements is None:
+		existing_statements = frappe.get_all(
+			"OCR Statement",
+			filters={"drive_file_id": drive_file_id},
+			fields=["name", "status", "drive_retry_count"],
+		)
 	if existing_statements:
 		all_stmt_error = all(row.status == "Error" for row in existing_statements)
 		if all_stmt_error:
 			max_stmt_retry = max(getattr(row, "drive_retry_count", 0) or 0 for row in existing_statements)
 			if max_stmt_retry >= MAX_DRIVE_RETRIES:
 				return False
-			for row in existing_statements:
-				frappe.delete_doc("OCR Statement", row.name, force=True, ignore_permissions=True)
-			frappe.db.commit()  # nosemgrep
+			# Deleted with the replacement placeholder
+			stale_rows += [("OCR Statement", row.name) for row in existing_statements]
 			_next_retry_count = max(max_stmt_retry + 1, _next_retry_count)
 		else:
 			return False
@@ -526,6 +721,7 @@ def _process_scan_file(service, file_info: dict, settings) -> bool:
 			filename=filename,
 			retry_count=_next_retry_count,
 			settings=settings,
+			stale_rows=stale_rows,
 			error_title="Drive Scan Error",
 			error_message=f"Empty content for {filename}",
 		)
@@ -539,6 +735,7 @@ def _process_scan_file(service, file_info: dict, settings) -> bool:
 			filename=filename,
 			retry_count=_next_retry_count,
 			settings=settings,
+			stale_rows=stale_rows,
 			error_title="Drive Scan Error",
 			error_message=f"File too large (>{MAX_PDF_SIZE_BYTES // (1024 * 1024)}MB): {filename}",
 		)
@@ -555,6 +752,7 @@ def _process_scan_file(service, file_info: dict, settings) -> bool:
 		filename=filename,
 		retry_count=_next_retry_count,
 		settings=settings,
+		stale_rows=stale_rows,
 	):
 		return False
 
@@ -572,6 +770,7 @@ def _process_scan_file(service, file_info: dict, settings) -> bool:
 			settings,
 			_next_retry_count,
 			classification_confidence,
+			stale_rows,
 		)
 
 	# Create OCR Import placeholder with drive_file_id for dedup
@@ -587,8 +786,10 @@ def _process_scan_file(service, file_info: dict, settings) -> bool:
 			"drive_retry_count": _next_retry_count,
 		}
 	)
-	ocr_import.insert(ignore_permissions=True)
-	frappe.db.commit()  # nosemgrep
+	if not _claim_drive_file(
+		ocr_import, drive_file_id, filename, ("OCR Import", "OCR Statement"), stale_rows
+	):
+		return False
 
 	# Enqueue Gemini extraction. Caller (poll_drive_scan_folder) staggers between
 	# successive enqueues, so the worker's 300s timeout is for extraction + retries.
@@ -622,6 +823,7 @@ def _process_statement_file(
 	settings,
 	retry_count: int,
 	confidence: float,
+	stale_rows=(),
 ) -> bool:
 	"""Process a file classified as a supplier statement."""
 	ocr_statement = frappe.get_doc(
@@ -637,8 +839,10 @@ def _process_statement_file(
 			"classification_confidence": confidence,
 		}
 	)
-	ocr_statement.insert(ignore_permissions=True)
-	frappe.db.commit()  # nosemgrep
+	if not _claim_drive_file(
+		ocr_statement, drive_file_id, filename, ("OCR Import", "OCR Statement"), stale_rows
+	):
+		return False
 
 	try:
 		frappe.enqueue(
@@ -665,6 +869,9 @@ def _list_pdf_files(service, folder_id: str) -> list[dict]:
 	"""
 	List all supported files (PDF + images) in a Google Drive folder (with pagination).
 
+	Oldest first, so a backlog is worked through in arrival order; pages are
+	Drive's maximum (1000) to keep the listing to as few round trips as possible.
+
 	Args:
 		service: Authenticated Drive service
 		folder_id: Google Drive folder ID
@@ -689,7 +896,8 @@ def _list_pdf_files(service, folder_id: str) -> list[dict]:
 			.list(
 				q=query,
 				fields="nextPageToken, files(id, name, mimeType)",
-				pageSize=100,
+				orderBy="createdTime",
+				pageSize=1000,
 				pageToken=page_token,
 				supportsAllDrives=True,
 				includeItemsFromAllDrives=True,
@@ -716,10 +924,6 @@ def _download_file(service, file_id: str) -> bytes | None:
 	Returns:
 		bytes: File content, or None on failure
 	"""
-	from io import BytesIO
-
-	from googleapiclient.http import MediaIoBaseDownload
-
 	request = service.files().get_media(fileId=file_id, supportsAllDrives=True)
 
 	buffer = BytesIO()
@@ -754,13 +958,13 @@ def move_file_to_archive(
 	Returns:
 		dict: {"file_id", "shareable_link", "folder_path"}
 	"""
-	settings = frappe.get_single("OCR Settings")
+	settings = _drive_settings()
 
 	target_archive = archive_folder_id or settings.drive_archive_folder_id
 	if not settings.drive_integration_enabled or not target_archive:
 		return {"file_id": file_id, "shareable_link": None, "folder_path": None}
 
-	sa_json = settings.get_password("drive_service_account_json")
+	sa_json = _service_account_json(settings)
 	if not sa_json:
 		return {"file_id": file_id, "shareable_link": None, "folder_path": None}
 
@@ -784,9 +988,25 @@ def move_file_to_archive(
 		source_drive_id = file_info.get("driveId")
 
 		# Check if archive folder is on a different Shared Drive
-		archive_info = (
-			service.files().get(fileId=target_folder_id, fields="driveId", supportsAllDrives=True).execute()
-		)
+		try:
+			archive_info = (
+				service.files()
+				.get(fileId=target_folder_id, fields="driveId", supportsAllDrives=True)
+				.execute()
+			)
+		except HttpError as e:
+			if not _is_not_found(e):
+				raise
+			# Memoised folder no longer exists — resolve the path afresh
+			_forget_folder_ids()
+			folder_path, target_folder_id = _build_folder_structure(
+				service, target_archive, supplier_name, invoice_date
+			)
+			archive_info = (
+				service.files()
+				.get(fileId=target_folder_id, fields="driveId", supportsAllDrives=True)
+				.execute()
+			)
 		target_drive_id = archive_info.get("driveId")
 
 		cross_drive = source_drive_id != target_drive_id and source_drive_id and target_drive_id
@@ -847,12 +1067,12 @@ def test_drive_connection():
 	"""Test Drive connection and credentials. Returns folder list or error."""
 	frappe.only_for("System Manager")
 
-	settings = frappe.get_single("OCR Settings")
+	settings = _drive_settings()
 
 	if not settings.drive_integration_enabled:
 		return {"success": False, "message": "Drive integration is disabled"}
 
-	sa_json = settings.get_password("drive_service_account_json")
+	sa_json = _service_account_json(settings)
 	if not sa_json:
 		return {"success": False, "message": "Service account JSON not configured"}
 
@@ -904,13 +1124,11 @@ def poll_drive_dn_folder():
 	content, and enqueues DN Gemini extraction.  Staggers enqueue calls by
 	5 seconds to avoid bursting the Gemini rate limit.
 	"""
-	import time
-
-	settings = frappe.get_single("OCR Settings")
+	settings = _drive_settings()
 	if not settings.drive_integration_enabled or not settings.dn_scan_folder_id:
 		return
 
-	sa_json = settings.get_password("drive_service_account_json")
+	sa_json = _service_account_json(settings)
 	if not sa_json:
 		return
 
@@ -926,14 +1144,19 @@ def poll_drive_dn_folder():
 
 	frappe.logger().info(f"DN Drive scan: Found {len(files)} file(s) in scan folder")
 
+	existing = _rows_by_drive_file("OCR Delivery Note", [f["id"] for f in files])
+
 	enqueued_count = 0
 	for file_info in files:
 		try:
-			was_enqueued = _process_dn_scan_file(service, file_info, settings)
+			was_enqueued = _process_dn_scan_file(
+				service, file_info, settings, existing_rows=existing[file_info["id"]]
+			)
 			if was_enqueued:
 				enqueued_count += 1
 				time.sleep(5)
 		except Exception as e:
+			frappe.db.rollback()
 			frappe.log_error(
 				title="DN Drive Scan Error",
 				message=f"Failed to process DN scan {file_info.get('name', '?')}: {e!s}",
@@ -944,7 +1167,7 @@ def poll_drive_dn_folder():
 		frappe.logger().info(f"DN Drive scan: Enqueued {enqueued_count} file(s) for processing")
 
 
-def _process_dn_scan_file(service, file_info: dict, settings) -> bool:
+def _process_dn_scan_file(service, file_info: dict, settings, existing_rows: list | None = None) -> bool:
 	"""
 	Process a single file from the Drive DN scan folder.
 
@@ -954,18 +1177,22 @@ def _process_dn_scan_file(service, file_info: dict, settings) -> bool:
 	Returns:
 		True if a Gemini extraction job was enqueued, False if file was skipped.
 	"""
+	from erpocr_integration.api import mime_type_for_filename
+
 	drive_file_id = file_info["id"]
 	filename = file_info["name"]
-	file_mime_type = file_info.get("mimeType", _mime_type_from_filename(filename))
+	file_mime_type = file_info.get("mimeType", mime_type_for_filename(filename) or "application/pdf")
 
 	_next_retry_count = 0
+	stale_rows = []
 
 	# Dedup: check OCR Delivery Note for this drive_file_id
-	existing_rows = frappe.get_all(
-		"OCR Delivery Note",
-		filters={"drive_file_id": drive_file_id},
-		fields=["name", "status", "drive_retry_count"],
-	)
+	if existing_rows is None:
+		existing_rows = frappe.get_all(
+			"OCR Delivery Note",
+			filters={"drive_file_id": drive_file_id},
+			fields=["name", "status", "drive_retry_count"],
+		)
 	if existing_rows:
 		all_error = all(row.status == "Error" for row in existing_rows)
 		if all_error:
@@ -977,9 +1204,8 @@ def _process_dn_scan_file(service, file_info: dict, settings) -> bool:
 				)
 				return False
 
-			for row in existing_rows:
-				frappe.delete_doc("OCR Delivery Note", row.name, force=True, ignore_permissions=True)
-			frappe.db.commit()  # nosemgrep
+			# Deleted with the replacement placeholder
+			stale_rows += [("OCR Delivery Note", row.name) for row in existing_rows]
 			_next_retry_count = max_retry_count + 1
 			frappe.logger().info(
 				f"DN Drive scan: Retrying previously failed {filename} "
@@ -998,6 +1224,7 @@ def _process_dn_scan_file(service, file_info: dict, settings) -> bool:
 			filename=filename,
 			retry_count=_next_retry_count,
 			settings=settings,
+			stale_rows=stale_rows,
 			error_title="DN Drive Scan Error",
 			error_message=f"Empty content for {filename}",
 		)
@@ -1010,6 +1237,7 @@ def _process_dn_scan_file(service, file_info: dict, settings) -> bool:
 			filename=filename,
 			retry_count=_next_retry_count,
 			settings=settings,
+			stale_rows=stale_rows,
 			error_title="DN Drive Scan Error",
 			error_message=f"File too large (>{MAX_PDF_SIZE_BYTES // (1024 * 1024)}MB): {filename}",
 		)
@@ -1025,6 +1253,7 @@ def _process_dn_scan_file(service, file_info: dict, settings) -> bool:
 		filename=filename,
 		retry_count=_next_retry_count,
 		settings=settings,
+		stale_rows=stale_rows,
 	):
 		return False
 
@@ -1040,8 +1269,8 @@ def _process_dn_scan_file(service, file_info: dict, settings) -> bool:
 			"drive_retry_count": _next_retry_count,
 		}
 	)
-	ocr_dn.insert(ignore_permissions=True)
-	frappe.db.commit()  # nosemgrep
+	if not _claim_drive_file(ocr_dn, drive_file_id, filename, ("OCR Delivery Note",), stale_rows):
+		return False
 
 	# Save the scan file as a private attachment on the OCR DN
 	frappe.get_doc(
@@ -1096,13 +1325,11 @@ def poll_drive_fleet_folder():
 	processed files (dedup via drive_file_id on OCR Fleet Slip), downloads
 	content, and enqueues fleet Gemini extraction.
 	"""
-	import time
-
-	settings = frappe.get_single("OCR Settings")
+	settings = _drive_settings()
 	if not settings.drive_integration_enabled or not settings.get("fleet_scan_folder_id"):
 		return
 
-	sa_json = settings.get_password("drive_service_account_json")
+	sa_json = _service_account_json(settings)
 	if not sa_json:
 		return
 
@@ -1118,14 +1345,19 @@ def poll_drive_fleet_folder():
 
 	frappe.logger().info(f"Fleet Drive scan: Found {len(files)} file(s) in scan folder")
 
+	existing = _rows_by_drive_file("OCR Fleet Slip", [f["id"] for f in files])
+
 	enqueued_count = 0
 	for file_info in files:
 		try:
-			was_enqueued = _process_fleet_scan_file(service, file_info, settings)
+			was_enqueued = _process_fleet_scan_file(
+				service, file_info, settings, existing_rows=existing[file_info["id"]]
+			)
 			if was_enqueued:
 				enqueued_count += 1
 				time.sleep(5)
 		except Exception as e:
+			frappe.db.rollback()
 			frappe.log_error(
 				title="Fleet Drive Scan Error",
 				message=f"Failed to process fleet scan {file_info.get('name', '?')}: {e!s}",
@@ -1136,7 +1368,7 @@ def poll_drive_fleet_folder():
 		frappe.logger().info(f"Fleet Drive scan: Enqueued {enqueued_count} file(s) for processing")
 
 
-def _process_fleet_scan_file(service, file_info: dict, settings) -> bool:
+def _process_fleet_scan_file(service, file_info: dict, settings, existing_rows: list | None = None) -> bool:
 	"""
 	Process a single file from the Drive fleet scan folder.
 
@@ -1145,18 +1377,22 @@ def _process_fleet_scan_file(service, file_info: dict, settings) -> bool:
 	Returns:
 		True if a Gemini extraction job was enqueued, False if file was skipped.
 	"""
+	from erpocr_integration.api import mime_type_for_filename
+
 	drive_file_id = file_info["id"]
 	filename = file_info["name"]
-	file_mime_type = file_info.get("mimeType", _mime_type_from_filename(filename))
+	file_mime_type = file_info.get("mimeType", mime_type_for_filename(filename) or "application/pdf")
 
 	_next_retry_count = 0
+	stale_rows = []
 
 	# Dedup: check OCR Fleet Slip for this drive_file_id
-	existing_rows = frappe.get_all(
-		"OCR Fleet Slip",
-		filters={"drive_file_id": drive_file_id},
-		fields=["name", "status", "drive_retry_count"],
-	)
+	if existing_rows is None:
+		existing_rows = frappe.get_all(
+			"OCR Fleet Slip",
+			filters={"drive_file_id": drive_file_id},
+			fields=["name", "status", "drive_retry_count"],
+		)
 	if existing_rows:
 		all_error = all(row.status == "Error" for row in existing_rows)
 		if all_error:
@@ -1168,9 +1404,8 @@ def _process_fleet_scan_file(service, file_info: dict, settings) -> bool:
 				)
 				return False
 
-			for row in existing_rows:
-				frappe.delete_doc("OCR Fleet Slip", row.name, force=True, ignore_permissions=True)
-			frappe.db.commit()  # nosemgrep
+			# Deleted with the replacement placeholder
+			stale_rows += [("OCR Fleet Slip", row.name) for row in existing_rows]
 			_next_retry_count = max_retry_count + 1
 			frappe.logger().info(
 				f"Fleet Drive scan: Retrying previously failed {filename} "
@@ -1189,6 +1424,7 @@ def _process_fleet_scan_file(service, file_info: dict, settings) -> bool:
 			filename=filename,
 			retry_count=_next_retry_count,
 			settings=settings,
+			stale_rows=stale_rows,
 			error_title="Fleet Drive Scan Error",
 			error_message=f"Empty content for {filename}",
 		)
@@ -1201,6 +1437,7 @@ def _process_fleet_scan_file(service, file_info: dict, settings) -> bool:
 			filename=filename,
 			retry_count=_next_retry_count,
 			settings=settings,
+			stale_rows=stale_rows,
 			error_title="Fleet Drive Scan Error",
 			error_message=f"File too large (>{MAX_PDF_SIZE_BYTES // (1024 * 1024)}MB): {filename}",
 		)
@@ -1216,6 +1453,7 @@ def _process_fleet_scan_file(service, file_info: dict, settings) -> bool:
 		filename=filename,
 		retry_count=_next_retry_count,
 		settings=settings,
+		stale_rows=stale_rows,
 	):
 		return False
 
@@ -1231,8 +1469,8 @@ def _process_fleet_scan_file(service, file_info: dict, settings) -> bool:
 			"drive_retry_count": _next_retry_count,
 		}
 	)
-	ocr_fleet.insert(ignore_permissions=True)
-	frappe.db.commit()  # nosemgrep
+	if not _claim_drive_file(ocr_fleet, drive_file_id, filename, ("OCR Fleet Slip",), stale_rows):
+		return False
 
 	# Save the scan file as a private attachment
 	frappe.get_doc(
@@ -329,16 +329,15 @@ def _process_email(mail, email_id, email_account, settings, use_uid=False):
 			try:
 				# Determine MIME type: prefer email Content-Type header, fall back to filename extension
 				from erpocr_integration.api import (
-					SUPPORTED_FILE_TYPES,
 					is_image_decodable,
+					mime_type_for_filename,
 					validate_file_magic_bytes,
 				)
 
 				if attachment_content_type in _SUPPORTED_EMAIL_MIME_TYPES:
 					file_mime_type = attachment_content_type
 				else:
-					file_ext = ("." + filename.rsplit(".", 1)[-1].lower()) if "." in filename else ""
-					file_mime_type = SUPPORTED_FILE_TYPES.get(file_ext, "application/pdf")
+					file_mime_type = mime_type_for_filename(filename) or "application/pdf"
 
 				# Validate magic bytes before creating placeholder or enqueuing
 				if not validate_file_magic_bytes(pdf_content, file_mime_type):
@@ -557,17 +556,15 @@ _SUPPORTED_EMAIL_MIME_TYPES = {
 	"image/jpeg",
 	"image/png",
 }
-_SUPPORTED_EMAIL_EXTENSIONS = {".pdf", ".jpg", ".jpeg", ".png"}
 
 
 def _is_supported_attachment(content_type: str, filename: str | None) -> bool:
 	"""Check if an email attachment is a supported file type."""
+	from erpocr_integration.api import mime_type_for_filename
+
 	if content_type in _SUPPORTED_EMAIL_MIME_TYPES:
 		return True
-	if filename:
-		ext = ("." + filename.rsplit(".", 1)[-1].lower()) if "." in filename else ""
-		return ext in _SUPPORTED_EMAIL_EXTENSIONS
-	return False
+	return mime_type_for_filename(filename) is not None
 
 
 def _extract_pdfs_from_email(msg) -> list[tuple[bytes, str, str]]:
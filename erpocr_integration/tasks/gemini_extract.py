@@ -9,8 +9,64 @@ import frappe
 import requests
 from frappe import _
 
+# One HTTP session per worker process: keeps the TLS connection to
+# generativelanguage.googleapis.com alive across retries, batch polls and
+# (in non-forking workers) jobs. Created lazily so forked children don't
+# inherit a parent's socket.
+_session: requests.Session | None = None
 
-def extract_invoice_data(pdf_content: bytes, filename: str, mime_type: str = "application/pdf") -> list[dict]:
+
+def get_gemini_session() -> requests.Session:
+	"""Return the process-wide requests.Session used for Gemini REST calls."""
+	global _session
+	if _session is None:
+		_session = requests.Session()
+	return _session
+
+
+# Text-layer heuristics: below either threshold the PDF is treated as scanned
+# (or the text is garbage) and goes through the vision path instead.
+_TEXT_LAYER_MIN_CHARS = 200
+_TEXT_LAYER_MIN_CHARS_PER_PAGE = 50
+
+
+def extract_pdf_text(pdf_content: bytes) -> str | None:
+	"""
+	Return the embedded text layer of a born-digital PDF, or None.
+
+	None means "use vision": pypdf unavailable, the PDF is unreadable, or the
+	text is too sparse to be a real text layer (scanned pages, stray OCR fragments).
+	Pages are separated with markers so multi-invoice PDFs keep their boundaries.
+	"""
+	try:
+		from io import BytesIO
+
+		from pypdf import PdfReader
+	except ImportError:
+		return None
+
+	try:
+		reader = PdfReader(BytesIO(pdf_content))
+		pages = [(page.extract_text() or "").strip() for page in reader.pages]
+	except Exception:
+		return None
+
+	if not pages:
+		return None
+
+	total = sum(len(text) for text in pages)
+	if total < _TEXT_LAYER_MIN_CHARS or total / len(pages) < _TEXT_LAYER_MIN_CHARS_PER_PAGE:
+		return None
+
+	return "\n\n".join(f"--- Page {i} ---\n{text}" for i, text in enumerate(pages, start=1))
+
+
+def extract_invoice_data(
+	pdf_content: bytes,
+	filename: str,
+	mime_type: str = "application/pdf",
+	text_content: str | None = None,
+) -> list[dict]:
 	"""
 	Extract invoice data from PDF or image using Gemini 2.5 Flash API.
 
@@ -20,6 +76,8 @@ def extract_invoice_data(pdf_content: bytes, filename: str, mime_type: str = "ap
 		pdf_content: Raw file bytes (PDF or image)
 		filename: Original filename for logging
 		mime_type: MIME type for Gemini API (e.g., "application/pdf", "image/jpeg", "image/png")
+		text_content: Embedded PDF text (see extract_pdf_text). When given, Gemini gets
+			the text instead of the file, skipping per-page vision tokens.
 
 	Returns:
 		list[dict]: Each dict contains:
@@ -35,7 +93,7 @@ def extract_invoice_data(pdf_content: bytes, filename: str, mime_type: str = "ap
 	start_time = time.time()
 
 	# Get API key from OCR Settings
-	settings = frappe.get_single("OCR Settings")
+	settings = frappe.get_cached_doc("OCR Settings")
 	api_key = settings.get_password("gemini_api_key")
 
 	if not api_key:
@@ -49,7 +107,9 @@ def extract_invoice_data(pdf_content: bytes, filename: str, mime_type: str = "ap
 
 	# Call Gemini API with retry logic
 	try:
-		response_data = _call_gemini_api(pdf_content, prompt, schema, api_key, model, mime_type)
+		response_data = _call_gemini_api(
+			pdf_content, prompt, schema, api_key, model, mime_type, text_content=text_content
+		)
 	except Exception as e:
 		frappe.log_error(
 			title="Gemini API Error",
@@ -255,25 +315,24 @@ def _call_gemini_api(
 	api_key: str,
 	model: str,
 	mime_type: str = "application/pdf",
+	text_content: str | None = None,
 ) -> dict:
 	"""
 	Call Gemini API with file content and prompt, return parsed JSON response.
+	Sends text_content as a plain text part instead of the file when given.
 	Includes retry logic for rate limits.
 	"""
 	url = f"https://generativelanguage.googleapis.com/v1beta/models/{model}:generateContent"
 
-	# Encode file as base64
-	file_base64 = base64.b64encode(pdf_content).decode("utf-8")
+	if text_content:
+		document_part = {"text": f"Document text (extracted from the PDF text layer):\n\n{text_content}"}
+	else:
+		# Encode file as base64
+		file_base64 = base64.b64encode(pdf_content).decode("utf-8")
+		document_part = {"inline_data": {"mime_type": mime_type, "data": file_base64}}
 
 	payload = {
-		"contents": [
-			{
-				"parts": [
-					{"text": prompt},
-					{"inline_data": {"mime_type": mime_type, "data": file_base64}},
-				]
-			}
-		],
+		"contents": [{"parts": [{"text": prompt}, document_part]}],
 		"generationConfig": {"response_mime_type": "application/json", "response_schema": schema},
 	}
 
@@ -283,7 +342,7 @@ def _call_gemini_api(
 	max_retries = 5
 	for attempt in range(max_retries):
 		try:
-			response = requests.post(url, json=payload, headers=headers, timeout=60)
+			response = get_gemini_session().post(url, json=payload, headers=headers, timeout=60)
 			response.raise_for_status()
 			return response.json()
 
@@ -350,6 +409,10 @@ def _validate_gemini_response(response: dict) -> tuple[bool, str]:
 	"""
 	Validate Gemini API response structure.
 
+	The text part is not JSON-parsed here: each caller parses it exactly once
+	right after validation, and a multi-page response is large enough that a
+	second json.loads over it is measurable.
+
 	Returns:
 		tuple: (is_valid, error_message)
 	"""
@@ -381,12 +444,6 @@ def _validate_gemini_response(response: dict) -> tuple[bool, str]:
 	if not text:
 		return False, "Empty text in first part"
 
-	# Try to parse as JSON
-	try:
-		json.loads(text)
-	except json.JSONDecodeError as e:
-		return False, f"Invalid JSON in response text: {e!s}"
-
 	return True, ""
 
 
@@ -459,7 +516,7 @@ def extract_delivery_note_data(pdf_content: bytes, filename: str, mime_type: str
 	"""
 	start_time = time.time()
 
-	settings = frappe.get_single("OCR Settings")
+	settings = frappe.get_cached_doc("OCR Settings")
 	api_key = settings.get_password("gemini_api_key")
 	if not api_key:
 		frappe.throw(_("Gemini API key not configured in OCR Settings"))
@@ -680,7 +737,7 @@ def extract_fleet_slip_data(pdf_content: bytes, filename: str, mime_type: str =
 	"""
 	start_time = time.time()
 
-	settings = frappe.get_single("OCR Settings")
+	settings = frappe.get_cached_doc("OCR Settings")
 	api_key = settings.get_password("gemini_api_key")
 	if not api_key:
 		frappe.throw(_("Gemini API key not configured in OCR Settings"))
@@ -934,7 +991,7 @@ def extract_statement_data(pdf_content: bytes, filename: str, mime_type: str = "
 	"""Extract transaction lines from a supplier statement using Gemini API."""
 	start_time = time.time()
 
-	settings = frappe.get_single("OCR Settings")
+	settings = frappe.get_cached_doc("OCR Settings")
 	api_key = settings.get_password("gemini_api_key")
 	if not api_key:
 		frappe.throw(_("Gemini API key not configured in OCR Settings"))
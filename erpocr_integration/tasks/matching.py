@@ -2,6 +2,7 @@
 # For license information, please see license.txt
 
 import re
+import time
 from difflib import SequenceMatcher
 
 import frappe
@@ -10,6 +11,16 @@ import frappe
 # Keeps letters, digits, and whitespace; strips hyphens, slashes, parens, etc.
 _MATCH_PUNCT = re.compile(r"[^\w\s]+", re.UNICODE)
 
+# Fuzzy candidate pools (every enabled Supplier/Item plus the alias table) are
+# re-read at most every _CANDIDATE_TTL seconds per site, and the best score per
+# (description, supplier) is memoised against the pool it was computed on —
+# recurring invoices repeat the same descriptions, and SequenceMatcher over the
+# whole pool is the expensive part. Supplier/Item/alias saves clear the pools
+# in that process (doc_events); other workers pick changes up within the TTL.
+_CANDIDATE_TTL = 60
+_CANDIDATE_MEMO_MAX = 4096
+_candidate_cache: dict = {}
+
 
 def normalize_for_matching(text: str) -> str:
 	"""Normalize text for substring matching.
@@ -162,6 +173,106 @@ def match_item(
 	return None, "Unmatched"
 
 
+def match_items_bulk(
+	descriptions: list[str], supplier: str | None = None, supplier_status: str | None = None
+) -> dict[str, tuple[str | None, str]]:
+	"""
+	Resolve match_item's exact tiers for every line of an invoice at once.
+
+	Same precedence and statuses as match_item (supplier-scoped alias → global
+	alias → Item.item_name → Item.name), but one IN query per tier for the
+	whole invoice instead of up to four queries per line. Each tier only asks
+	for the descriptions the tiers above it left unresolved.
+
+	Comparison is case-insensitive on the Python side, mirroring the DB
+	collation the per-line lookups rely on.
+
+	Returns:
+		dict: stripped description → (item_code, match_status) for every hit.
+		Descriptions absent from the dict are unmatched at these tiers.
+	"""
+	results = {}
+	unresolved = {}
+	for description in descriptions:
+		text = (description or "").strip()
+		if text:
+			unresolved.setdefault(text.casefold(), set()).add(text)
+	if not unresolved:
+		return results
+
+	def _pending():
+		return sorted({text for texts in unresolved.values() for text in texts})
+
+	def _resolve(rows, text_field, value_field, status):
+		# Rows arrive in precedence order — the first row per text wins.
+		for row in rows:
+			key = (getattr(row, text_field) or "").strip().casefold()
+			for text in unresolved.pop(key, ()):
+				results[text] = (getattr(row, value_field), status)
+
+	alias_fields = ["ocr_text", "item_code"]
+	supplier = (supplier or "").strip()
+	if supplier:
+		_resolve(
+			frappe.get_all(
+				"OCR Item Alias",
+				filters={"ocr_text": ["in", _pending()], "supplier": supplier},
+				fields=alias_fields,
+				order_by="modified desc, name asc",
+				limit_page_length=0,
+				ignore_permissions=True,
+			),
+			"ocr_text",
+			"item_code",
+			_cap_to_supplier("Auto Matched", supplier_status),
+		)
+
+	if unresolved:
+		_resolve(
+			frappe.get_all(
+				"OCR Item Alias",
+				filters={"ocr_text": ["in", _pending()], "supplier": ["is", "not set"]},
+				fields=alias_fields,
+				order_by="modified desc, name asc",
+				limit_page_length=0,
+				ignore_permissions=True,
+			),
+			"ocr_text",
+			"item_code",
+			"Auto Matched",
+		)
+
+	if unresolved:
+		_resolve(
+			frappe.get_all(
+				"Item",
+				filters={"item_name": ["in", _pending()]},
+				fields=["name", "item_name"],
+				limit_page_length=0,
+				ignore_permissions=True,
+			),
+			"item_name",
+			"name",
+			"Auto Matched",
+		)
+
+	if unresolved:
+		_resolve(
+			frappe.get_all(
+				"Item",
+				filters={"name": ["in", _pending()]},
+				fields=["name"],
+				limit_page_length=0,
+				ignore_permissions=True,
+			),
+			"name",
+			"name",
+			"Auto Matched",
+		)
+
+	return results
+
+
 def match_item_by_supplier_part(
 	supplier: str, product_code: str, supplier_status: str | None = None
 ) -> tuple[str | None, str]:
@@ -229,28 +340,50 @@ def match_item_by_supplier_part(
 	return rows[0].parent, _cap_to_supplier("Auto Matched", supplier_status)
 
 
-def match_supplier_fuzzy(ocr_text: str, threshold: float = 80) -> tuple[str | None, str, float]:
-	"""
-	Fuzzy fallback for supplier matching using difflib.SequenceMatcher.
+def _candidate_pool(kind: str, loader) -> dict:
+	"""Return the cached fuzzy pool for ``kind`` on this site, reloading it once stale."""
+	key = (getattr(frappe.local, "site", None), kind)
+	pool = _candidate_cache.get(key)
+	now = time.monotonic()
+	if not pool or pool["expires"] <= now:
+		pool = {"expires": now + _CANDIDATE_TTL, "candidates": loader(), "memo": {}}
+		_candidate_cache[key] = pool
+	return pool
 
-	Called only when exact matching (match_supplier) fails.
-	Compares OCR text against all active suppliers and existing aliases.
-
-	Args:
-		ocr_text: OCR-extracted supplier name
-		threshold: Minimum similarity score (0-100) to consider a match
 
-	Returns:
-		tuple: (supplier_name or None, "Suggested" or "Unmatched", confidence_score)
-	"""
-	if not ocr_text:
-		return None, "Unmatched", 0
+def _best_fuzzy(pool: dict, query: str, supplier: str = "") -> tuple[str | None, float]:
+	"""Best (value, score) for ``query`` over the pool; supplier-scoped candidates
+	only count for their own supplier. Memoised per pool."""
+	memo_key = (query, supplier)
+	if memo_key in pool["memo"]:
+		return pool["memo"][memo_key]
 
-	ocr_lower = ocr_text.strip().lower()
 	best_match = None
 	best_score = 0
+	matcher = SequenceMatcher(None, query)
+	for text, value, scope in pool["candidates"]:
+		if scope and scope != supplier:
+			continue  # another supplier's scoped alias — not a candidate here
+		matcher.set_seq2(text)
+		# real_quick_ratio (lengths only) and quick_ratio (character counts) are
+		# upper bounds on ratio(): a candidate that can't beat the current best
+		# skips the full O(n*m) match without changing the result.
+		if matcher.real_quick_ratio() * 100 <= best_score or matcher.quick_ratio() * 100 <= best_score:
+			continue
+		score = matcher.ratio() * 100
+		if score > best_score:
+			best_score = score
+			best_match = value
+
+	if len(pool["memo"]) >= _CANDIDATE_MEMO_MAX:
+		pool["memo"].clear()
+	pool["memo"][memo_key] = (best_match, best_score)
+	return best_match, best_score
+
 
-	# Build candidate pool: suppliers + aliases
+def _load_supplier_candidates() -> list[tuple[str, str, None]]:
+	"""(lowercased text, supplier, scope) for every enabled supplier name + alias."""
+	candidates = []
 	suppliers = frappe.get_all(
 		"Supplier",
 		filters={"disabled": 0},
@@ -258,15 +391,10 @@ def match_supplier_fuzzy(ocr_text: str, threshold: float = 80) -> tuple[str | No
 		limit_page_length=0,
 		ignore_permissions=True,
 	)
-
 	for s in suppliers:
 		for candidate in (s.name, s.supplier_name):
-			if not candidate:
-				continue
-			score = SequenceMatcher(None, ocr_lower, candidate.lower()).ratio() * 100
-			if score > best_score:
-				best_score = score
-				best_match = s.name
+			if candidate:
+				candidates.append((candidate.lower(), s.name, None))
 
 	# Also check alias table (fuzzy against alias ocr_text → resolve to supplier)
 	aliases = frappe.get_all(
@@ -276,12 +404,66 @@ def match_supplier_fuzzy(ocr_text: str, threshold: float = 80) -> tuple[str | No
 		ignore_permissions=True,
 	)
 	for a in aliases:
-		if not a.ocr_text:
-			continue
-		score = SequenceMatcher(None, ocr_lower, a.ocr_text.lower()).ratio() * 100
-		if score > best_score:
-			best_score = score
-			best_match = a.supplier
+		if a.ocr_text:
+			candidates.append((a.ocr_text.lower(), a.supplier, None))
+	return candidates
+
+
+def _load_item_candidates() -> list[tuple[str, str, str | None]]:
+	"""(lowercased text, item_code, alias supplier or None) for every enabled item + alias."""
+	candidates = []
+	items = frappe.get_all(
+		"Item",
+		filters={"disabled": 0},
+		fields=["name", "item_name"],
+		limit_page_length=0,
+		ignore_permissions=True,
+	)
+	for i in items:
+		for candidate in (i.name, i.item_name):
+			if candidate:
+				candidates.append((candidate.lower(), i.name, None))
+
+	# Alias rows keep their supplier scope; NULL/"" both count as global.
+	aliases = frappe.get_all(
+		"OCR Item Alias",
+		fields=["ocr_text", "item_code", "supplier"],
+		limit_page_length=0,
+		ignore_permissions=True,
+	)
+	for a in aliases:
+		if a.ocr_text:
+			candidates.append((a.ocr_text.lower(), a.item_code, getattr(a, "supplier", None) or None))
+	return candidates
+
+
+def clear_fuzzy_cache(doc=None, method=None):
+	"""doc_events hook: drop this site's fuzzy pools after a Supplier/Item/alias change."""
+	site = getattr(frappe.local, "site", None)
+	for key in [k for k in _candidate_cache if k[0] == site]:
+		_candidate_cache.pop(key, None)
+
+
+def match_supplier_fuzzy(ocr_text: str, threshold: float = 80) -> tuple[str | None, str, float]:
+	"""
+	Fuzzy fallback for supplier matching using difflib.SequenceMatcher.
+
+	Called only when exact matching (match_supplier) fails.
+	Compares OCR text against all active suppliers and existing aliases
+	(pool cached per process — see _candidate_pool).
+
+	Args:
+		ocr_text: OCR-extracted supplier name
+		threshold: Minimum similarity score (0-100) to consider a match
+
+	Returns:
+		tuple: (supplier_name or None, "Suggested" or "Unmatched", confidence_score)
+	"""
+	if not ocr_text:
+		return None, "Unmatched", 0
+
+	pool = _candidate_pool("supplier", _load_supplier_candidates)
+	best_match, best_score = _best_fuzzy(pool, ocr_text.strip().lower())
 
 	if best_match and best_score >= threshold:
 		return best_match, "Suggested", best_score
@@ -296,7 +478,8 @@ def match_item_fuzzy(
 	Fuzzy fallback for item matching using difflib.SequenceMatcher.
 
 	Called only when exact matching (match_item) fails.
-	Compares OCR text against all active items and existing aliases.
+	Compares OCR text against all active items and existing aliases
+	(pool cached per process — see _candidate_pool).
 
 	The alias pool honours Q7c scoping (v1.8.0): global rows plus rows scoped
 	to the passed supplier — supplier A's scoped alias must not become a
@@ -314,47 +497,8 @@ def match_item_fuzzy(
 	if not ocr_text:
 		return None, "Unmatched", 0
 
-	ocr_lower = ocr_text.strip().lower()
-	best_match = None
-	best_score = 0
-
-	# Build candidate pool: items + aliases
-	items = frappe.get_all(
-		"Item",
-		filters={"disabled": 0},
-		fields=["name", "item_name"],
-		limit_page_length=0,
-		ignore_permissions=True,
-	)
-
-	for i in items:
-		for candidate in (i.name, i.item_name):
-			if not candidate:
-				continue
-			score = SequenceMatcher(None, ocr_lower, candidate.lower()).ratio() * 100
-			if score > best_score:
-				best_score = score
-				best_match = i.name
-
-	# Also check alias table — global rows + this supplier's scoped rows only
-	# (Python-side filter: one query, and NULL/"" both count as global).
-	supplier = (supplier or "").strip()
-	aliases = frappe.get_all(
-		"OCR Item Alias",
-		fields=["ocr_text", "item_code", "supplier"],
-		limit_page_length=0,
-		ignore_permissions=True,
-	)
-	for a in aliases:
-		if not a.ocr_text:
-			continue
-		alias_supplier = getattr(a, "supplier", None)
-		if alias_supplier and alias_supplier != supplier:
-			continue  # another supplier's scoped alias — not a candidate here
-		score = SequenceMatcher(None, ocr_lower, a.ocr_text.lower()).ratio() * 100
-		if score > best_score:
-			best_score = score
-			best_match = a.item_code
+	pool = _candidate_pool("item", _load_item_candidates)
+	best_match, best_score = _best_fuzzy(pool, ocr_text.strip().lower(), (supplier or "").strip())
 
 	if best_match and best_score >= threshold:
 		return best_match, "Suggested", best_score
@@ -381,8 +525,66 @@ def _service_mapping_result(mapping) -> dict:
 	}
 
 
+_SERVICE_MAPPING_FIELDS = ["description_pattern", "item_code", "item_name", "expense_account", "cost_center"]
+
+
+def load_service_mappings(company: str | None = None, supplier: str | None = None) -> dict:
+	"""
+	Load the service mappings that can apply to one (company, supplier) pair.
+
+	One query per priority tier, with patterns normalized up front, so an invoice's
+	lines can all be resolved in memory by match_service_item(..., mappings=...).
+
+	Returns:
+		dict with "supplier" and "generic" lists of (pattern_norm, mapping) —
+		longest pattern first, "*" sentinel and empty patterns dropped — and
+		"default": the supplier's "*" row or None.
+	"""
+	if not company:
+		company = frappe.defaults.get_user_default("Company")
+
+	def _patterns(filters):
+		rows = frappe.get_all(
+			"OCR Service Mapping",
+			filters=filters,
+			fields=_SERVICE_MAPPING_FIELDS,
+			order_by="LENGTH(description_pattern) DESC",
+			ignore_permissions=True,
+		)
+		patterns = []
+		for mapping in rows:
+			if (mapping.description_pattern or "").strip() == SUPPLIER_DEFAULT_PATTERN:
+				continue  # the supplier default — handled at Priority 3, never as a substring
+			pattern_norm = normalize_for_matching(mapping.description_pattern)
+			if pattern_norm:
+				patterns.append((pattern_norm, mapping))
+		return patterns
+
+	mappings = {"supplier": [], "generic": [], "default": None}
+	if supplier:
+		mappings["supplier"] = _patterns({"company": company, "supplier": supplier})
+	mappings["generic"] = _patterns({"company": company, "supplier": ["is", "not set"]})
+	if supplier:
+		default_rows = frappe.get_all(
+			"OCR Service Mapping",
+			filters={
+				"company": company,
+				"supplier": supplier,
+				"description_pattern": SUPPLIER_DEFAULT_PATTERN,
+			},
+			fields=_SERVICE_MAPPING_FIELDS,
+			limit_page_length=1,
+			ignore_permissions=True,
+		)
+		mappings["default"] = default_rows[0] if default_rows else None
+	return mappings
+
+
 def match_service_item(
-	description_ocr: str, company: str | None = None, supplier: str | None = None
+	description_ocr: str,
+	company: str | None = None,
+	supplier: str | None = None,
+	mappings: dict | None = None,
 ) -> dict | None:
 	"""
 	Attempt to match an OCR description to a service item mapping.
@@ -408,6 +610,8 @@ def match_service_item(
 		description_ocr: OCR-extracted description text
 		company: Company to filter mappings (optional, uses default if not provided)
 		supplier: Supplier to filter mappings (optional, for supplier-specific patterns)
+		mappings: Preloaded load_service_mappings(company, supplier) result — pass it
+			when matching many lines for the same invoice to skip the queries
 
 	Returns:
 		dict with keys: item_code, item_name, expense_account, cost_center, match_status
@@ -416,59 +620,20 @@ def match_service_item(
 	if not description_ocr:
 		return None
 
-	description_norm = normalize_for_matching(description_ocr)
+	if mappings is None:
+		mappings = load_service_mappings(company, supplier)
 
-	if not company:
-		company = frappe.defaults.get_user_default("Company")
-
-	# Priority 1: Supplier-specific pattern mappings (if supplier is provided)
-	if supplier:
-		supplier_mappings = frappe.get_all(
-			"OCR Service Mapping",
-			filters={"company": company, "supplier": supplier},
-			fields=["description_pattern", "item_code", "item_name", "expense_account", "cost_center"],
-			order_by="LENGTH(description_pattern) DESC",
-			ignore_permissions=True,
-		)
+	description_norm = normalize_for_matching(description_ocr)
 
-		for mapping in supplier_mappings:
-			if (mapping.description_pattern or "").strip() == SUPPLIER_DEFAULT_PATTERN:
-				continue  # the supplier default — handled at Priority 3, never as a substring
-			pattern_norm = normalize_for_matching(mapping.description_pattern)
-			if pattern_norm and pattern_norm in description_norm:
+	# Priority 1: supplier-specific patterns, then Priority 2: generic patterns
+	for tier in ("supplier", "generic"):
+		for pattern_norm, mapping in mappings[tier]:
+			if pattern_norm in description_norm:
 				return _service_mapping_result(mapping)
 
-	# Priority 2: Generic mappings (supplier field is empty/null)
-	generic_mappings = frappe.get_all(
-		"OCR Service Mapping",
-		filters={"company": company, "supplier": ["is", "not set"]},
-		fields=["description_pattern", "item_code", "item_name", "expense_account", "cost_center"],
-		order_by="LENGTH(description_pattern) DESC",
-		ignore_permissions=True,
-	)
-
-	for mapping in generic_mappings:
-		if (mapping.description_pattern or "").strip() == SUPPLIER_DEFAULT_PATTERN:
-			continue
-		pattern_norm = normalize_for_matching(mapping.description_pattern)
-		if pattern_norm and pattern_norm in description_norm:
-			return _service_mapping_result(mapping)
-
 	# Priority 3: Supplier default — the "*" wildcard row for this supplier, if any.
 	# Codes any line the specific/generic patterns didn't recognise.
-	if supplier:
-		default_rows = frappe.get_all(
-			"OCR Service Mapping",
-			filters={
-				"company": company,
-				"supplier": supplier,
-				"description_pattern": SUPPLIER_DEFAULT_PATTERN,
-			},
-			fields=["description_pattern", "item_code", "item_name", "expense_account", "cost_center"],
-			limit_page_length=1,
-			ignore_permissions=True,
-		)
-		if default_rows:
-			return _service_mapping_result(default_rows[0])
+	if mappings["default"]:
+		return _service_mapping_result(mappings["default"])
 
 	return None
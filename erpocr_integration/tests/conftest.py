@@ -149,6 +149,31 @@ def _mock_getdate(value=None):
 	return datetime.datetime.strptime(str(value)[:10], "%Y-%m-%d").date()
 
 
+# frappe.cache() stand-in: a dict with the RedisWrapper calls the app uses.
+class _FakeRedisCache:
+	def __init__(self):
+		self.store = {}
+
+	def get_value(self, key):
+		return self.store.get(key)
+
+	def set_value(self, key, value, expires_in_sec=None):
+		self.store[key] = value
+
+	def delete_keys(self, prefix):
+		for key in [k for k in self.store if k.startswith(prefix)]:
+			del self.store[key]
+
+
+# frappe.local_cache semantics: generator runs once per (namespace, key) and the
+# value lives in frappe.local.cache until the request ends (here: the test).
+def _mock_local_cache(namespace, key, generator, regenerate_if_none=False):
+	cache = _frappe_mock.local.cache.setdefault(namespace, {})
+	if key not in cache or (cache[key] is None and regenerate_if_none):
+		cache[key] = generator()
+	return cache[key]
+
+
 _frappe_utils_mock = MagicMock()
 _frappe_utils_mock.flt = _mock_flt
 _frappe_utils_mock.getdate = _mock_getdate
@@ -253,6 +278,19 @@ def reset_frappe_mock():
 		)
 	)
 	_frappe_mock.flags.disable_traceback = False
+	# Redis (frappe.cache()) and the request-local memo start empty for every test.
+	_frappe_mock.cache = MagicMock(return_value=_FakeRedisCache())
+	_frappe_mock.local.cache = {}
+	_frappe_mock.local_cache = MagicMock(side_effect=_mock_local_cache)
+	# Process-level caches would otherwise carry one test's settings/candidates
+	# into the next.
+	import erpocr_integration.api
+	import erpocr_integration.tasks.drive_integration
+	import erpocr_integration.tasks.matching
+
+	erpocr_integration.api._settings_cache.clear()
+	erpocr_integration.tasks.drive_integration._service_cache.clear()
+	erpocr_integration.tasks.matching._candidate_cache.clear()
 	yield _frappe_mock
 
 
@@ -1,11 +1,25 @@
 """Tests for erpocr_integration.api — pipeline logic."""
 
+from io import BytesIO
 from types import SimpleNamespace
-from unittest.mock import MagicMock
+from unittest.mock import MagicMock, patch
 
 import pytest
 
-from erpocr_integration.api import _populate_ocr_import, _select_tax_template, check_duplicates
+import erpocr_integration.api
+import erpocr_integration.tasks.drive_integration
+import erpocr_integration.tasks.gemini_extract
+from erpocr_integration.api import (
+	_populate_ocr_import,
+	_select_tax_template,
+	check_duplicates,
+	clear_ocr_settings_cache,
+	confidence_percent,
+	gemini_process,
+	get_ocr_settings,
+	mime_type_for_filename,
+	validate_upload_header,
+)
 
 # ---------------------------------------------------------------------------
 # _populate_ocr_import
@@ -423,3 +437,392 @@ class TestSelectTaxTemplate:
 		mock_frappe.get_cached_doc.return_value = SimpleNamespace(taxes=rows)
 		# Net anchor 0 → can't classify → default template (never import)
 		assert _select_tax_template(self._settings(), 1000.0, 150.0) == "1 - Standard VAT"
+
+
+# ---------------------------------------------------------------------------
+# get_ocr_settings — per-process TTL cache
+# ---------------------------------------------------------------------------
+
+
+class TestGetOcrSettings:
+	def test_reuses_snapshot_within_ttl(self, mock_frappe):
+		mock_frappe.get_cached_doc = MagicMock(return_value=SimpleNamespace(default_company="TC"))
+
+		assert get_ocr_settings() is get_ocr_settings()
+		mock_frappe.get_cached_doc.assert_called_once_with("OCR Settings")
+
+	def test_clear_forces_refetch(self, mock_frappe):
+		mock_frappe.get_cached_doc = MagicMock(side_effect=[SimpleNamespace(v=1), SimpleNamespace(v=2)])
+
+		assert get_ocr_settings().v == 1
+		clear_ocr_settings_cache()
+		assert get_ocr_settings().v == 2
+
+	def test_expired_snapshot_refetched(self, mock_frappe):
+		mock_frappe.get_cached_doc = MagicMock(side_effect=[SimpleNamespace(v=1), SimpleNamespace(v=2)])
+
+		with patch.object(erpocr_integration.api.time, "monotonic", return_value=1000.0):
+			assert get_ocr_settings().v == 1
+		with patch.object(
+			erpocr_integration.api.time,
+			"monotonic",
+			return_value=1000.0 + erpocr_integration.api._SETTINGS_TTL + 1,
+		):
+			assert get_ocr_settings().v == 2
+
+
+class TestExtractionConfig:
+	def test_applies_defaults_once(self, sample_settings):
+		sample_settings.matching_threshold = 0
+		sample_settings.default_item = "  Misc Expense  "
+
+		cfg = erpocr_integration.api._extraction_config(sample_settings)
+
+		assert cfg.matching_threshold == 80
+		assert cfg.default_item == "Misc Expense"
+		assert cfg.import_tax_template is None
+		assert cfg.default_company == "Test Company"
+
+
+# ---------------------------------------------------------------------------
+# validate_upload_header
+# ---------------------------------------------------------------------------
+
+
+class TestConfidencePercent:
+	@pytest.mark.parametrize(
+		"value,expected",
+		[(0.87, 87.0), ("0.5", 50.0), (1.4, 100.0), (-0.2, 0.0), (None, 0.0), ("n/a", 0.0), ([], 0.0)],
+	)
+	def test_scales_and_clamps(self, value, expected):
+		assert confidence_percent(value) == pytest.approx(expected)
+
+
+class TestMimeTypeForFilename:
+	@pytest.mark.parametrize(
+		"filename,expected",
+		[
+			("invoice.pdf", "application/pdf"),
+			("SCAN.JPEG", "image/jpeg"),
+			("photo.final.png", "image/png"),
+			("archive.tar.gz", None),
+			("noextension", None),
+			("", None),
+			(None, None),
+		],
+	)
+	def test_extension_lookup(self, filename, expected):
+		assert mime_type_for_filename(filename) == expected
+
+
+class TestValidateUploadHeader:
+	def test_reads_only_signature_and_rewinds(self):
+		stream = BytesIO(b"%PDF-1.7" + b"x" * 1000)
+
+		assert validate_upload_header(stream, "application/pdf") is True
+		assert stream.tell() == 0
+
+	def test_rejects_spoofed_extension(self):
+		stream = BytesIO(b"\x89PNG\r\n\x1a\n" + b"x" * 100)
+
+		assert validate_upload_header(stream, "application/pdf") is False
+		assert stream.tell() == 0
+
+	def test_unknown_mime_type_not_read(self):
+		stream = MagicMock()
+
+		assert validate_upload_header(stream, "text/plain") is True
+		stream.read.assert_not_called()
+
+
+# ---------------------------------------------------------------------------
+# gemini_process — record writes
+# ---------------------------------------------------------------------------
+
+
+class TestGeminiProcessWrites:
+	"""What gemini_process writes (and how) for single- and multi-invoice PDFs."""
+
+	def _invoice(self, n, line_items=()):
+		return {
+			"header_fields": {
+				"supplier_name": f"Supplier {n}",
+				"invoice_number": f"INV-00{n}",
+				"invoice_date": "2026-06-01",
+				"total_amount": 100.0 * n,
+				"tax_amount": 0,
+				"confidence": 0.9,
+			},
+			"line_items": list(line_items),
+			"raw_response": "{}",
+			"extraction_time": 1.0,
+		}
+
+	def _doc(self):
+		doc = MagicMock()
+		doc.items = []
+		doc.append = MagicMock(side_effect=lambda table, row: doc.items.append(SimpleNamespace(**row)))
+		doc.email_message_id = None
+		doc.drive_file_id = None
+		doc.drive_retry_count = 0
+		return doc
+
+	def _run(self, mock_frappe, sample_settings, invoice_list, extra_docs=(), on_extract=None):
+		placeholder = self._doc()
+		extra = list(extra_docs)
+
+		def get_doc_handler(arg, name=None):
+			if isinstance(arg, dict):
+				return extra.pop(0)
+			return placeholder
+
+		mock_frappe.get_cached_doc = MagicMock(return_value=sample_settings)
+		mock_frappe.db.get_value = MagicMock(return_value=None)
+		mock_frappe.get_doc = MagicMock(side_effect=get_doc_handler)
+		extract = MagicMock(return_value=invoice_list)
+		if on_extract:
+			extract.side_effect = lambda *args, **kwargs: on_extract() or invoice_list
+		with patch.object(erpocr_integration.tasks.gemini_extract, "extract_invoice_data", extract):
+			gemini_process(
+				pdf_content=b"%PDF-1.4 test",
+				filename="invoice.pdf",
+				ocr_import_name="OCR-IMP-001",
+				source_type="Gemini Manual Upload",
+				uploaded_by="user@example.com",
+			)
+		return placeholder
+
+	def test_links_still_validated_on_every_record(self, mock_frappe, sample_settings):
+		"""Cached settings/fuzzy matches can be stale — the write must keep link validation."""
+		second = self._doc()
+		placeholder = self._run(
+			mock_frappe, sample_settings, [self._invoice(1), self._invoice(2)], extra_docs=[second]
+		)
+
+		assert placeholder.flags.ignore_links is not True
+		assert second.flags.ignore_links is not True
+		placeholder.save.assert_called_once_with(ignore_permissions=True)
+		second.insert.assert_called_once_with(ignore_permissions=True)
+
+	def test_set_user_switches_to_uploader(self, mock_frappe, sample_settings):
+		mock_frappe.session.user = "Administrator"
+		self._run(mock_frappe, sample_settings, [self._invoice(1)])
+		mock_frappe.set_user.assert_called_once_with("user@example.com")
+
+	def test_set_user_skipped_when_already_uploader(self, mock_frappe, sample_settings):
+		"""Worker already running as the uploader → no set_user round-trip."""
+		mock_frappe.session.user = "user@example.com"
+		self._run(mock_frappe, sample_settings, [self._invoice(1)])
+		mock_frappe.set_user.assert_not_called()
+
+	def test_nothing_written_until_every_invoice_matched(self, mock_frappe, sample_settings):
+		"""Populate/match runs for all invoices before the first save."""
+		second = self._doc()
+		with patch.object(
+			erpocr_integration.api, "_run_matching", side_effect=[None, RuntimeError("matching failed")]
+		):
+			placeholder = self._run(
+				mock_frappe, sample_settings, [self._invoice(1), self._invoice(2)], extra_docs=[second]
+			)
+
+		placeholder.save.assert_not_called()
+		second.insert.assert_not_called()
+		mock_frappe.db.rollback.assert_called_once()
+
+	def test_sibling_record_copies_placeholder_source(self, mock_frappe, sample_settings):
+		second = self._doc()
+		placeholder = self._doc()
+		placeholder.email_message_id = "<msg@example.com>"
+		placeholder.drive_file_id = "drive-1"
+		placeholder.drive_retry_count = 2
+		mock_frappe.get_doc = MagicMock(return_value=second)
+
+		doc = erpocr_integration.api._new_ocr_import_doc(
+			placeholder, "scan.pdf", "Gemini Drive Scan", None, sample_settings
+		)
+
+		assert doc is second
+		fields = mock_frappe.get_doc.call_args.args[0]
+		assert fields["email_message_id"] == "<msg@example.com>"
+		assert fields["drive_file_id"] == "drive-1"
+		assert fields["drive_retry_count"] == 2
+		assert fields["status"] == "Pending"
+
+	def test_single_invoice_commits_once(self, mock_frappe, sample_settings):
+		"""The placeholder is already Pending — no status write or commit before extraction."""
+		self._run(mock_frappe, sample_settings, [self._invoice(1)])
+
+		mock_frappe.db.set_value.assert_not_called()
+		mock_frappe.db.commit.assert_called_once()
+
+	def test_placeholder_loaded_once(self, mock_frappe, sample_settings):
+		"""drive_file_id comes off the loaded placeholder — no separate get_value."""
+		self._run(mock_frappe, sample_settings, [self._invoice(1)])
+
+		assert mock_frappe.get_doc.call_args_list.count((("OCR Import", "OCR-IMP-001"),)) == 1
+		assert not [c for c in mock_frappe.db.get_value.call_args_list if c.args[0] == "OCR Import"]
+
+	def test_drive_download_falls_back_to_attachment(self, mock_frappe, sample_settings):
+		"""Retry jobs try Drive first, then the local File attachment."""
+		placeholder = self._doc()
+		file_doc = MagicMock()
+		file_doc.get_content.return_value = b"%PDF-1.4 local copy"
+		mock_frappe.get_cached_doc = MagicMock(return_value=sample_settings)
+		mock_frappe.get_doc = MagicMock(
+			side_effect=lambda dt, name=None: file_doc if dt == "File" else placeholder
+		)
+
+		with (
+			patch.object(
+				erpocr_integration.tasks.drive_integration, "download_file_from_drive", return_value=None
+			) as download,
+			patch.object(
+				erpocr_integration.tasks.gemini_extract,
+				"extract_invoice_data",
+				return_value=[self._invoice(1)],
+			) as extract,
+		):
+			gemini_process(
+				pdf_content=None,
+				filename="invoice.pdf",
+				ocr_import_name="OCR-IMP-001",
+				file_doc_name="FILE-001",
+				drive_file_id="drive-1",
+			)
+
+		download.assert_called_once_with("drive-1")
+		assert extract.call_args.args[0] == b"%PDF-1.4 local copy"
+
+	def test_text_layer_sent_when_enabled(self, mock_frappe, sample_settings):
+		"""With the setting on, born-digital PDFs go to Gemini as text."""
+		sample_settings.use_pdf_text_layer = 1
+		with (
+			patch.object(
+				erpocr_integration.tasks.gemini_extract, "extract_pdf_text", return_value="invoice text"
+			),
+			patch.object(
+				erpocr_integration.tasks.gemini_extract,
+				"extract_invoice_data",
+				return_value=[self._invoice(1)],
+			) as extract,
+		):
+			mock_frappe.get_cached_doc = MagicMock(return_value=sample_settings)
+			mock_frappe.db.get_value = MagicMock(return_value=None)
+			mock_frappe.get_doc = MagicMock(return_value=self._doc())
+			gemini_process(
+				pdf_content=b"%PDF-1.4 test",
+				filename="invoice.pdf",
+				ocr_import_name="OCR-IMP-001",
+				source_type="Gemini Manual Upload",
+			)
+
+		assert extract.call_args.kwargs["text_content"] == "invoice text"
+
+	def test_text_layer_not_read_by_default(self, mock_frappe, sample_settings):
+		with patch.object(erpocr_integration.tasks.gemini_extract, "extract_pdf_text") as extract_text:
+			self._run(mock_frappe, sample_settings, [self._invoice(1)])
+
+		extract_text.assert_not_called()
+
+	def test_reads_content_from_file_attachment(self, mock_frappe, sample_settings):
+		"""Manual uploads enqueue a File name; the job loads the bytes itself."""
+		placeholder = self._doc()
+		file_doc = MagicMock()
+		file_doc.get_content.return_value = b"%PDF-1.4 from disk"
+		mock_frappe.get_cached_doc = MagicMock(return_value=sample_settings)
+		mock_frappe.get_doc = MagicMock(
+			side_effect=lambda dt, name=None: file_doc if dt == "File" else placeholder
+		)
+
+		with patch.object(
+			erpocr_integration.tasks.gemini_extract,
+			"extract_invoice_data",
+			return_value=[self._invoice(1)],
+		) as extract:
+			gemini_process(
+				pdf_content=None,
+				filename="invoice.pdf",
+				ocr_import_name="OCR-IMP-001",
+				file_doc_name="FILE-0001",
+			)
+
+		mock_frappe.get_doc.assert_any_call("File", "FILE-0001")
+		assert extract.call_args.args[0] == b"%PDF-1.4 from disk"
+
+	def test_archive_info_written_with_one_update(self, mock_frappe, sample_settings):
+		"""Every OCR Import from a scanned PDF gets the archive link in a single UPDATE."""
+		archived = {"file_id": "drive-1", "shareable_link": "https://drive/x", "folder_path": "2026/06"}
+		placeholder = self._doc()
+		placeholder.drive_file_id = "drive-1"
+		extra = [self._doc()]
+		mock_frappe.get_cached_doc = MagicMock(return_value=sample_settings)
+		mock_frappe.get_doc = MagicMock(
+			side_effect=lambda arg, name=None: extra.pop(0) if isinstance(arg, dict) else placeholder
+		)
+
+		with (
+			patch.object(
+				erpocr_integration.tasks.gemini_extract,
+				"extract_invoice_data",
+				return_value=[self._invoice(1), self._invoice(2)],
+			),
+			patch.object(
+				erpocr_integration.tasks.drive_integration, "move_file_to_archive", return_value=archived
+			),
+		):
+			gemini_process(
+				pdf_content=b"%PDF-1.4 test",
+				filename="scan.pdf",
+				ocr_import_name="OCR-IMP-001",
+				source_type="Gemini Drive Scan",
+			)
+
+		mock_frappe.db.set_value.assert_called_once_with(
+			"OCR Import",
+			{"drive_file_id": "drive-1"},
+			{"drive_link": "https://drive/x", "drive_folder_path": "2026/06"},
+		)
+		assert not [
+			c
+			for c in mock_frappe.get_all.call_args_list
+			if "drive_file_id" in (c.kwargs.get("filters") or {})
+		]
+
+	def test_progress_batched_into_two_frames(self, mock_frappe, sample_settings):
+		"""Extracting goes out before Gemini is called; Processing rides with the terminal stage."""
+		mock_frappe.publish_realtime = MagicMock()
+		published_before_gemini = []
+		self._run(
+			mock_frappe,
+			sample_settings,
+			[self._invoice(1)],
+			on_extract=lambda: published_before_gemini.append(mock_frappe.publish_realtime.call_count),
+		)
+
+		frames = [c.kwargs["message"] for c in mock_frappe.publish_realtime.call_args_list]
+		assert published_before_gemini == [1]
+		assert len(frames) == 2
+		assert [e["status"] for e in frames[0]["events"]] == ["Extracting"]
+		assert frames[1]["events"][0]["status"] == "Processing"
+		assert frames[1]["status"] == frames[1]["events"][-1]["status"]  # top level mirrors the latest
+		assert len(frames[1]["events"]) == 2
+		assert all(f["ocr_import"] == "OCR-IMP-001" for f in frames)
+
+	def test_failure_flushes_pending_stages_with_error(self, mock_frappe, sample_settings):
+		mock_frappe.publish_realtime = MagicMock()
+		mock_frappe.get_cached_doc = MagicMock(return_value=sample_settings)
+		with patch.object(
+			erpocr_integration.tasks.gemini_extract,
+			"extract_invoice_data",
+			side_effect=Exception("Gemini down"),
+		):
+			gemini_process(
+				pdf_content=b"%PDF-1.4 test",
+				filename="invoice.pdf",
+				ocr_import_name="OCR-IMP-001",
+				uploaded_by="user@example.com",
+			)
+
+		frames = [c.kwargs["message"] for c in mock_frappe.publish_realtime.call_args_list]
+		assert [[e["status"] for e in f["events"]] for f in frames] == [["Extracting"], ["Error"]]
+		assert frames[1]["status"] == "Error"
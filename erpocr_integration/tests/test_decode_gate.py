@@ -76,10 +76,11 @@ class TestUploadPdfDecodeGate:
 
 		mock_frappe.request = MagicMock()
 		mock_frappe.request.files = {"file": mock_file}
+		mock_frappe.request.content_length = len(content) + 200
 		mock_frappe.has_permission = MagicMock(return_value=True)
 		mock_frappe.session.user = "test@example.com"
-		mock_frappe.db.count.return_value = 0
-		mock_frappe.get_single = MagicMock(return_value=sample_settings)
+		mock_frappe.get_all = MagicMock(return_value=[])
+		mock_frappe.get_cached_doc = MagicMock(return_value=sample_settings)
 
 		placeholder = MagicMock()
 		placeholder.name = "OCR-IMP-001"
@@ -42,7 +42,13 @@ def _make_ocr_dn(**overrides):
 	doc.items = []
 	doc.save = MagicMock()
 	doc.reload = MagicMock()
-	doc.db_set = MagicMock()
+
+	def _db_set(field, value=None, **kwargs):
+		# Like Document.db_set: the values land on the in-memory doc too
+		for key, val in (field if isinstance(field, dict) else {field: value}).items():
+			setattr(doc, key, val)
+
+	doc.db_set = MagicMock(side_effect=_db_set)
 	doc.has_value_changed = MagicMock(return_value=False)
 
 	for key, value in overrides.items():
@@ -223,6 +229,23 @@ class TestCreatePurchaseOrder:
 		assert doc.purchase_order_result == "PO-00001"
 		assert doc.status == "Draft Created"
 		mock_po.insert.assert_called_once()
+		# Link + status written in one db_set, not a full re-save
+		doc.db_set.assert_called_once_with({"purchase_order_result": "PO-00001", "status": "Draft Created"})
+		doc.save.assert_not_called()
+
+	@pytest.mark.parametrize(
+		"document_type, method",
+		[
+			("Purchase Order", "create_purchase_order"),
+			("Purchase Receipt", "create_purchase_receipt"),
+		],
+	)
+	def test_missing_supplier_fails_before_row_lock(self, mock_frappe, document_type, method):
+		doc = _make_ocr_dn(status="Matched", document_type=document_type, supplier=None)
+		mock_frappe.db.get_value.reset_mock()
+		with pytest.raises(Exception):
+			getattr(doc, method)()
+		mock_frappe.db.get_value.assert_not_called()
 
 	def test_delivery_date_propagates_to_header_and_included_items(self, mock_frappe):
 		"""Reviewed delivery date drives every required-by date; unmatched rows stay excluded."""
@@ -568,22 +591,23 @@ class TestCreatePurchaseReceipt:
 				return SimpleNamespace(purchase_order_result=None, purchase_receipt=None)
 			if doctype == "Purchase Order Item":
 				return 100.0  # PO rate
-			if doctype == "Item" and fields == "is_stock_item":
-				return 1
 			if doctype == "Item":
 				return SimpleNamespace(last_purchase_rate=50, standard_rate=60)
 			return None
 
+		def get_all_side_effect(doctype, **kw):
+			if doctype == "Item":
+				return ["SR-12-6"]  # is_stock_item
+			# Return PO items for the fallback lookup
+			return [SimpleNamespace(name="poi-auto-001", item_code="SR-12-6")]
+
 		mock_frappe.db.get_value.side_effect = db_get_value_side_effect
 		mock_frappe.get_cached_doc.return_value = SimpleNamespace(
 			dn_default_warehouse="",
 			default_warehouse="",
 			get=lambda k, d=None: d,
 		)
-		# Return PO items for the fallback lookup
-		mock_frappe.get_all.return_value = [
-			SimpleNamespace(name="poi-auto-001", item_code="SR-12-6"),
-		]
+		mock_frappe.get_all.side_effect = get_all_side_effect
 
 		items = [
 			_make_dn_item(
@@ -742,7 +766,7 @@ class TestAliases:
 			supplier="Acme Ltd",
 		)
 		doc.has_value_changed.return_value = True
-		mock_frappe.db.exists.return_value = False
+		mock_frappe.db.exists.reset_mock()
 
 		doc.on_update()
 
@@ -751,6 +775,11 @@ class TestAliases:
 		assert call_args["doctype"] == "OCR Supplier Alias"
 		assert call_args["ocr_text"] == "Acme OCR"
 		assert call_args["supplier"] == "Acme Ltd"
+		# Existing alias is left alone by the INSERT itself, not a prior exists()
+		mock_frappe.get_doc.return_value.insert.assert_called_once_with(
+			ignore_permissions=True, ignore_if_duplicate=True
+		)
+		mock_frappe.db.exists.assert_not_called()
 
 	def test_skips_alias_when_not_confirmed(self, mock_frappe):
 		"""Does not save alias when match status is not Confirmed."""
@@ -781,6 +810,35 @@ class TestAliases:
 		call_args = mock_frappe.get_doc.call_args[0][0]
 		assert call_args["doctype"] == "OCR Item Alias"
 
+	def test_item_aliases_checked_in_one_query(self, mock_frappe):
+		"""Existing aliases are found with one get_all; only new texts are inserted."""
+		items = [
+			_make_dn_item(item_code="SR-12-6", description_ocr="Steel Rod 12mm", match_status="Confirmed"),
+			_make_dn_item(item_code="SR-16-6", description_ocr="Steel Rod 16mm", match_status="Confirmed"),
+			_make_dn_item(item_code="SR-16-6", description_ocr="steel rod 16mm", match_status="Confirmed"),
+		]
+		doc = _make_ocr_dn(supplier="Acme Ltd", supplier_match_status="Auto Matched", items=items)
+		doc.has_value_changed.return_value = False
+		mock_frappe.get_all.return_value = ["STEEL ROD 12MM"]
+
+		doc.on_update()
+
+		mock_frappe.get_all.assert_called_once()
+		assert mock_frappe.get_all.call_args.kwargs["filters"] == {
+			"ocr_text": ["in", ["Steel Rod 12mm", "Steel Rod 16mm"]],
+			"supplier": "Acme Ltd",
+		}
+		inserted = [c.args[0] for c in mock_frappe.get_doc.call_args_list]
+		assert inserted == [
+			{
+				"doctype": "OCR Item Alias",
+				"ocr_text": "Steel Rod 16mm",
+				"supplier": "Acme Ltd",
+				"item_code": "SR-16-6",
+				"source": "Auto",
+			}
+		]
+
 
 # ---------------------------------------------------------------------------
 # TestCopyScanToDocument
@@ -11,6 +11,7 @@ from erpocr_integration.tasks.email_monitor import (
 	_decode_header_value,
 	_extract_pdfs_from_email,
 	_imap_copy_and_delete,
+	_is_supported_attachment,
 	_move_to_processed_folder,
 )
 
@@ -150,6 +151,20 @@ class TestExtractPdfsFromEmail:
 		assert len(pdfs) >= 0  # May or may not work depending on email structure
 
 
+class TestIsSupportedAttachment:
+	"""Generic content types fall back to the shared extension lookup."""
+
+	@pytest.mark.parametrize(
+		"filename, expected",
+		[("Scan.PDF", True), ("photo.jpeg", True), ("notes.txt", False), ("noext", False), (None, False)],
+	)
+	def test_octet_stream_uses_extension(self, filename, expected):
+		assert _is_supported_attachment("application/octet-stream", filename) is expected
+
+	def test_supported_content_type_wins(self):
+		assert _is_supported_attachment("image/png", None) is True
+
+
 # ---------------------------------------------------------------------------
 # _decode_header_value
 # ---------------------------------------------------------------------------
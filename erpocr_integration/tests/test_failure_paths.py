@@ -30,10 +30,11 @@ class TestUploadPdfEnqueueFailure:
 
 		mock_frappe.request = MagicMock()
 		mock_frappe.request.files = {"file": mock_file}
+		mock_frappe.request.content_length = 1200
 		mock_frappe.has_permission = MagicMock(return_value=True)
 		mock_frappe.session.user = "test@example.com"
-		mock_frappe.db.count.return_value = 0  # no pending imports
-		mock_frappe.get_single = MagicMock(return_value=sample_settings)
+		mock_frappe.get_all = MagicMock(return_value=[])  # no pending imports
+		mock_frappe.get_cached_doc = MagicMock(return_value=sample_settings)
 
 		placeholder = MagicMock()
 		placeholder.name = "OCR-IMP-001"
@@ -66,6 +67,65 @@ class TestUploadPdfEnqueueFailure:
 		# set_value should NOT have been called with Error status
 		mock_frappe.db.set_value.assert_not_called()
 
+	def test_enqueues_file_reference_not_bytes(self, mock_frappe, sample_settings):
+		"""The job payload names the saved File attachment instead of carrying the upload."""
+		placeholder = self._setup_upload_mocks(mock_frappe, sample_settings)
+
+		erpocr_integration.api.upload_pdf()
+
+		kwargs = mock_frappe.enqueue.call_args.kwargs
+		assert kwargs["pdf_content"] is None
+		assert kwargs["file_doc_name"] == placeholder.insert.return_value.name
+
+	def test_placeholder_and_file_committed_together(self, mock_frappe, sample_settings):
+		"""Placeholder + File insert share one commit, made before the job is enqueued."""
+		self._setup_upload_mocks(mock_frappe, sample_settings)
+		order = []
+		mock_frappe.db.commit = MagicMock(side_effect=lambda: order.append("commit"))
+		mock_frappe.enqueue = MagicMock(side_effect=lambda *a, **kw: order.append("enqueue"))
+
+		erpocr_integration.api.upload_pdf()
+
+		assert order == ["commit", "enqueue"]
+
+	def test_oversized_content_length_rejected_before_reading(self, mock_frappe, sample_settings):
+		"""A body over the limit is refused from the header — no DB query, no read."""
+		self._setup_upload_mocks(mock_frappe, sample_settings)
+		mock_frappe.request.content_length = 25 * 1024 * 1024
+		mock_file = mock_frappe.request.files["file"]
+
+		with pytest.raises(Exception):
+			erpocr_integration.api.upload_pdf()
+
+		mock_frappe.get_all.assert_not_called()
+		mock_file.read.assert_not_called()
+		mock_frappe.enqueue.assert_not_called()
+
+	def test_pending_limit_query_stops_at_cap(self, mock_frappe, sample_settings):
+		"""The pending check fetches at most MAX_PENDING_PER_USER rows and rejects at the cap."""
+		self._setup_upload_mocks(mock_frappe, sample_settings)
+		cap = erpocr_integration.api.MAX_PENDING_PER_USER
+		mock_frappe.get_all.return_value = [f"OCR-IMP-{i}" for i in range(cap)]
+
+		with pytest.raises(Exception):
+			erpocr_integration.api.upload_pdf()
+
+		kwargs = mock_frappe.get_all.call_args[1]
+		assert kwargs["limit"] == cap
+		assert kwargs["filters"] == {"status": "Pending", "uploaded_by": "test@example.com"}
+		mock_frappe.enqueue.assert_not_called()
+
+	def test_chunked_upload_falls_back_to_file_size(self, mock_frappe, sample_settings):
+		"""No Content-Length (chunked transfer) — the per-file size check still applies."""
+		self._setup_upload_mocks(mock_frappe, sample_settings)
+		mock_frappe.request.content_length = None
+		mock_frappe.request.files["file"].tell.return_value = 11 * 1024 * 1024
+
+		with pytest.raises(Exception):
+			erpocr_integration.api.upload_pdf()
+
+		mock_frappe.enqueue.assert_not_called()
+
 
 # ---------------------------------------------------------------------------
 # 2. Email enqueue failure + stale Pending prevention (email_monitor.py)
@@ -221,6 +281,127 @@ class TestDriveScanDedup:
 		)
 		mock_frappe.enqueue.assert_called_once()
 
+	def test_retry_deletes_share_the_placeholder_commit(self, mock_frappe, sample_settings):
+		"""Clearing the failed rows is not committed on its own — one commit, then enqueue."""
+		order = []
+		mock_frappe.get_all = MagicMock(
+			side_effect=lambda doctype, **kw: (
+				[SimpleNamespace(name="OCR-IMP-E1", status="Error")] if doctype == "OCR Import" else []
+			)
+		)
+		mock_frappe.delete_doc = MagicMock(side_effect=lambda *a, **kw: order.append("delete"))
+		mock_frappe.db.commit = MagicMock(side_effect=lambda: order.append("commit"))
+		mock_frappe.enqueue = MagicMock(side_effect=lambda *a, **kw: order.append("enqueue"))
+		mock_frappe.get_doc = MagicMock(return_value=MagicMock())
+
+		with patch.object(
+			erpocr_integration.tasks.drive_integration,
+			"_download_file",
+			side_effect=lambda *a: order.append("download") or b"%PDF-1.4 x",
+		):
+			erpocr_integration.tasks.drive_integration._process_scan_file(
+				MagicMock(), {"id": "drive-retry-2", "name": "retry.pdf"}, sample_settings
+			)
+
+		# Deleted only after the download, so the row locks are not held across it
+		assert order == ["download", "delete", "commit", "enqueue"]
+
+	def test_retry_deletes_ride_the_error_placeholder(self, mock_frappe, sample_settings):
+		"""A retry that fails again swaps the old Error rows for the new one in one commit."""
+		order = []
+		mock_frappe.get_all = MagicMock(
+			side_effect=lambda doctype, **kw: (
+				[SimpleNamespace(name="OCR-IMP-E1", status="Error", drive_retry_count=1)]
+				if doctype == "OCR Import"
+				else []
+			)
+		)
+		mock_frappe.delete_doc = MagicMock(side_effect=lambda *a, **kw: order.append("delete"))
+		mock_frappe.db.commit = MagicMock(side_effect=lambda: order.append("commit"))
+		placeholder = MagicMock()
+		placeholder.insert = MagicMock(side_effect=lambda **kw: order.append("insert"))
+		mock_frappe.get_doc = MagicMock(return_value=placeholder)
+
+		with patch.object(erpocr_integration.tasks.drive_integration, "_download_file", return_value=b""):
+			erpocr_integration.tasks.drive_integration._process_scan_file(
+				MagicMock(), {"id": "drive-retry-3", "name": "retry.pdf"}, sample_settings
+			)
+
+		assert order == ["delete", "insert", "commit"]
+		assert mock_frappe.get_doc.call_args[0][0]["drive_retry_count"] == 2
+
+	def test_failed_error_placeholder_keeps_the_old_rows(self, mock_frappe, sample_settings):
+		"""If the replacement Error placeholder cannot be written, the stale-row deletes are undone."""
+		order = []
+		mock_frappe.db.commit = MagicMock(side_effect=lambda: order.append("commit"))
+		mock_frappe.delete_doc = MagicMock(side_effect=lambda *a, **kw: order.append("delete"))
+		placeholder = MagicMock()
+		placeholder.insert = MagicMock(side_effect=Exception("insert failed"))
+		mock_frappe.get_doc = MagicMock(return_value=placeholder)
+
+		with (
+			patch.object(
+				mock_frappe.db, "savepoint", side_effect=lambda name: order.append(f"savepoint:{name}")
+			),
+			patch.object(mock_frappe.db, "rollback", side_effect=lambda **kw: order.append(f"rollback:{kw}")),
+		):
+			erpocr_integration.tasks.drive_integration._record_drive_scan_failure(
+				doctype="OCR Import",
+				drive_file_id="drive-x",
+				filename="x.pdf",
+				retry_count=2,
+				settings=sample_settings,
+				error_title="Drive Scan Error",
+				error_message="Empty content",
+				stale_rows=[("OCR Import", "OCR-IMP-E1")],
+			)
+
+		assert order == [
+			"savepoint:drive_scan_failure",
+			"delete",
+			"rollback:{'save_point': 'drive_scan_failure'}",
+			"commit",
+		]
+
+	def test_failed_pending_placeholder_rolls_back_the_deletes(self, mock_frappe):
+		"""_claim_drive_file undoes the stale-row deletes when the placeholder insert fails."""
+		placeholder = MagicMock()
+		placeholder.insert = MagicMock(side_effect=Exception("insert failed"))
+		mock_frappe.db.commit.reset_mock()
+
+		with patch.object(mock_frappe.db, "rollback") as rollback, pytest.raises(Exception):
+			erpocr_integration.tasks.drive_integration._claim_drive_file(
+				placeholder, "drive-x", "x.pdf", ("OCR Import",), [("OCR Import", "OCR-IMP-E1")]
+			)
+
+		rollback.assert_called_once_with()
+		mock_frappe.db.commit.assert_not_called()
+
+	def test_file_claimed_since_listing_is_skipped(self, mock_frappe, sample_settings):
+		"""Stale batch snapshot says new, but another run inserted a row since — no duplicate."""
+		mock_frappe.db.exists = MagicMock(return_value=True)
+		mock_frappe.db.rollback = MagicMock()
+		placeholder = MagicMock()
+		mock_frappe.get_doc = MagicMock(return_value=placeholder)
+		mock_frappe.enqueue = MagicMock()
+
+		with patch.object(
+			erpocr_integration.tasks.drive_integration, "_download_file", return_value=b"%PDF-1.4 x"
+		):
+			result = erpocr_integration.tasks.drive_integration._process_scan_file(
+				MagicMock(),
+				{"id": "drive-raced", "name": "raced.pdf"},
+				sample_settings,
+				existing_rows=[],
+				existing_statements=[],
+			)
+
+		assert result is False
+		mock_frappe.db.exists.assert_called_with("OCR Import", {"drive_file_id": "drive-raced"})
+		mock_frappe.db.rollback.assert_called_once()
+		placeholder.insert.assert_not_called()
+		mock_frappe.enqueue.assert_not_called()
+
 	def test_retry_cap_stops_infinite_retries(self, mock_frappe, sample_settings):
 		"""After MAX_DRIVE_RETRIES failures, stop retrying and don't delete records."""
 		service = MagicMock()
@@ -317,6 +498,50 @@ class TestDriveScanDedup:
 		assert placeholder_kwargs["doctype"] == "OCR Import"
 		placeholder.insert.assert_called_once_with(ignore_permissions=True)
 
+	def test_scan_listing_pages_oldest_first(self):
+		"""Scan listing asks for full 1000-row pages, oldest file first, and follows the token."""
+		service = MagicMock()
+		service.files.return_value.list.return_value.execute.side_effect = [
+			{"files": [{"id": "a"}], "nextPageToken": "p2"},
+			{"files": [{"id": "b"}]},
+		]
+
+		files = erpocr_integration.tasks.drive_integration._list_pdf_files(service, "scan-folder")
+
+		assert [f["id"] for f in files] == ["a", "b"]
+		kwargs = service.files.return_value.list.call_args.kwargs
+		assert kwargs["pageSize"] == 1000
+		assert kwargs["orderBy"] == "createdTime"
+		assert kwargs["pageToken"] == "p2"
+
+	def test_poll_prefetches_dedup_rows_once_per_doctype(self, mock_frappe, sample_settings):
+		"""The poller reads dedup rows for the whole batch in one query per doctype."""
+		drive = erpocr_integration.tasks.drive_integration
+		sample_settings.drive_integration_enabled = True
+		sample_settings.drive_scan_folder_id = "scan-folder"
+		sample_settings.get_password = MagicMock(return_value='{"type": "service_account"}')
+		mock_frappe.get_single = MagicMock(return_value=sample_settings)
+		files = [{"id": f"drive-{i}", "name": f"inv-{i}.pdf"} for i in range(3)]
+
+		def _get_all(doctype, **kwargs):
+			if doctype == "OCR Import":
+				return [SimpleNamespace(name="OCR-IMP-1", status="Completed", drive_file_id="drive-1")]
+			return []
+
+		mock_frappe.get_all = MagicMock(side_effect=_get_all)
+
+		with (
+			patch.object(drive, "_get_drive_service", return_value=MagicMock()),
+			patch.object(drive, "_list_pdf_files", return_value=files),
+			patch.object(drive, "_process_scan_file", return_value=False) as process,
+		):
+			drive.poll_drive_scan_folder()
+
+		assert mock_frappe.get_all.call_count == 2
+		rows = [c.kwargs["existing_rows"] for c in process.call_args_list]
+		assert [len(r) for r in rows] == [0, 1, 0]
+		assert all(c.kwargs["existing_statements"] == [] for c in process.call_args_list)
+
 
 # ---------------------------------------------------------------------------
 # 4. Archive move failure path (api.py / drive_integration.py)
@@ -356,10 +581,10 @@ class TestArchiveMoveFailure:
 				side_effect=Exception("Drive API timeout"),
 			),
 		):
-			mock_frappe.db.get_value = MagicMock(return_value="existing-drive-id")
 			mock_frappe.get_cached_doc = MagicMock(return_value=sample_settings)
 
 			placeholder = MagicMock()
+			placeholder.drive_file_id = "existing-drive-id"
 			placeholder.items = []
 			placeholder.append = MagicMock(
 				side_effect=lambda table, row: placeholder.items.append(SimpleNamespace(**row))
@@ -449,7 +674,7 @@ class TestRetryGeminiExtraction:
 			source_type="Gemini Manual Upload",
 			drive_file_id="drive-123",
 		)
-		mock_frappe.get_doc = MagicMock(return_value=doc)
+		mock_frappe.db.get_value = MagicMock(return_value=doc)
 
 		with pytest.raises(Exception):
 			erpocr_integration.api.retry_gemini_extraction("OCR-IMP-001")
@@ -464,7 +689,7 @@ class TestRetryGeminiExtraction:
 			source_type="Manual Entry",
 			drive_file_id="drive-123",
 		)
-		mock_frappe.get_doc = MagicMock(return_value=doc)
+		mock_frappe.db.get_value = MagicMock(return_value=doc)
 
 		with pytest.raises(Exception):
 			erpocr_integration.api.retry_gemini_extraction("OCR-IMP-002")
@@ -486,11 +711,15 @@ class TestRetryGeminiExtraction:
 			source_type="Gemini Manual Upload",
 			drive_file_id=None,
 		)
-		mock_frappe.get_doc = MagicMock(return_value=doc)
+		mock_frappe.db.get_value = MagicMock(return_value=doc)
+		mock_frappe.get_all.return_value = []  # no local attachment either
 
 		with pytest.raises(Exception):
 			erpocr_integration.api.retry_gemini_extraction("OCR-IMP-004")
 
+		mock_frappe.throw.assert_called()
+		mock_frappe.enqueue.assert_not_called()
+
 	def test_accepts_all_gemini_source_types(self, mock_frappe):
 		"""All three Gemini source types should be accepted for retry."""
 		for source_type in ("Gemini Manual Upload", "Gemini Email", "Gemini Drive Scan"):
@@ -504,9 +733,8 @@ class TestRetryGeminiExtraction:
 				source_type=source_type,
 				drive_file_id="drive-123",
 				source_filename="test.pdf",
-				db_set=MagicMock(),
 			)
-			mock_frappe.get_doc = MagicMock(return_value=doc)
+			mock_frappe.db.get_value = MagicMock(return_value=doc)
 
 			with patch.object(
 				erpocr_integration.tasks.drive_integration,
@@ -529,30 +757,94 @@ class TestRetryGeminiExtraction:
 			source_type="Gemini Email",
 			drive_file_id=None,
 			source_filename="invoice.pdf",
-			db_set=MagicMock(),
 		)
 
-		def get_doc_side_effect(doctype, name=None):
-			if doctype == "OCR Import":
-				return doc
-			if doctype == "File":
-				return mock_file
-			return MagicMock()
-
-		mock_frappe.get_doc.side_effect = get_doc_side_effect
+		mock_frappe.db.get_value = MagicMock(return_value=doc)
+		mock_frappe.get_doc = MagicMock(return_value=mock_file)
 		mock_frappe.get_all.return_value = [
 			SimpleNamespace(name="FILE-001", file_url="/private/files/invoice.pdf")
 		]
-		mock_frappe.db.count.return_value = 0
 		mock_frappe.enqueue = MagicMock()
 
 		result = erpocr_integration.api.retry_gemini_extraction("OCR-IMP-EMAIL")
 
 		mock_frappe.enqueue.assert_called_once()
 		call_kwargs = mock_frappe.enqueue.call_args[1]
-		assert call_kwargs["pdf_content"] == b"%PDF-1.4 email pdf"
+		assert call_kwargs["pdf_content"] is None
+		assert call_kwargs["file_doc_name"] == "FILE-001"
+		mock_file.get_content.assert_not_called()  # read happens in the job, not the request
 		assert result is not None
 
+	def test_retry_commits_once_before_enqueue(self, mock_frappe):
+		"""Status reset + item purge share one commit, made before the job is enqueued."""
+		doc = SimpleNamespace(
+			name="OCR-IMP-ONE",
+			status="Error",
+			source_type="Gemini Manual Upload",
+			drive_file_id=None,
+			source_filename="invoice.pdf",
+		)
+		mock_frappe.db.get_value = MagicMock(return_value=doc)
+		mock_frappe.get_all.return_value = [SimpleNamespace(name="FILE-001", file_url="/private/files/x.pdf")]
+		order = []
+		mock_frappe.db.commit = MagicMock(side_effect=lambda: order.append("commit"))
+		mock_frappe.enqueue = MagicMock(side_effect=lambda *a, **kw: order.append("enqueue"))
+
+		erpocr_integration.api.retry_gemini_extraction("OCR-IMP-ONE")
+
+		assert order == ["commit", "enqueue"]
+
+	def test_retry_reads_header_fields_without_loading_doc(self, mock_frappe):
+		"""The retry never loads the full OCR Import (and its items table)."""
+		doc = SimpleNamespace(
+			name="OCR-IMP-HDR",
+			status="Error",
+			source_type="Gemini Manual Upload",
+			drive_file_id=None,
+			source_filename="invoice.pdf",
+		)
+		mock_frappe.db.get_value = MagicMock(return_value=doc)
+		mock_frappe.get_doc = MagicMock()
+		mock_frappe.get_all.return_value = [SimpleNamespace(name="FILE-001", file_url="/private/files/x.pdf")]
+		mock_frappe.enqueue = MagicMock()
+
+		erpocr_integration.api.retry_gemini_extraction("OCR-IMP-HDR")
+
+		mock_frappe.get_doc.assert_not_called()
+		reset = mock_frappe.db.set_value.call_args_list[-1][0]
+		assert reset[:2] == ("OCR Import", "OCR-IMP-HDR")
+		assert reset[2]["status"] == "Pending"
+
+	def test_retry_missing_record_throws(self, mock_frappe):
+		mock_frappe.db.get_value = MagicMock(return_value=None)
+		mock_frappe.enqueue = MagicMock()
+
+		with pytest.raises(Exception):
+			erpocr_integration.api.retry_gemini_extraction("OCR-IMP-GONE")
+
+		mock_frappe.enqueue.assert_not_called()
+
+	def test_retries_drive_origin_without_downloading(self, mock_frappe):
+		"""Drive-backed retries enqueue the file ID; the worker does the download."""
+		doc = SimpleNamespace(
+			name="OCR-IMP-DRIVE",
+			status="Error",
+			source_type="Gemini Drive Scan",
+			drive_file_id="drive-123",
+			source_filename="scan.pdf",
+		)
+		mock_frappe.db.get_value = MagicMock(return_value=doc)
+		mock_frappe.get_all.return_value = []
+		mock_frappe.enqueue = MagicMock()
+
+		with patch.object(erpocr_integration.tasks.drive_integration, "download_file_from_drive") as download:
+			erpocr_integration.api.retry_gemini_extraction("OCR-IMP-DRIVE")
+
+		download.assert_not_called()
+		call_kwargs = mock_frappe.enqueue.call_args[1]
+		assert call_kwargs["drive_file_id"] == "drive-123"
+		assert call_kwargs["file_doc_name"] is None
+
 
 # ---------------------------------------------------------------------------
 # 6. Multi-invoice partial failure → rollback (api.py, live-review C1 / roadmap C1-2)
@@ -718,3 +1010,192 @@ class TestDriveConnectionTest:
 		# metadata is not attached at runtime. Assert against module source.
 		mod_src = inspect.getsource(erpocr_integration.tasks.drive_integration).replace("\r\n", "\n")
 		assert '@frappe.whitelist(methods=["POST"])\ndef test_drive_connection' in mod_src
+
+
+# ---------------------------------------------------------------------------
+# 7. Drive service reuse — a bad key is never cached (drive_integration.py)
+# ---------------------------------------------------------------------------
+
+
+class TestDriveServiceCache:
+	"""_get_drive_service builds once per key; failures are not memoised. Settings
+	and the decrypted key are read once per request."""
+
+	def test_same_key_builds_once(self):
+		drive = erpocr_integration.tasks.drive_integration
+		with patch.object(drive, "build", return_value=MagicMock()) as build:
+			first = drive._get_drive_service('{"type": "service_account"}')
+			second = drive._get_drive_service('{"type": "service_account"}')
+
+		assert first is second
+		build.assert_called_once()
+
+	def test_rotated_key_builds_fresh_service(self):
+		drive = erpocr_integration.tasks.drive_integration
+		with patch.object(drive, "build", side_effect=[MagicMock(), MagicMock()]) as build:
+			first = drive._get_drive_service('{"type": "service_account", "v": 1}')
+			second = drive._get_drive_service('{"type": "service_account", "v": 2}')
+
+		assert first is not second
+		assert build.call_count == 2
+
+	def test_settings_and_key_read_once_per_request(self, mock_frappe):
+		drive = erpocr_integration.tasks.drive_integration
+		settings = SimpleNamespace(
+			drive_integration_enabled=True,
+			drive_archive_folder_id="root-1",
+			get_password=MagicMock(return_value='{"type": "service_account"}'),
+		)
+		mock_frappe.get_single = MagicMock(return_value=settings)
+
+		with patch.object(drive, "_get_drive_service", side_effect=Exception("offline")):
+			drive.download_file_from_drive("file-1")
+			drive.move_file_to_archive("file-1", supplier_name="Acme")
+
+		mock_frappe.get_single.assert_called_once_with("OCR Settings")
+		settings.get_password.assert_called_once_with("drive_service_account_json")
+
+	def test_invalid_json_is_not_cached(self):
+		drive = erpocr_integration.tasks.drive_integration
+		with pytest.raises(ValueError):
+			drive._get_drive_service("not-json")
+
+		assert drive._service_cache == {}
+
+
+# ---------------------------------------------------------------------------
+# 8. Archive folder memo — a deleted cached folder is re-resolved
+# ---------------------------------------------------------------------------
+
+
+class TestDriveFolderMemo:
+	"""_get_or_create_folder memoises folder IDs; uploads recover from a stale memo."""
+
+	def test_repeat_lookup_skips_drive(self):
+		drive = erpocr_integration.tasks.drive_integration
+		service = MagicMock()
+		service.files.return_value.list.return_value.execute.return_value = {"files": [{"id": "fld-2026"}]}
+
+		assert drive._get_or_create_folder(service, "2026", "root-1") == ("fld-2026", "found")
+		assert drive._get_or_create_folder(service, "2026", "root-1") == ("fld-2026", "cached")
+		service.files.return_value.list.assert_called_once()
+
+	def test_children_of_new_folder_are_created_without_listing(self):
+		drive = erpocr_integration.tasks.drive_integration
+		service = MagicMock()
+		service.files.return_value.list.return_value.execute.return_value = {"files": []}
+		service.files.return_value.create.return_value.execute.side_effect = [
+			{"id": "new-year"},
+			{"id": "new-month"},
+			{"id": "new-supplier"},
+		]
+
+		path, folder_id = drive._build_folder_structure(service, "root-1", "Acme", "2031-03-09")
+
+		assert (path, folder_id) == ("2031/03-March/Acme", "new-supplier")
+		# Only the Year level is looked up; Month and Supplier sit under fresh folders
+		service.files.return_value.list.assert_called_once()
+		assert service.files.return_value.list.call_args.kwargs["fields"] == "files(id)"
+
+	def test_forbidden_create_raises_without_relisting(self):
+		from googleapiclient.errors import HttpError
+
+		drive = erpocr_integration.tasks.drive_integration
+		service = MagicMock()
+		service.files.return_value.list.return_value.execute.return_value = {"files": []}
+		service.files.return_value.create.return_value.execute.side_effect = HttpError(
+			resp=SimpleNamespace(status=403), content=b"forbidden"
+		)
+
+		with pytest.raises(HttpError):
+			drive._find_or_create_folder(service, "2026", "root-1")
+		service.files.return_value.list.assert_called_once()
+
+	def test_rate_limited_403_on_create_backs_off_and_retries(self):
+		import json
+
+		from googleapiclient.errors import HttpError
+
+		drive = erpocr_integration.tasks.drive_integration
+		service = MagicMock()
+		service.files.return_value.list.return_value.execute.return_value = {"files": []}
+		body = {"error": {"code": 403, "errors": [{"reason": "userRateLimitExceeded"}]}}
+		service.files.return_value.create.return_value.execute.side_effect = [
+			HttpError(resp=SimpleNamespace(status=403), content=json.dumps(body).encode()),
+			{"id": "fld-new"},
+		]
+
+		with patch.object(drive.time, "sleep") as sleep:
+			assert drive._find_or_create_folder(service, "2026", "root-1") == ("fld-new", True)
+		sleep.assert_called_once_with(1)
+		assert service.files.return_value.create.call_count == 2
+
+	def test_server_error_on_create_backs_off_and_retries(self):
+		from googleapiclient.errors import HttpError
+
+		drive = erpocr_integration.tasks.drive_integration
+		service = MagicMock()
+		service.files.return_value.list.return_value.execute.return_value = {"files": []}
+		service.files.return_value.create.return_value.execute.side_effect = [
+			HttpError(resp=SimpleNamespace(status=503), content=b"unavailable"),
+			{"id": "fld-new"},
+		]
+
+		with patch.object(drive.time, "sleep") as sleep:
+			assert drive._find_or_create_folder(service, "2026", "root-1") == ("fld-new", True)
+		sleep.assert_called_once_with(1)
+		# Re-searched after the 503 in case the first create went through
+		assert service.files.return_value.list.call_count == 2
+
+	def test_upload_retries_once_when_cached_folder_was_deleted(self, mock_frappe):
+		from googleapiclient.errors import HttpError
+
+		drive = erpocr_integration.tasks.drive_integration
+		mock_frappe.get_single = MagicMock(
+			return_value=SimpleNamespace(
+				drive_integration_enabled=True,
+				drive_archive_folder_id="root-1",
+				get_password=MagicMock(return_value='{"type": "service_account"}'),
+			)
+		)
+		cache = mock_frappe.cache()
+		cache.set_value(f"{drive._FOLDER_CACHE_PREFIX}root-1:2024", "deleted-year")
+		cache.set_value(f"{drive._FOLDER_CACHE_PREFIX}deleted-year:01-January", "deleted-month")
+
+		service = MagicMock()
+		service.files.return_value.get.return_value.execute.return_value = {"trashed": False}
+		service.files.return_value.list.return_value.execute.return_value = {"files": [{"id": "live-fld"}]}
+		service.files.return_value.create.return_value.execute.side_effect = [
+			HttpError(resp=SimpleNamespace(status=404), content=b"parent not found"),
+			{"id": "file-1", "webViewLink": "https://drive.google.com/file-1"},
+		]
+
+		with patch.object(drive, "_get_drive_service", return_value=service):
+			result = drive.upload_invoice_to_drive(b"%PDF", "inv.pdf", invoice_date="2024-01-05")
+
+		assert result["file_id"] == "file-1"
+		assert service.files.return_value.create.call_args.kwargs["body"]["parents"] == ["live-fld"]
+		assert cache.get_value(f"{drive._FOLDER_CACHE_PREFIX}root-1:2024") == "live-fld"
+
+	def test_trashed_cached_folder_is_not_used(self):
+		"""A memoised folder trashed in the Drive UI is dropped and the path resolved afresh."""
+		drive = erpocr_integration.tasks.drive_integration
+		cache = frappe.cache()
+		cache.set_value(f"{drive._FOLDER_CACHE_PREFIX}root-1:2024", "trashed-year")
+		cache.set_value(f"{drive._FOLDER_CACHE_PREFIX}trashed-year:01-January", "trashed-month")
+
+		service = MagicMock()
+		service.files.return_value.get.return_value.execute.return_value = {"trashed": True}
+		service.files.return_value.list.return_value.execute.side_effect = [
+			{"files": [{"id": "live-year"}]},
+			{"files": [{"id": "live-month"}]},
+		]
+
+		path, folder_id = drive._build_folder_structure(service, "root-1", invoice_date="2024-01-05")
+
+		assert (path, folder_id) == ("2024/01-January", "live-month")
+		service.files.return_value.get.assert_called_once_with(
+			fileId="trashed-month", fields="trashed", supportsAllDrives=True
+		)
+		assert cache.get_value(f"{drive._FOLDER_CACHE_PREFIX}root-1:2024") == "live-year"
+		assert cache.get_value(f"{drive._FOLDER_CACHE_PREFIX}trashed-year:01-January") is None
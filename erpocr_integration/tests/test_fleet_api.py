@@ -1064,3 +1064,6 @@ class TestFleetGeminiProcess:
 		)
 
 		mock_archive.assert_called_once()
+		assert mock_fleet.drive_link == "https://drive.google.com/new-link"
+		assert mock_fleet.drive_file_id == "new-drive-id"
+		assert mock_fleet.drive_folder_path == "2025/12/Fleet Slips"
@@ -90,7 +90,13 @@ def _make_fleet_slip(**overrides):
 	doc.flags = _FlagsDict()
 	doc.save = MagicMock()
 	doc.reload = MagicMock()
-	doc.db_set = MagicMock()
+
+	def _db_set(field, value=None, **kwargs):
+		# Like Document.db_set: the values land on the in-memory doc too
+		for key, val in (field if isinstance(field, dict) else {field: value}).items():
+			setattr(doc, key, val)
+
+	doc.db_set = MagicMock(side_effect=_db_set)
 	doc.has_value_changed = MagicMock(return_value=False)
 
 	for key, value in overrides.items():
@@ -223,6 +229,9 @@ class TestCreatePurchaseInvoice:
 		assert doc.purchase_invoice == "PI-00001"
 		assert doc.status == "Draft Created"
 		mock_pi.insert.assert_called_once()
+		# Link + status written in one db_set, not a full re-save
+		doc.db_set.assert_called_once_with({"purchase_invoice": "PI-00001", "status": "Draft Created"})
+		doc.save.assert_not_called()
 
 	def test_blocks_when_no_expense_account_anywhere(self, mock_frappe):
 		"""Bounce rework 3 (Q6 follow-through): slip expense_account AND
@@ -1,6 +1,7 @@
 """Tests for erpocr_integration.tasks.gemini_extract — schema, validation, transform."""
 
 import json
+import sys
 from types import SimpleNamespace
 from unittest.mock import MagicMock, patch
 
@@ -9,9 +10,12 @@ import pytest
 from erpocr_integration.tasks.gemini_extract import (
 	_build_extraction_prompt,
 	_build_extraction_schema,
+	_call_gemini_api,
 	_transform_to_ocr_import_format,
 	_validate_gemini_response,
+	extract_pdf_text,
 	extract_statement_data,
+	get_gemini_session,
 )
 
 # ---------------------------------------------------------------------------
@@ -126,11 +130,13 @@ class TestValidateGeminiResponse:
 		is_valid, _error = _validate_gemini_response(response)
 		assert is_valid is False
 
-	def test_invalid_json_text(self):
+	def test_text_not_parsed_during_validation(self):
+		"""JSON parsing is left to the caller so the text is only parsed once."""
 		response = {"candidates": [{"content": {"parts": [{"text": "not json"}]}}]}
-		is_valid, error = _validate_gemini_response(response)
-		assert is_valid is False
-		assert "json" in error.lower()
+		with patch("erpocr_integration.tasks.gemini_extract.json.loads") as mock_loads:
+			is_valid, _error = _validate_gemini_response(response)
+		assert is_valid is True
+		mock_loads.assert_not_called()
 
 	def test_valid_json_text(self):
 		response = {"candidates": [{"content": {"parts": [{"text": '{"invoices": []}'}]}}]}
@@ -270,7 +276,7 @@ class TestExtractStatementData:
 	def test_extracts_statement_header_and_transactions(self, mock_frappe):
 		mock_settings = SimpleNamespace(gemini_model="gemini-2.5-flash")
 		mock_settings.get_password = MagicMock(return_value="fake-key")
-		mock_frappe.get_single.return_value = mock_settings
+		mock_frappe.get_cached_doc.return_value = mock_settings
 
 		with patch("erpocr_integration.tasks.gemini_extract._call_gemini_api") as mock_api:
 			mock_api.return_value = {
@@ -329,7 +335,7 @@ class TestExtractStatementData:
 	def test_raises_on_empty_transactions(self, mock_frappe):
 		mock_settings = SimpleNamespace(gemini_model="gemini-2.5-flash")
 		mock_settings.get_password = MagicMock(return_value="fake-key")
-		mock_frappe.get_single.return_value = mock_settings
+		mock_frappe.get_cached_doc.return_value = mock_settings
 
 		with patch("erpocr_integration.tasks.gemini_extract._call_gemini_api") as mock_api:
 			mock_api.return_value = {
@@ -363,7 +369,7 @@ class TestExtractStatementData:
 	def test_raises_on_api_error(self, mock_frappe):
 		mock_settings = SimpleNamespace(gemini_model="gemini-2.5-flash")
 		mock_settings.get_password = MagicMock(return_value="fake-key")
-		mock_frappe.get_single.return_value = mock_settings
+		mock_frappe.get_cached_doc.return_value = mock_settings
 
 		with patch("erpocr_integration.tasks.gemini_extract._call_gemini_api") as mock_api:
 			mock_api.side_effect = Exception("API timeout")
@@ -375,7 +381,7 @@ class TestExtractStatementData:
 		"""Empty candidates list caught by validation, logged with truncated response."""
 		mock_settings = SimpleNamespace(gemini_model="gemini-2.5-flash")
 		mock_settings.get_password = MagicMock(return_value="fake-key")
-		mock_frappe.get_single.return_value = mock_settings
+		mock_frappe.get_cached_doc.return_value = mock_settings
 
 		with patch("erpocr_integration.tasks.gemini_extract._call_gemini_api") as mock_api:
 			mock_api.return_value = {"candidates": []}
@@ -389,7 +395,7 @@ class TestExtractStatementData:
 		"""Missing parts caught by validation, logged with truncated response."""
 		mock_settings = SimpleNamespace(gemini_model="gemini-2.5-flash")
 		mock_settings.get_password = MagicMock(return_value="fake-key")
-		mock_frappe.get_single.return_value = mock_settings
+		mock_frappe.get_cached_doc.return_value = mock_settings
 
 		with patch("erpocr_integration.tasks.gemini_extract._call_gemini_api") as mock_api:
 			mock_api.return_value = {"candidates": [{"content": {"parts": []}}]}
@@ -403,7 +409,7 @@ class TestExtractStatementData:
 		"""Empty text caught by validation, logged with truncated response."""
 		mock_settings = SimpleNamespace(gemini_model="gemini-2.5-flash")
 		mock_settings.get_password = MagicMock(return_value="fake-key")
-		mock_frappe.get_single.return_value = mock_settings
+		mock_frappe.get_cached_doc.return_value = mock_settings
 
 		with patch("erpocr_integration.tasks.gemini_extract._call_gemini_api") as mock_api:
 			mock_api.return_value = {"candidates": [{"content": {"parts": [{"text": ""}]}}]}
@@ -417,7 +423,7 @@ class TestExtractStatementData:
 		"""Invalid Gemini response (validation failure) logs truncated response."""
 		mock_settings = SimpleNamespace(gemini_model="gemini-2.5-flash")
 		mock_settings.get_password = MagicMock(return_value="fake-key")
-		mock_frappe.get_single.return_value = mock_settings
+		mock_frappe.get_cached_doc.return_value = mock_settings
 
 		with patch("erpocr_integration.tasks.gemini_extract._call_gemini_api") as mock_api:
 			with patch("erpocr_integration.tasks.gemini_extract._validate_gemini_response") as mock_validate:
@@ -428,3 +434,83 @@ class TestExtractStatementData:
 					extract_statement_data(b"fake-pdf", "bad.pdf")
 
 		mock_frappe.log_error.assert_called()
+
+	def test_raises_on_invalid_json_text(self, mock_frappe):
+		"""Non-JSON text passes structural validation and fails the single parse."""
+		mock_settings = SimpleNamespace(gemini_model="gemini-2.5-flash")
+		mock_settings.get_password = MagicMock(return_value="fake-key")
+		mock_frappe.get_cached_doc.return_value = mock_settings
+
+		with patch("erpocr_integration.tasks.gemini_extract._call_gemini_api") as mock_api:
+			mock_api.return_value = {"candidates": [{"content": {"parts": [{"text": "not json"}]}}]}
+
+			with pytest.raises(Exception, match="Failed to parse Gemini response"):
+				extract_statement_data(b"fake-pdf", "bad.pdf")
+
+		mock_frappe.log_error.assert_called()
+
+
+# ---------------------------------------------------------------------------
+# extract_pdf_text / text-layer payload
+# ---------------------------------------------------------------------------
+
+
+def _fake_pypdf(page_texts):
+	reader = SimpleNamespace(pages=[SimpleNamespace(extract_text=lambda t=t: t) for t in page_texts])
+	return SimpleNamespace(PdfReader=MagicMock(return_value=reader))
+
+
+class TestExtractPdfText:
+	def test_returns_text_with_page_markers(self):
+		pages = ["Tax Invoice INV-001 " * 10, "Page two totals " * 10]
+		with patch.dict(sys.modules, {"pypdf": _fake_pypdf(pages)}):
+			text = extract_pdf_text(b"%PDF-1.4")
+
+		assert text.startswith("--- Page 1 ---\nTax Invoice INV-001")
+		assert "--- Page 2 ---\nPage two totals" in text
+
+	def test_sparse_text_falls_back_to_vision(self):
+		"""A scanned PDF usually has no text layer, or a few stray characters per page."""
+		pages = ["x" * 300] + [""] * 9
+		with patch.dict(sys.modules, {"pypdf": _fake_pypdf(pages)}):
+			assert extract_pdf_text(b"%PDF-1.4") is None
+
+	def test_short_document_falls_back_to_vision(self):
+		with patch.dict(sys.modules, {"pypdf": _fake_pypdf(["Invoice 123"])}):
+			assert extract_pdf_text(b"%PDF-1.4") is None
+
+	def test_unreadable_pdf_returns_none(self):
+		broken = SimpleNamespace(PdfReader=MagicMock(side_effect=ValueError("bad xref")))
+		with patch.dict(sys.modules, {"pypdf": broken}):
+			assert extract_pdf_text(b"not a pdf") is None
+
+	def test_missing_pypdf_returns_none(self):
+		with patch.dict(sys.modules, {"pypdf": None}):
+			assert extract_pdf_text(b"%PDF-1.4") is None
+
+
+class TestCallGeminiApiPayload:
+	def _payload(self, **kwargs):
+		response = MagicMock()
+		response.json.return_value = {"candidates": []}
+		session = MagicMock()
+		session.post.return_value = response
+		with patch("erpocr_integration.tasks.gemini_extract.get_gemini_session", return_value=session):
+			_call_gemini_api(b"%PDF-1.4", "prompt", {}, "key", "gemini-2.5-flash", **kwargs)
+		return session.post.call_args.kwargs["json"]
+
+	def test_file_sent_inline_by_default(self):
+		parts = self._payload()["contents"][0]["parts"]
+		assert parts[1]["inline_data"]["mime_type"] == "application/pdf"
+
+	def test_text_content_replaces_inline_file(self):
+		parts = self._payload(text_content="--- Page 1 ---\nInvoice")["contents"][0]["parts"]
+		assert all("inline_data" not in part for part in parts)
+		assert parts[1]["text"].endswith("--- Page 1 ---\nInvoice")
+
+
+class TestGeminiSession:
+	def test_session_reused_across_calls(self):
+		with patch("erpocr_integration.tasks.gemini_extract._session", None):
+			first = get_gemini_session()
+			assert get_gemini_session() is first
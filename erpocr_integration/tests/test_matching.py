@@ -139,8 +139,18 @@ class TestSupplierScopedItemAlias:
 			return None  # Item.item_name lookups miss — aliases decide these tests
 
 		def _get_all(doctype, filters=None, **kw):
-			if doctype == "OCR Item Alias" and filters and filters.get("supplier") == ["is", "not set"]:
-				item = global_rows.get(filters["ocr_text"])
+			if doctype != "OCR Item Alias" or not filters:
+				return []
+			ocr_text = filters["ocr_text"]
+			if isinstance(ocr_text, list) and ocr_text[0] == "in":
+				# match_items_bulk: one query per tier for the whole invoice
+				if filters.get("supplier") == ["is", "not set"]:
+					hits = {t: global_rows.get(t) for t in ocr_text[1]}
+				else:
+					hits = {t: scoped.get((t, filters["supplier"])) for t in ocr_text[1]}
+				return [SimpleNamespace(ocr_text=t, item_code=i) for t, i in hits.items() if i]
+			if filters.get("supplier") == ["is", "not set"]:
+				item = global_rows.get(ocr_text)
 				return [SimpleNamespace(item_code=item)] if item else []
 			return []
 
@@ -293,6 +303,59 @@ class TestSupplierScopedItemAlias:
 		assert ocr_import.items[0].item_code == "ITEM-A"  # scoped beats global
 		assert ocr_import.items[0].match_status == "Auto Matched"
 
+	def test_bulk_matches_per_line_precedence(self, mock_frappe):
+		"""match_items_bulk resolves each description exactly as match_item would."""
+		self._wire_aliases(
+			mock_frappe,
+			scoped={("Widget", "Supplier A"): "ITEM-A"},
+			global_rows={"Widget": "ITEM-G", "Bolt": "ITEM-B"},
+		)
+		from erpocr_integration.tasks.matching import match_item, match_items_bulk
+
+		descriptions = ["Widget", "Bolt", "Unknown"]
+		bulk = match_items_bulk(descriptions, supplier="Supplier A")
+
+		for description in descriptions:
+			self._wire_aliases(
+				mock_frappe,
+				scoped={("Widget", "Supplier A"): "ITEM-A"},
+				global_rows={"Widget": "ITEM-G", "Bolt": "ITEM-B"},
+			)
+			expected = match_item(description, supplier="Supplier A")
+			assert bulk.get(description, (None, "Unmatched")) == expected
+
+	def test_bulk_one_query_per_tier(self, mock_frappe):
+		"""Query count is per tier, not per line — and later tiers only see misses."""
+		self._wire_aliases(mock_frappe, global_rows={f"Line {n}": f"ITEM-{n}" for n in range(20)})
+		from erpocr_integration.tasks.matching import match_items_bulk
+
+		bulk = match_items_bulk([f"Line {n}" for n in range(20)] + ["Stray"], supplier="Supplier A")
+
+		assert len(bulk) == 20
+		# scoped alias + global alias + Item.item_name + Item.name
+		assert mock_frappe.get_all.call_count == 4
+		item_name_filters = mock_frappe.get_all.call_args_list[2].kwargs["filters"]
+		assert item_name_filters == {"item_name": ["in", ["Stray"]]}
+
+	def test_bulk_caps_scoped_alias_under_suggested_supplier(self, mock_frappe):
+		self._wire_aliases(mock_frappe, scoped={("Widget", "Supplier A"): "ITEM-A"})
+		from erpocr_integration.tasks.matching import match_items_bulk
+
+		bulk = match_items_bulk(["Widget"], supplier="Supplier A", supplier_status="Suggested")
+		assert bulk["Widget"] == ("ITEM-A", "Suggested")
+
+	def test_bulk_case_insensitive_like_the_collation(self, mock_frappe):
+		mock_frappe.get_all = MagicMock(
+			side_effect=lambda doctype, filters=None, **kw: (
+				[SimpleNamespace(name="ITEM-W", item_name="Widget Large")]
+				if doctype == "Item" and "item_name" in filters
+				else []
+			)
+		)
+		from erpocr_integration.tasks.matching import match_items_bulk
+
+		assert match_items_bulk(["WIDGET LARGE"]) == {"WIDGET LARGE": ("ITEM-W", "Auto Matched")}
+
 
 # ---------------------------------------------------------------------------
 # match_item_by_supplier_part (Item Supplier lookup, tier 2)
@@ -539,6 +602,36 @@ class TestChainedConfidenceCap:
 		assert ocr_import.items[0].item_code == "ITEM-A"
 		assert ocr_import.items[0].match_status == "Auto Matched"
 
+	def test_run_matching_probes_service_mapping_once_per_row(self, mock_frappe):
+		"""A row matched by an earlier tier reuses the single service-mapping probe
+		for its accounting fields instead of looking it up a second time."""
+		self._wire_run_matching(mock_frappe, ("Acme Ltd", "Auto Matched"))
+
+		class _Settings(SimpleNamespace):
+			def get(self, key, default=None):
+				return getattr(self, key, default)
+
+		service_match = {
+			"item_code": "SVC",
+			"item_name": "Bracket (mapped)",
+			"expense_account": "5000 - COGS - TC",
+			"cost_center": "Main - TC",
+			"match_status": "Auto Matched",
+		}
+		ocr_import = self._make_import()
+		from erpocr_integration.api import _run_matching
+
+		with patch(
+			"erpocr_integration.tasks.matching.match_service_item", return_value=service_match
+		) as mock_service:
+			_run_matching(ocr_import, {}, _Settings(matching_threshold=80, default_item=""))
+
+		mock_service.assert_called_once()
+		item = ocr_import.items[0]
+		assert item.item_code == "ITEM-A"  # tier 1 still wins
+		assert item.expense_account == "5000 - COGS - TC"
+		assert item.cost_center == "Main - TC"
+
 	def test_capped_item_keeps_auto_draft_blocked(self, mock_frappe):
 		"""Safety assertion: the capped item statuses must not accidentally unblock
 		auto-draft. A Suggested supplier already blocks it — confirm the whole
@@ -663,6 +756,30 @@ class TestMatchSupplierFuzzy:
 		result, _status, _score = match_supplier_fuzzy("Acme Trading Pty Ltd")
 		assert result == "SUP-001"  # Closer match
 
+	def test_quick_ratio_pruning_matches_full_scan(self, mock_frappe):
+		"""The quick_ratio upper-bound skip never changes the winner or its score."""
+		from difflib import SequenceMatcher
+
+		from erpocr_integration.tasks.matching import _best_fuzzy
+
+		texts = [
+			"acme trading (pty) ltd",
+			"acme",
+			"star products (pty) ltd",
+			"acme trading pty limited",
+			"zz",
+			"acme trading (pty) ltd t/a acme hardware and building supplies",
+			"acme trading pty ltd",
+		]
+		pool = {"candidates": [(t, f"SUP-{i}", None) for i, t in enumerate(texts)], "memo": {}}
+		for query in ("acme trading pty ltd", "acme hardware", "star prod", "zz top"):
+			expected = max(
+				((SequenceMatcher(None, query, t).ratio() * 100, -i) for i, t in enumerate(texts)),
+			)
+			match, score = _best_fuzzy(pool, query)
+			assert score == expected[0]
+			assert match == f"SUP-{-expected[1]}"  # first candidate wins ties
+
 	def test_alias_fuzzy_match(self, mock_frappe):
 		self._setup_suppliers(
 			mock_frappe,
@@ -690,6 +807,40 @@ class TestMatchSupplierFuzzy:
 		result_high, _, _score_high = match_supplier_fuzzy("XYZ Inc", threshold=95)
 		assert result_high is None
 
+	def test_candidate_pool_loaded_once_per_ttl(self, mock_frappe):
+		"""Repeat lookups in one worker reuse the pool instead of re-reading every supplier."""
+		self._setup_suppliers(mock_frappe, [("SUP-001", "Acme Trading (Pty) Ltd")])
+		from erpocr_integration.tasks.matching import match_supplier_fuzzy
+
+		first = match_supplier_fuzzy("Acme Trading Pty Ltd")
+		calls_after_first = mock_frappe.get_all.call_count
+		second = match_supplier_fuzzy("Acme Trading Pty Ltd", threshold=90)
+		match_supplier_fuzzy("Something Else")
+
+		assert first[0] == "SUP-001"
+		assert second[0] == "SUP-001"
+		assert mock_frappe.get_all.call_count == calls_after_first  # pool reused
+
+	def test_repeat_description_not_rescored(self, mock_frappe):
+		self._setup_suppliers(mock_frappe, [("SUP-001", "Acme Trading (Pty) Ltd")])
+		import erpocr_integration.tasks.matching as matching
+
+		matching.match_supplier_fuzzy("Acme Trading Pty Ltd")
+		with patch.object(matching, "SequenceMatcher") as scorer:
+			result, status, _ = matching.match_supplier_fuzzy("  ACME Trading Pty Ltd ")
+		scorer.assert_not_called()  # memoised on the normalised text
+		assert (result, status) == ("SUP-001", "Suggested")
+
+	def test_clear_hook_reloads_pool(self, mock_frappe):
+		self._setup_suppliers(mock_frappe, [("SUP-001", "Acme Trading (Pty) Ltd")])
+		from erpocr_integration.tasks.matching import clear_fuzzy_cache, match_supplier_fuzzy
+
+		match_supplier_fuzzy("Acme Trading Pty Ltd")
+		self._setup_suppliers(mock_frappe, [("SUP-002", "Acme Trading (Pty) Ltd")])
+		clear_fuzzy_cache(doc=None, method="on_update")
+
+		assert match_supplier_fuzzy("Acme Trading Pty Ltd")[0] == "SUP-002"
+
 
 # ---------------------------------------------------------------------------
 # match_item_fuzzy
@@ -854,6 +1005,31 @@ class TestMatchServiceItem:
 		assert result is not None
 		assert result["item_code"] == "DELIVERY"
 
+	def test_preloaded_mappings_skip_queries(self, mock_frappe):
+		"""An invoice loads its mappings once; every line then resolves in memory."""
+		self._setup_mappings(
+			mock_frappe,
+			generic_mappings=[
+				{
+					"description_pattern": "Delivery",
+					"item_code": "DELIVERY",
+					"item_name": "Delivery Fee",
+					"expense_account": "5200 - Delivery - TC",
+					"cost_center": "",
+				}
+			],
+		)
+		from erpocr_integration.tasks.matching import load_service_mappings, match_service_item
+
+		mappings = load_service_mappings("Test Company", None)
+		mock_frappe.get_all.reset_mock()
+
+		lines = ["Delivery fee", "DELIVERY - zone 2", "Bracket 40mm"]
+		results = [match_service_item(line, company="Test Company", mappings=mappings) for line in lines]
+
+		assert [r and r["item_code"] for r in results] == ["DELIVERY", "DELIVERY", None]
+		mock_frappe.get_all.assert_not_called()
+
 
 class TestSupplierDefaultMapping:
 	"""Supplier-default ('*' wildcard) service mappings — code any line for a
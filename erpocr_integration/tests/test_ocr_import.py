@@ -1,7 +1,8 @@
 """Tests for OCR Import document creation methods and guards."""
 
+from datetime import date
 from types import SimpleNamespace
-from unittest.mock import MagicMock
+from unittest.mock import MagicMock, call, patch
 
 import pytest
 
@@ -10,6 +11,7 @@ from erpocr_integration.erpnext_ocr.doctype.ocr_import.ocr_import import (
 	OCRImport,
 	_build_taxes_from_template,
 	_detect_tax_inclusive_rates,
+	_drive_link_comment,
 	_extract_service_pattern,
 	_resolve_ocr_description,
 )
@@ -49,6 +51,25 @@ class TestResolveOcrDescription:
 		assert _resolve_ocr_description(item) == ""
 
 
+# ---------------------------------------------------------------------------
+# _drive_link_comment
+# ---------------------------------------------------------------------------
+
+
+class TestDriveLinkComment:
+	def test_links_archived_pdf(self):
+		html = _drive_link_comment("https://drive.google.com/file/d/abc", "2025/01/Acme")
+		assert "href='https://drive.google.com/file/d/abc'" in html
+		assert "Archive path: 2025/01/Acme" in html
+
+	def test_missing_folder_path_shows_na(self):
+		assert "Archive path: N/A" in _drive_link_comment("https://drive.google.com/x", None)
+
+	@pytest.mark.parametrize("link", [None, "", "http://drive.google.com/x", "javascript:alert(1)"])
+	def test_non_https_link_gives_no_comment(self, link):
+		assert _drive_link_comment(link, "2025/01/Acme") == ""
+
+
 # ---------------------------------------------------------------------------
 # Helpers
 # ---------------------------------------------------------------------------
@@ -84,6 +105,13 @@ def _make_ocr_import(**overrides):
 	doc.items = []
 	doc.save = MagicMock()
 
+	def _db_set(field, value=None, **kwargs):
+		# Like Document.db_set: the values land on the in-memory doc too
+		for key, val in (field if isinstance(field, dict) else {field: value}).items():
+			setattr(doc, key, val)
+
+	doc.db_set = MagicMock(side_effect=_db_set)
+
 	for key, value in overrides.items():
 		setattr(doc, key, value)
 	return doc
@@ -115,6 +143,7 @@ def _setup_frappe_for_create(mock_frappe, sample_settings, created_doc_name="JE-
 	"""Configure frappe mock for a successful create_* call."""
 	# Row-lock returns no existing documents
 	mock_frappe.db.get_value.side_effect = _db_get_value_handler()
+	mock_frappe.get_all.side_effect = _get_all_handler()
 	mock_frappe.get_cached_doc.return_value = sample_settings
 	# Created document mock
 	created_doc = MagicMock()
@@ -129,10 +158,6 @@ def _db_get_value_handler(
 	existing_pi=None,
 	existing_pr=None,
 	existing_je=None,
-	account_company="Test Company",
-	account_is_group=0,
-	account_disabled=0,
-	account_type=None,
 	item_is_stock=0,
 ):
 	"""Return a side_effect function for frappe.db.get_value that handles different doctypes."""
@@ -144,14 +169,6 @@ def _db_get_value_handler(
 				purchase_receipt=existing_pr,
 				journal_entry=existing_je,
 			)
-		if doctype == "Account":
-			if fields and "account_type" in (fields if isinstance(fields, (list, tuple)) else [fields]):
-				return account_type
-			return SimpleNamespace(
-				company=account_company,
-				is_group=account_is_group,
-				disabled=account_disabled,
-			)
 		if doctype == "Item":
 			return item_is_stock
 		return None
@@ -159,6 +176,40 @@ def _db_get_value_handler(
 	return handler
 
 
+def _get_all_handler(
+	stock_items=(),
+	po_items=(),
+	pr_items=(),
+	account_company="Test Company",
+	account_is_group=0,
+	account_disabled=0,
+	account_type=None,
+):
+	"""Return a side_effect for frappe.get_all: Account rows, stock Item codes and PO/PR item rows."""
+
+	def handler(doctype, filters=None, pluck=None, **kwargs):
+		if doctype == "Account":
+			return [
+				SimpleNamespace(
+					name=name,
+					company=account_company,
+					is_group=account_is_group,
+					disabled=account_disabled,
+					account_type=account_type,
+				)
+				for name in filters["name"][1]
+			]
+		if doctype == "Item":
+			return [code for code in stock_items if code in filters["name"][1]]
+		if doctype == "Purchase Order Item":
+			return list(po_items)
+		if doctype == "Purchase Receipt Item":
+			return list(pr_items)
+		return []
+
+	return handler
+
+
 # ---------------------------------------------------------------------------
 # Document type enforcement
 # ---------------------------------------------------------------------------
@@ -227,6 +278,21 @@ class TestCrossDocumentLock:
 		with pytest.raises(Exception):
 			doc.create_purchase_receipt()
 
+	@pytest.mark.parametrize(
+		"document_type, method",
+		[
+			("Purchase Invoice", "create_purchase_invoice"),
+			("Purchase Receipt", "create_purchase_receipt"),
+			("Journal Entry", "create_journal_entry"),
+		],
+	)
+	def test_missing_supplier_fails_before_row_lock(self, mock_frappe, document_type, method):
+		doc = _make_ocr_import(document_type=document_type, status="Matched", supplier=None)
+		mock_frappe.db.get_value.reset_mock()
+		with pytest.raises(Exception):
+			getattr(doc, method)()
+		mock_frappe.db.get_value.assert_not_called()
+
 
 # ---------------------------------------------------------------------------
 # Journal Entry creation
@@ -247,7 +313,9 @@ class TestCreateJournalEntry:
 		assert result == "JE-00001"
 		assert doc.journal_entry == "JE-00001"
 		assert doc.status == "Draft Created"
-		doc.save.assert_called_once()
+		# Only the link + status columns are written; no full re-save of the import
+		doc.db_set.assert_called_once_with({"journal_entry": "JE-00001", "status": "Draft Created"})
+		doc.save.assert_not_called()
 
 	def test_je_get_doc_called_with_correct_structure(self, mock_frappe, sample_settings):
 		doc = _make_ocr_import(
@@ -315,6 +383,7 @@ class TestCreateJournalEntry:
 
 		mock_frappe.get_cached_doc.side_effect = get_cached_doc_handler
 		mock_frappe.db.get_value.side_effect = _db_get_value_handler()
+		mock_frappe.get_all.side_effect = _get_all_handler()
 		created_je = MagicMock()
 		created_je.name = "JE-00001"
 		mock_frappe.get_doc.return_value = created_je
@@ -366,6 +435,7 @@ class TestCreateJournalEntry:
 
 		mock_frappe.get_cached_doc.side_effect = get_cached_doc_handler
 		mock_frappe.db.get_value.side_effect = _db_get_value_handler()
+		mock_frappe.get_all.side_effect = _get_all_handler()
 		created_je = MagicMock()
 		created_je.name = "JE-00002"
 		mock_frappe.get_doc.return_value = created_je
@@ -397,6 +467,7 @@ class TestCreateJournalEntry:
 			items=[_make_item(expense_account=None)],
 		)
 		mock_frappe.db.get_value.side_effect = _db_get_value_handler()
+		mock_frappe.get_all.side_effect = _get_all_handler()
 		mock_frappe.get_cached_doc.return_value = sample_settings
 
 		with pytest.raises(Exception):
@@ -410,6 +481,7 @@ class TestCreateJournalEntry:
 			items=[_make_item()],
 		)
 		mock_frappe.db.get_value.side_effect = _db_get_value_handler()
+		mock_frappe.get_all.side_effect = _get_all_handler()
 		mock_frappe.get_cached_doc.return_value = sample_settings
 
 		with pytest.raises(Exception):
@@ -421,7 +493,8 @@ class TestCreateJournalEntry:
 			credit_account="2100 - Accounts Payable - WrongCo",
 			items=[_make_item()],
 		)
-		mock_frappe.db.get_value.side_effect = _db_get_value_handler(account_company="Wrong Company")
+		mock_frappe.db.get_value.side_effect = _db_get_value_handler()
+		mock_frappe.get_all.side_effect = _get_all_handler(account_company="Wrong Company")
 		mock_frappe.get_cached_doc.return_value = sample_settings
 
 		with pytest.raises(Exception):
@@ -433,7 +506,8 @@ class TestCreateJournalEntry:
 			credit_account="2000 - Liabilities - TC",
 			items=[_make_item()],
 		)
-		mock_frappe.db.get_value.side_effect = _db_get_value_handler(account_is_group=1)
+		mock_frappe.db.get_value.side_effect = _db_get_value_handler()
+		mock_frappe.get_all.side_effect = _get_all_handler(account_is_group=1)
 		mock_frappe.get_cached_doc.return_value = sample_settings
 
 		with pytest.raises(Exception):
@@ -445,7 +519,8 @@ class TestCreateJournalEntry:
 			credit_account="2100 - Old Account - TC",
 			items=[_make_item()],
 		)
-		mock_frappe.db.get_value.side_effect = _db_get_value_handler(account_disabled=1)
+		mock_frappe.db.get_value.side_effect = _db_get_value_handler()
+		mock_frappe.get_all.side_effect = _get_all_handler(account_disabled=1)
 		mock_frappe.get_cached_doc.return_value = sample_settings
 
 		with pytest.raises(Exception):
@@ -459,6 +534,7 @@ class TestCreateJournalEntry:
 			items=[_make_item()],
 		)
 		mock_frappe.db.get_value.side_effect = _db_get_value_handler()
+		mock_frappe.get_all.side_effect = _get_all_handler()
 		mock_frappe.get_cached_doc.return_value = sample_settings
 
 		with pytest.raises(Exception):
@@ -472,18 +548,8 @@ class TestCreateJournalEntry:
 		)
 
 		# Configure account_type lookup to return "Payable" for credit account
-		def handler(doctype, name, fields=None, **kwargs):
-			if doctype == "OCR Import":
-				return SimpleNamespace(purchase_invoice=None, purchase_receipt=None, journal_entry=None)
-			if doctype == "Account":
-				if isinstance(fields, str) and fields == "account_type":
-					return "Payable"
-				if isinstance(fields, (list, tuple)) and "account_type" in fields:
-					return "Payable"
-				return SimpleNamespace(company="Test Company", is_group=0, disabled=0)
-			return None
-
-		mock_frappe.db.get_value.side_effect = handler
+		mock_frappe.db.get_value.side_effect = _db_get_value_handler()
+		mock_frappe.get_all.side_effect = _get_all_handler(account_type="Payable")
 		mock_frappe.get_cached_doc.return_value = sample_settings
 		created_je = MagicMock()
 		created_je.name = "JE-00001"
@@ -497,6 +563,31 @@ class TestCreateJournalEntry:
 		assert credit_line["party_type"] == "Supplier"
 		assert credit_line["party"] == "Test Supplier"
 
+	def test_je_accounts_fetched_in_one_query(self, mock_frappe, sample_settings):
+		doc = _make_ocr_import(
+			document_type="Journal Entry",
+			credit_account="2100 - Accounts Payable - TC",
+			items=[
+				_make_item(expense_account="5000 - COGS - TC"),
+				_make_item(expense_account="5100 - Hosting - TC"),
+				_make_item(expense_account="5000 - COGS - TC"),
+			],
+		)
+		_setup_frappe_for_create(mock_frappe, sample_settings)
+		mock_frappe.get_all.reset_mock()
+		mock_frappe.db.get_value.reset_mock()
+
+		doc.create_journal_entry()
+
+		account_queries = [c for c in mock_frappe.get_all.call_args_list if c.args[0] == "Account"]
+		assert len(account_queries) == 1
+		assert account_queries[0].kwargs["filters"]["name"][1] == [
+			"2100 - Accounts Payable - TC",
+			"5000 - COGS - TC",
+			"5100 - Hosting - TC",
+		]
+		assert not [c for c in mock_frappe.db.get_value.call_args_list if c.args[0] == "Account"]
+
 
 # ---------------------------------------------------------------------------
 # Purchase Invoice with PO/PR refs
@@ -526,9 +617,11 @@ class TestCreatePurchaseInvoiceWithPORefs:
 			purchase_receipt_link="PR-00001",
 			items=[_make_item(purchase_order_item="po-item-row-1", pr_detail="pr-item-row-1")],
 		)
-		# Mock db.exists for PR validation
-		mock_frappe.db.exists.return_value = True
 		_setup_frappe_for_create(mock_frappe, sample_settings, "PI-00001")
+		# PR has rows against the PO (PR-belongs-to-PO validation)
+		mock_frappe.get_all.side_effect = _get_all_handler(
+			pr_items=[SimpleNamespace(name="pr-item-row-1", item_code="ITEM-001")]
+		)
 
 		doc.create_purchase_invoice()
 
@@ -538,6 +631,10 @@ class TestCreatePurchaseInvoiceWithPORefs:
 		assert pi_item["po_detail"] == "po-item-row-1"
 		assert pi_item["purchase_receipt"] == "PR-00001"
 		assert pi_item["pr_detail"] == "pr-item-row-1"
+		# The PR/PO link check reuses the auto-match fetch — no separate probe
+		mock_frappe.db.exists.assert_not_called()
+		pr_queries = [c for c in mock_frappe.get_all.call_args_list if c.args[0] == "Purchase Receipt Item"]
+		assert len(pr_queries) == 1
 
 	def test_pi_validates_pr_belongs_to_po(self, mock_frappe, sample_settings):
 		doc = _make_ocr_import(
@@ -546,8 +643,7 @@ class TestCreatePurchaseInvoiceWithPORefs:
 			purchase_receipt_link="PR-WRONG",
 			items=[_make_item(purchase_order_item="po-item-row-1")],
 		)
-		# PR does NOT belong to PO
-		mock_frappe.db.exists.return_value = False
+		# PR does NOT belong to PO: it has no rows against it
 		_setup_frappe_for_create(mock_frappe, sample_settings, "PI-00001")
 
 		with pytest.raises(Exception):
@@ -590,9 +686,9 @@ class TestCreatePurchaseInvoiceWithPORefs:
 		)
 		_setup_frappe_for_create(mock_frappe, sample_settings, "PI-00001")
 		# Mock get_all to return PO items for auto-matching
-		mock_frappe.get_all.return_value = [
-			SimpleNamespace(name="po-item-auto-1", item_code="ITEM-001"),
-		]
+		mock_frappe.get_all.side_effect = _get_all_handler(
+			po_items=[SimpleNamespace(name="po-item-auto-1", item_code="ITEM-001")]
+		)
 
 		doc.create_purchase_invoice()
 
@@ -609,7 +705,6 @@ class TestCreatePurchaseInvoiceWithPORefs:
 			purchase_receipt_link="PR-00001",
 			items=[_make_item(purchase_order_item=None, pr_detail=None)],
 		)
-		mock_frappe.db.exists.return_value = True
 		_setup_frappe_for_create(mock_frappe, sample_settings, "PI-00001")
 
 		def get_all_handler(doctype, **kwargs):
@@ -659,6 +754,36 @@ class TestCreatePurchaseReceiptWithPORefs:
 		assert pr_item["purchase_order"] == "PO-00001"
 		assert pr_item["purchase_order_item"] == "po-item-row-1"
 
+	def test_pr_stock_flags_fetched_in_one_query(self, mock_frappe, sample_settings):
+		"""K rows cost one Item query, and only the non-stock codes are warned about."""
+		doc = _make_ocr_import(
+			document_type="Purchase Receipt",
+			status="Matched",
+			items=[
+				_make_item(item_code="STOCK-1"),
+				_make_item(item_code="SERVICE-1"),
+				_make_item(item_code="STOCK-2"),
+				_make_item(item_code="STOCK-1"),
+			],
+		)
+		mock_frappe.db.get_value.side_effect = _db_get_value_handler()
+		mock_frappe.get_cached_doc.return_value = sample_settings
+		mock_frappe.get_all.side_effect = _get_all_handler(stock_items=["STOCK-1", "STOCK-2"])
+		created_pr = MagicMock()
+		created_pr.name = "PR-00001"
+		mock_frappe.get_doc.return_value = created_pr
+		mock_frappe.msgprint = MagicMock()
+
+		doc.create_purchase_receipt()
+
+		item_calls = [c for c in mock_frappe.get_all.call_args_list if c.args[0] == "Item"]
+		assert len(item_calls) == 1
+		assert item_calls[0].kwargs["filters"]["name"] == ["in", ["SERVICE-1", "STOCK-1", "STOCK-2"]]
+		assert not [c for c in mock_frappe.db.get_value.call_args_list if c.args[0] == "Item"]
+		warning = mock_frappe.msgprint.call_args_list[-1].args[0]
+		assert "SERVICE-1" in str(warning)
+		assert "STOCK-1" not in str(warning)
+
 	def test_pr_auto_matches_po_items_when_refs_missing(self, mock_frappe, sample_settings):
 		"""PO set at header but item-level purchase_order_item not set — auto-match by item_code."""
 		doc = _make_ocr_import(
@@ -673,9 +798,10 @@ class TestCreatePurchaseReceiptWithPORefs:
 		created_pr.name = "PR-00001"
 		mock_frappe.get_doc.return_value = created_pr
 		mock_frappe.msgprint = MagicMock()
-		mock_frappe.get_all.return_value = [
-			SimpleNamespace(name="po-item-auto-1", item_code="ITEM-001"),
-		]
+		mock_frappe.get_all.side_effect = _get_all_handler(
+			stock_items=["ITEM-001"],
+			po_items=[SimpleNamespace(name="po-item-auto-1", item_code="ITEM-001")],
+		)
 
 		doc.create_purchase_receipt()
 
@@ -685,6 +811,39 @@ class TestCreatePurchaseReceiptWithPORefs:
 		assert pr_item["purchase_order_item"] == "po-item-auto-1"
 
 
+# ---------------------------------------------------------------------------
+# due_date only when on/after posting_date
+# ---------------------------------------------------------------------------
+
+
+class TestPIDueDate:
+	@pytest.mark.parametrize(
+		"invoice_date, due_date, expected",
+		[
+			("2024-06-15", "2024-07-15", "2024-07-15"),
+			("2024-06-15", "2024-06-15", "2024-06-15"),
+			("2024-06-15", "2024-06-01", None),
+			(date(2024, 6, 15), "2024-07-15", "2024-07-15"),
+			("2024-06-15", date(2024, 6, 1), None),
+		],
+	)
+	def test_due_date_kept_only_on_or_after_posting(
+		self, mock_frappe, sample_settings, invoice_date, due_date, expected
+	):
+		doc = _make_ocr_import(
+			document_type="Purchase Invoice",
+			invoice_date=invoice_date,
+			due_date=due_date,
+			items=[_make_item()],
+		)
+		_setup_frappe_for_create(mock_frappe, sample_settings, "PI-DUE-001")
+
+		doc.create_purchase_invoice()
+
+		pi_dict = mock_frappe.get_doc.call_args[0][0]
+		assert pi_dict.get("due_date") == expected
+
+
 # ---------------------------------------------------------------------------
 # Doc-level cost_center precedence (line → parent → settings default)
 # ---------------------------------------------------------------------------
@@ -891,6 +1050,26 @@ class TestTaxTemplateOnPIAndPR:
 		template = SimpleNamespace(company="Test Company", taxes=[tax_row])
 		return template
 
+	def test_no_template_skips_inclusive_detection(self, mock_frappe, sample_settings):
+		"""Without a template there are no taxes to build, so the detector never runs."""
+		doc = _make_ocr_import(
+			document_type="Purchase Invoice",
+			tax_template=None,
+			tax_amount=150.00,
+			items=[_make_item()],
+		)
+		_setup_frappe_for_create(mock_frappe, sample_settings, "PI-NOTAX-001")
+
+		with patch(
+			"erpocr_integration.erpnext_ocr.doctype.ocr_import.ocr_import._detect_tax_inclusive_rates"
+		) as mock_detect:
+			doc.create_purchase_invoice()
+
+		mock_detect.assert_not_called()
+		pi_dict = mock_frappe.get_doc.call_args[0][0]
+		assert "taxes_and_charges" not in pi_dict
+		assert "taxes" not in pi_dict
+
 	def test_pi_applies_tax_template(self, mock_frappe, sample_settings):
 		"""PI creation applies tax template via shared helper."""
 		doc = _make_ocr_import(
@@ -925,6 +1104,16 @@ class TestTaxTemplateOnPIAndPR:
 		assert pi_dict["taxes"][0]["account_head"] == "2200 - VAT Input - TC"
 		assert pi_dict["taxes"][0]["rate"] == 15.0
 
+	def test_tax_rows_copy_every_template_column(self, mock_frappe):
+		"""Built rows carry all copied columns; the inclusive flag never touches the template."""
+		template = self._make_tax_template()
+		mock_frappe.get_cached_doc.return_value = template
+
+		_name, taxes = _build_taxes_from_template("SA VAT 15%", "Test Company", 150.0, True)
+
+		assert taxes == [{**vars(template.taxes[0]), "included_in_print_rate": 1}]
+		assert template.taxes[0].included_in_print_rate == 0
+
 	def test_pr_applies_tax_template(self, mock_frappe, sample_settings):
 		"""PR creation applies tax template via shared helper."""
 		doc = _make_ocr_import(
@@ -1053,6 +1242,129 @@ class TestUpdateStatus:
 		doc._update_status()
 		assert doc.status == "Error"
 
+	def test_stock_flags_fetched_in_one_query(self, mock_frappe):
+		"""Non-stock rows without an expense account hold the doc in Needs Review."""
+		doc = _make_ocr_import(
+			status="Pending",
+			supplier="Test Supplier",
+			items=[
+				_make_item(item_code="STOCK-1", expense_account=None),
+				_make_item(item_code="SERVICE-1", expense_account=None),
+				_make_item(item_code="SERVICE-2", expense_account="5000 - Expenses - TC"),
+			],
+		)
+		mock_frappe.get_all.side_effect = _get_all_handler(stock_items=["STOCK-1"])
+		mock_frappe.db.get_value.reset_mock()
+
+		doc._update_status()
+
+		assert doc.status == "Needs Review"
+		item_calls = [c for c in mock_frappe.get_all.call_args_list if c.args[0] == "Item"]
+		assert len(item_calls) == 1
+		assert item_calls[0].kwargs["filters"]["name"] == ["in", ["SERVICE-1", "STOCK-1"]]
+		mock_frappe.db.get_value.assert_not_called()
+
+	def test_all_stock_rows_are_matched(self, mock_frappe):
+		doc = _make_ocr_import(
+			status="Pending",
+			supplier="Test Supplier",
+			items=[_make_item(item_code="STOCK-1", expense_account=None)],
+		)
+		mock_frappe.get_all.side_effect = _get_all_handler(stock_items=["STOCK-1"])
+
+		doc._update_status()
+
+		assert doc.status == "Matched"
+
+	def _saved_twin(self, doc, **overrides):
+		"""The doc as loaded before this save (get_doc_before_save)."""
+		before = SimpleNamespace(
+			status=doc.status,
+			supplier=doc.supplier,
+			supplier_name_ocr=doc.supplier_name_ocr,
+			purchase_invoice=doc.purchase_invoice,
+			purchase_receipt=doc.purchase_receipt,
+			journal_entry=doc.journal_entry,
+			items=[SimpleNamespace(**vars(item)) for item in doc.items],
+		)
+		for key, value in overrides.items():
+			setattr(before, key, value)
+		return before
+
+	def test_unrelated_save_keeps_derived_status_without_queries(self, mock_frappe):
+		doc = _make_ocr_import(
+			status="Matched",
+			supplier="Test Supplier",
+			cost_center="Other CC - TC",
+			items=[_make_item(item_code="STOCK-1", expense_account=None)],
+		)
+		doc.get_doc_before_save = MagicMock(return_value=self._saved_twin(doc))
+		mock_frappe.get_all.reset_mock()
+
+		doc._update_status()
+
+		assert doc.status == "Matched"
+		mock_frappe.get_all.assert_not_called()
+
+	def test_changed_row_recomputes_status(self, mock_frappe):
+		doc = _make_ocr_import(
+			status="Matched",
+			supplier="Test Supplier",
+			items=[_make_item(item_code=None, match_status="Unmatched")],
+		)
+		before = self._saved_twin(doc)
+		before.items[0].item_code = "ITEM-001"
+		before.items[0].match_status = "Auto Matched"
+		doc.get_doc_before_save = MagicMock(return_value=before)
+
+		doc._update_status()
+
+		assert doc.status == "Needs Review"
+
+	def test_pending_reset_recomputes_even_when_inputs_unchanged(self, mock_frappe):
+		"""Unlink & Reset db_sets status=Pending then saves — that save must derive it."""
+		doc = _make_ocr_import(
+			status="Pending",
+			supplier="Test Supplier",
+			items=[_make_item(item_code="STOCK-1", expense_account=None)],
+		)
+		doc.get_doc_before_save = MagicMock(return_value=self._saved_twin(doc))
+		mock_frappe.get_all.side_effect = _get_all_handler(stock_items=["STOCK-1"])
+
+		doc._update_status()
+
+		assert doc.status == "Matched"
+
+	def test_no_item_query_when_a_row_is_unmatched(self, mock_frappe):
+		doc = _make_ocr_import(
+			status="Pending",
+			supplier="Test Supplier",
+			items=[
+				_make_item(item_code="SERVICE-1", expense_account=None),
+				_make_item(item_code=None, match_status="Unmatched"),
+			],
+		)
+		mock_frappe.get_all.reset_mock()
+
+		doc._update_status()
+
+		assert doc.status == "Needs Review"
+		mock_frappe.get_all.assert_not_called()
+
+	@pytest.mark.parametrize("supplier_name_ocr, expected", [("Acme OCR", "Needs Review"), ("", "Pending")])
+	def test_no_items_short_circuits(self, mock_frappe, supplier_name_ocr, expected):
+		doc = _make_ocr_import(
+			status="Pending", supplier="Test Supplier", supplier_name_ocr=supplier_name_ocr, items=[]
+		)
+		doc.get_doc_before_save = MagicMock()
+		mock_frappe.get_all.reset_mock()
+
+		doc._update_status()
+
+		assert doc.status == expected
+		doc.get_doc_before_save.assert_not_called()
+		mock_frappe.get_all.assert_not_called()
+
 
 # ---------------------------------------------------------------------------
 # _detect_tax_inclusive_rates tests
@@ -1479,8 +1791,11 @@ class TestStalePORefClearing:
 				)
 			],
 		)
-		mock_frappe.db.exists.return_value = True  # PR-belongs-to-PO validation
 		_setup_frappe_for_create(mock_frappe, sample_settings, "PI-00001")
+		# PR-belongs-to-PO validation
+		mock_frappe.get_all.side_effect = _get_all_handler(
+			pr_items=[SimpleNamespace(name="pr-item-row-1", item_code="OLD-CODE")]
+		)
 		# Both PO and PR saved refs point at OLD item_code
 		mock_frappe.db.get_value.side_effect = _stale_ref_db_get_value(
 			po_item_codes={"po-item-row-1": "OLD-CODE"},
@@ -1659,8 +1974,11 @@ class TestRefFieldInheritance:
 				)
 			],
 		)
-		mock_frappe.db.exists.return_value = True  # PR-belongs-to-PO validation
 		_setup_frappe_for_create(mock_frappe, sample_settings, "PI-00001")
+		# PR-belongs-to-PO validation
+		mock_frappe.get_all.side_effect = _get_all_handler(
+			pr_items=[SimpleNamespace(name="pr-item-row-1", item_code="OLD-CODE")]
+		)
 		mock_frappe.db.get_value.side_effect = _stale_ref_db_get_value(
 			po_item_rows={
 				"po-item-row-1": {
@@ -1744,15 +2062,17 @@ class TestRefFieldInheritance:
 			items=[_make_item(purchase_order_item=None)],  # no saved ref → FIFO path
 		)
 		_setup_frappe_for_create(mock_frappe, sample_settings, "PI-00001")
-		mock_frappe.get_all.return_value = [
-			SimpleNamespace(
-				name="po-item-auto-1",
-				item_code="ITEM-001",
-				uom="EA",
-				conversion_factor=1.0,
-				project="PROJ-01",
-			),
-		]
+		mock_frappe.get_all.side_effect = _get_all_handler(
+			po_items=[
+				SimpleNamespace(
+					name="po-item-auto-1",
+					item_code="ITEM-001",
+					uom="EA",
+					conversion_factor=1.0,
+					project="PROJ-01",
+				),
+			]
+		)
 
 		doc.create_purchase_invoice()
 
@@ -1809,6 +2129,19 @@ class TestOnUpdateLearning:
 		doc._save_item_alias.assert_not_called()
 		doc._enqueue_item_supplier_learning.assert_not_called()
 
+	def test_no_confirmed_rows_skips_settings_and_snapshot(self, mock_frappe):
+		"""A save with nothing confirmed returns before reading OCR Settings or the
+		before-save snapshot."""
+		doc = _make_ocr_import(items=[_make_item(match_status="Auto Matched")])
+		doc.has_value_changed = MagicMock(return_value=False)
+		doc.get_doc_before_save = MagicMock()
+		mock_frappe.get_cached_doc.reset_mock()
+
+		doc.on_update()
+
+		mock_frappe.get_cached_doc.assert_not_called()
+		doc.get_doc_before_save.assert_not_called()
+
 	def test_default_item_without_expense_account_learns_nothing(self, mock_frappe):
 		"""Catch-all line with NO expense account: nothing worth learning."""
 		self._settings(mock_frappe, default_item="ITEM001")
@@ -2099,7 +2432,7 @@ class TestAliasUpsert:
 
 		doc._save_supplier_alias()
 
-		new_doc.insert.assert_called_once_with(ignore_permissions=True)
+		new_doc.insert.assert_called_once_with(ignore_permissions=True, ignore_if_duplicate=True)
 		mock_frappe.db.set_value.assert_not_called()
 
 	def test_item_alias_corrected(self, mock_frappe):
@@ -2192,6 +2525,168 @@ class TestAliasUpsert:
 		inserted = mock_frappe.get_doc.call_args[0][0]
 		assert inserted["supplier"] == "Supplier A"
 
+	def test_service_mapping_updated_in_place(self, mock_frappe):
+		"""An existing mapping is rewritten with one set_value, not get_doc + save."""
+		doc = _make_ocr_import(supplier="Supplier A")
+		company, _supplier = doc._service_mapping_scope()
+		mock_frappe.db.get_value = MagicMock(return_value=company)
+		mock_frappe.db.set_value.reset_mock()
+		mock_frappe.get_doc.reset_mock()
+		item = _make_item(
+			description_ocr="Monthly hosting", item_code="SVC-1", expense_account="5200 - Hosting - TC"
+		)
+
+		doc._save_service_mapping(item, known_mappings={"monthly hosting": "SVC-MAP-00001"})
+
+		mock_frappe.db.get_value.assert_called_once_with("Account", "5200 - Hosting - TC", "company")
+		mock_frappe.db.set_value.assert_called_once_with(
+			"OCR Service Mapping",
+			"SVC-MAP-00001",
+			{
+				"item_code": "SVC-1",
+				"item_name": "Test Item",
+				"expense_account": "5200 - Hosting - TC",
+				"cost_center": "Main - TC",
+				"supplier": "Supplier A",
+				"source": "Auto",
+			},
+		)
+		mock_frappe.get_doc.assert_not_called()
+
+	def test_service_mapping_update_rejects_foreign_account(self, mock_frappe):
+		doc = _make_ocr_import(supplier="Supplier A")
+		mock_frappe.db.get_value = MagicMock(return_value="Other Company")
+		mock_frappe.db.set_value.reset_mock()
+		item = _make_item(
+			description_ocr="Monthly hosting", item_code="SVC-1", expense_account="5200 - Other"
+		)
+
+		with pytest.raises(Exception):
+			doc._save_service_mapping(item, known_mappings={"monthly hosting": "SVC-MAP-00001"})
+		mock_frappe.db.set_value.assert_not_called()
+
+	def test_account_company_looked_up_once_per_request(self, mock_frappe):
+		"""Rows sharing an expense account reuse the request-local company lookup."""
+		doc = _make_ocr_import(supplier="Supplier A")
+		company, _supplier = doc._service_mapping_scope()
+		mock_frappe.db.get_value = MagicMock(return_value=company)
+		known = {"monthly hosting": "SVC-MAP-00001", "domain renewal": "SVC-MAP-00002"}
+
+		for description in ("Monthly hosting", "Domain renewal"):
+			item = _make_item(
+				description_ocr=description, item_code="SVC-1", expense_account="5200 - Hosting - TC"
+			)
+			doc._save_service_mapping(item, known_mappings=known)
+
+		mock_frappe.db.get_value.assert_called_once_with("Account", "5200 - Hosting - TC", "company")
+
+	def test_bulk_inserted_aliases_clear_fuzzy_cache(self, mock_frappe):
+		"""bulk_insert bypasses the OCR Item Alias on_update hook, so the caller clears it."""
+		doc = _make_ocr_import(supplier="Supplier A")
+		mock_frappe.db.bulk_insert.reset_mock()
+		mock_frappe.get_all = MagicMock(
+			side_effect=lambda doctype, **kw: ["ITEM-A"] if doctype == "Item" else ["Supplier A"]
+		)
+		with patch("erpocr_integration.tasks.matching.clear_fuzzy_cache") as mock_clear:
+			doc._insert_item_aliases(
+				[{"ocr_text": "Widget", "supplier": "Supplier A", "item_code": "ITEM-A"}]
+			)
+		mock_frappe.db.bulk_insert.assert_called_once()
+		mock_clear.assert_called_once_with()
+
+	def test_bulk_insert_drops_aliases_with_missing_links(self, mock_frappe):
+		"""bulk_insert skips Link validation, so rows pointing at an Item or
+		Supplier that no longer exists are filtered out first."""
+		doc = _make_ocr_import(supplier="Supplier A")
+		mock_frappe.db.bulk_insert.reset_mock()
+		mock_frappe.get_all = MagicMock(
+			side_effect=lambda doctype, **kw: ["ITEM-A", "ITEM-B"] if doctype == "Item" else ["Supplier A"]
+		)
+		with patch("erpocr_integration.tasks.matching.clear_fuzzy_cache"):
+			doc._insert_item_aliases(
+				[
+					{"ocr_text": "Widget", "supplier": "Supplier A", "item_code": "ITEM-A"},
+					{"ocr_text": "Gadget", "supplier": "Supplier A", "item_code": "ITEM-GONE"},
+					{"ocr_text": "Bracket", "supplier": "Supplier Gone", "item_code": "ITEM-B"},
+					{"ocr_text": "Bolt", "supplier": None, "item_code": "ITEM-B"},
+				]
+			)
+
+		assert [c.args[0] for c in mock_frappe.get_all.call_args_list] == ["Item", "Supplier"]
+		bulk = mock_frappe.db.bulk_insert.call_args
+		fields = bulk.kwargs["fields"]
+		rows = [dict(zip(fields, row, strict=True)) for row in bulk.kwargs["values"]]
+		assert [(r["ocr_text"], r["source"]) for r in rows] == [("Widget", "Auto"), ("Bolt", "Auto")]
+
+	def test_on_update_prefetches_aliases_and_mappings_once(self, mock_frappe):
+		"""on_update looks up existing aliases and service mappings with one query
+		each for the whole invoice. A description repeated in the same save (any
+		case) reuses the row queued for its first occurrence."""
+		mock_frappe.db.bulk_insert.reset_mock()
+		settings = SimpleNamespace(default_item="")
+		settings.get = lambda key, default=None: getattr(settings, key, default)
+		mock_frappe.get_cached_doc.return_value = settings
+		doc = _make_ocr_import(
+			supplier="Supplier A",
+			items=[
+				_make_item(name="r1", description_ocr="Widget", item_code="ITEM-A", match_status="Confirmed"),
+				_make_item(name="r2", description_ocr="WIDGET", item_code="ITEM-A", match_status="Confirmed"),
+				_make_item(
+					name="r3", description_ocr="Bracket", item_code="ITEM-B", match_status="Confirmed"
+				),
+			],
+		)
+		doc.has_value_changed = MagicMock(return_value=False)
+		doc.get_doc_before_save = MagicMock(return_value=None)
+
+		def get_all(doctype, **kwargs):
+			if doctype == "OCR Item Alias":
+				return [SimpleNamespace(name="ALIAS-1", ocr_text="bracket", item_code="ITEM-X")]
+			if doctype == "Item":
+				return ["ITEM-A", "ITEM-B"]
+			if doctype == "Supplier":
+				return ["Supplier A"]
+			return []
+
+		mock_frappe.get_all = MagicMock(side_effect=get_all)
+		company, _supplier = doc._service_mapping_scope()
+		# Only the Account company check may hit get_value (the repeated WIDGET row
+		# updates the mapping Widget just created)
+		mock_frappe.db.get_value = MagicMock(
+			side_effect=lambda doctype, name, field=None, **kw: company if doctype == "Account" else None
+		)
+		mock_frappe.db.set_value.reset_mock()
+		new_doc = MagicMock()
+		new_doc.insert.return_value = new_doc
+		mock_frappe.get_doc.return_value = new_doc
+
+		doc.on_update()
+
+		assert [c.args[0] for c in mock_frappe.get_all.call_args_list] == [
+			"OCR Item Alias",
+			"OCR Service Mapping",
+			"Item",
+			"Supplier",
+		]
+		alias_filters = mock_frappe.get_all.call_args_list[0].kwargs["filters"]
+		assert alias_filters["ocr_text"] == ["in", ["Bracket", "WIDGET", "Widget"]]
+		looked_up = {c.args[0] for c in mock_frappe.db.get_value.call_args_list}
+		assert looked_up <= {"Account"}
+
+		# New aliases go out in one bulk INSERT, not a Document.insert each
+		inserted = [c.args[0] for c in mock_frappe.get_doc.call_args_list if isinstance(c.args[0], dict)]
+		assert not [d for d in inserted if d["doctype"] == "OCR Item Alias"]
+		mock_frappe.db.bulk_insert.assert_called_once()
+		bulk = mock_frappe.db.bulk_insert.call_args
+		assert bulk.args[0] == "OCR Item Alias"
+		fields = bulk.kwargs["fields"]
+		(row,) = bulk.kwargs["values"]
+		assert dict(zip(fields, row, strict=True))["ocr_text"] == "Widget"
+		assert dict(zip(fields, row, strict=True))["supplier"] == "Supplier A"
+		assert dict(zip(fields, row, strict=True))["item_code"] == "ITEM-A"
+		alias_updates = [c for c in mock_frappe.db.set_value.call_args_list if c.args[0] == "OCR Item Alias"]
+		assert alias_updates == [call("OCR Item Alias", "ALIAS-1", {"item_code": "ITEM-B", "source": "Auto"})]
+
 
 # ---------------------------------------------------------------------------
 # JE multi-tax-account split — live-review M2 / roadmap C1-7
@@ -2220,6 +2715,7 @@ class TestJEMultiTaxSplit:
 
 		mock_frappe.get_cached_doc.side_effect = get_cached_doc_handler
 		mock_frappe.db.get_value.side_effect = _db_get_value_handler()
+		mock_frappe.get_all.side_effect = _get_all_handler()
 		created_je = MagicMock()
 		created_je.name = "JE-SPLIT-001"
 		mock_frappe.get_doc.return_value = created_je
@@ -2415,6 +2911,7 @@ class TestJESplitExactness:
 
 		mock_frappe.get_cached_doc.side_effect = get_cached_doc_handler
 		mock_frappe.db.get_value.side_effect = _db_get_value_handler()
+		mock_frappe.get_all.side_effect = _get_all_handler()
 		created_je = MagicMock()
 		created_je.name = "JE-3WAY"
 		mock_frappe.get_doc.return_value = created_je
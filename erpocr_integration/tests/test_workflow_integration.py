@@ -53,6 +53,13 @@ def _make_ocr_import(**overrides):
 	doc.status = "Needs Review"
 	doc.items = []
 	doc.save = MagicMock()
+
+	def _db_set(field, value=None, **kwargs):
+		# Like Document.db_set: the values land on the in-memory doc too
+		for key, val in (field if isinstance(field, dict) else {field: value}).items():
+			setattr(doc, key, val)
+
+	doc.db_set = MagicMock(side_effect=_db_set)
 	for key, value in overrides.items():
 		setattr(doc, key, value)
 	return doc
@@ -101,17 +108,20 @@ def _sample_settings():
 def _db_get_value_no_existing(doctype, name, fields=None, **kwargs):
 	if doctype == "OCR Import":
 		return SimpleNamespace(purchase_invoice=None, purchase_receipt=None, journal_entry=None)
-	if doctype == "Account":
-		if isinstance(fields, str) and fields == "account_type":
-			return None
-		if isinstance(fields, (list, tuple)) and "account_type" in fields:
-			return None
-		return SimpleNamespace(company="Test Company", is_group=0, disabled=0)
 	if doctype == "Item":
 		return 1  # is_stock_item
 	return None
 
 
+def _get_all_accounts(doctype, filters=None, **kwargs):
+	if doctype == "Account":
+		return [
+			SimpleNamespace(name=name, company="Test Company", is_group=0, disabled=0, account_type=None)
+			for name in filters["name"][1]
+		]
+	return []
+
+
 # ---------------------------------------------------------------------------
 # Guard cross-flow tests
 # ---------------------------------------------------------------------------
@@ -129,6 +139,7 @@ class TestGuardCrossFlow:
 		)
 		settings = _sample_settings()
 		mock_frappe.db.get_value.side_effect = _db_get_value_no_existing
+		mock_frappe.get_all.side_effect = _get_all_accounts
 		mock_frappe.get_cached_doc.return_value = settings
 		created_je = MagicMock()
 		created_je.name = "JE-00001"
@@ -257,6 +268,7 @@ class TestStatusGuards:
 			items=[_make_item()],
 		)
 		mock_frappe.db.get_value.side_effect = _db_get_value_no_existing
+		mock_frappe.get_all.side_effect = _get_all_accounts
 		mock_frappe.get_cached_doc.return_value = _sample_settings()
 		je = MagicMock()
 		je.name = "JE-TEST"
@@ -300,32 +312,30 @@ class TestPurchaseOrderMatching:
 		ocr_doc.company = "Test Company"
 		ocr_doc.items = []
 
-		po_doc = MagicMock()
-		po_doc.supplier = "Supplier B"
-		po_doc.company = "Test Company"
-		po_doc.items = []
-
-		mock_frappe.get_doc.side_effect = lambda dt, name: ocr_doc if dt == "OCR Import" else po_doc
+		mock_frappe.db.get_value.return_value = SimpleNamespace(supplier="Supplier B", company="Test Company")
+		mock_frappe.get_doc.side_effect = lambda dt, name: ocr_doc
 
 		with pytest.raises(Exception):
 			match_po_items("OCR-IMP-00001", "PO-00001")
 
+		# Rejected from the PO header — the PO itself (with items) is never loaded
+		assert [c[0][0] for c in mock_frappe.get_doc.call_args_list] == ["OCR Import"]
+
 	def test_match_po_items_company_mismatch(self, mock_frappe):
 		ocr_doc = MagicMock()
 		ocr_doc.supplier = "Test Supplier"
 		ocr_doc.company = "Company A"
 		ocr_doc.items = []
 
-		po_doc = MagicMock()
-		po_doc.supplier = "Test Supplier"
-		po_doc.company = "Company B"
-		po_doc.items = []
-
-		mock_frappe.get_doc.side_effect = lambda dt, name: ocr_doc if dt == "OCR Import" else po_doc
+		mock_frappe.db.get_value.return_value = SimpleNamespace(supplier="Test Supplier", company="Company B")
+		mock_frappe.get_doc.side_effect = lambda dt, name: ocr_doc
 
 		with pytest.raises(Exception):
 			match_po_items("OCR-IMP-00001", "PO-00001")
 
+		# Rejected from the PO header — the PO itself (with items) is never loaded
+		assert [c[0][0] for c in mock_frappe.get_doc.call_args_list] == ["OCR Import"]
+
 	def test_match_po_items_correct_matching(self, mock_frappe):
 		"""Items matched by item_code in FIFO order."""
 		ocr_item_1 = SimpleNamespace(
@@ -353,6 +363,9 @@ class TestPurchaseOrderMatching:
 		po_doc.items = [po_item_1, po_item_2, po_item_3]
 
 		mock_frappe.get_doc.side_effect = lambda dt, name: ocr_doc if dt == "OCR Import" else po_doc
+		mock_frappe.db.get_value.return_value = SimpleNamespace(
+			supplier="Test Supplier", company="Test Company"
+		)
 		# Mock get_purchase_receipts_for_po (called internally)
 		mock_frappe.db.sql.return_value = []
 
@@ -376,6 +389,43 @@ class TestPurchaseOrderMatching:
 		assert len(result["unmatched_po"]) == 1
 		assert result["unmatched_po"][0]["item_code"] == "ITEM-C"
 
+	def test_match_po_items_duplicate_codes_fifo(self, mock_frappe):
+		"""Repeated item_codes consume PO lines in order; leftovers keep PO order."""
+		ocr_doc = MagicMock()
+		ocr_doc.supplier = "Test Supplier"
+		ocr_doc.company = "Test Company"
+		ocr_doc.items = [
+			SimpleNamespace(idx=i, item_code="ITEM-A", item_name="A", description_ocr="A", qty=1, rate=10)
+			for i in (1, 2)
+		]
+
+		po_items = []
+		for name, code in [
+			("poi-1", "ITEM-A"),
+			("poi-2", "ITEM-B"),
+			("poi-3", "ITEM-A"),
+			("poi-4", "ITEM-A"),
+		]:
+			po_item = MagicMock(item_code=code, item_name=code, qty=1, rate=10)
+			po_item.name = name
+			po_items.append(po_item)
+
+		po_doc = MagicMock()
+		po_doc.supplier = "Test Supplier"
+		po_doc.company = "Test Company"
+		po_doc.items = po_items
+
+		mock_frappe.get_doc.side_effect = lambda dt, name: ocr_doc if dt == "OCR Import" else po_doc
+		mock_frappe.db.get_value.return_value = SimpleNamespace(
+			supplier="Test Supplier", company="Test Company"
+		)
+		mock_frappe.get_list.return_value = []
+
+		result = match_po_items("OCR-IMP-00001", "PO-00001")
+
+		assert [m["match"]["purchase_order_item"] for m in result["matches"]] == ["poi-1", "poi-3"]
+		assert [p["name"] for p in result["unmatched_po"]] == ["poi-2", "poi-4"]
+
 
 # ---------------------------------------------------------------------------
 # PR matching API tests
@@ -413,6 +463,18 @@ class TestPurchaseReceiptMatching:
 		with pytest.raises(Exception):
 			get_purchase_receipts_for_po("PO-00001")
 
+	def test_get_purchase_receipts_for_po_single_query(self, mock_frappe):
+		"""Child-table filter through get_list — one query, permissions applied."""
+		mock_frappe.has_permission.return_value = True
+		mock_frappe.get_list.return_value = [{"name": "PR-00001"}]
+
+		assert get_purchase_receipts_for_po("PO-00001") == [{"name": "PR-00001"}]
+
+		mock_frappe.db.sql.assert_not_called()
+		kwargs = mock_frappe.get_list.call_args.kwargs
+		assert ["Purchase Receipt Item", "purchase_order", "=", "PO-00001"] in kwargs["filters"]
+		assert kwargs["distinct"] is True
+
 
 # ---------------------------------------------------------------------------
 # Row-level permission enforcement tests
@@ -550,7 +612,7 @@ class TestPurchaseReceiptLinkQuery:
 		)
 		assert result == []
 		# Should NOT have queried DB (blocked before SQL)
-		mock_frappe.db.sql.assert_not_called()
+		mock_frappe.get_list.assert_not_called()
 
 	def test_returns_empty_when_po_not_found(self, mock_frappe):
 		"""PO doesn't exist (get_value returns None) → empty result."""
@@ -562,23 +624,45 @@ class TestPurchaseReceiptLinkQuery:
 		)
 		assert result == []
 
-	def test_filters_by_row_level_pr_permission(self, mock_frappe):
-		"""SQL returns 2 PRs but user only has read on one → only one returned."""
-		mock_frappe.has_permission.side_effect = lambda dt, ptype="read", doc=None: (
-			False if dt == "Purchase Receipt" and doc == "PR-RESTRICTED" else True
-		)
+	def test_pr_rows_come_from_permission_aware_get_list(self, mock_frappe):
+		"""User-permission filtering is left to get_list's SQL — no per-row has_permission."""
+		mock_frappe.has_permission.side_effect = None
+		mock_frappe.has_permission.return_value = True
 		mock_frappe.db.get_value.return_value = "Test Company"
-		mock_frappe.db.sql.return_value = [
+		mock_frappe.get_list.return_value = [
 			SimpleNamespace(name="PR-00001", posting_date="2025-01-10", status="Completed"),
-			SimpleNamespace(name="PR-RESTRICTED", posting_date="2025-01-12", status="Completed"),
 		]
 
 		result = purchase_receipt_link_query(
 			"Purchase Receipt", "", "name", 0, 20, {"purchase_order": "PO-00001"}
 		)
 
-		assert len(result) == 1
-		assert result[0][0] == "PR-00001"
+		assert result == [["PR-00001", "2025-01-10 — Completed"]]
+		pr_row_checks = [
+			c
+			for c in mock_frappe.has_permission.call_args_list
+			if c.args[0] == "Purchase Receipt" and len(c.args) > 2
+		]
+		assert pr_row_checks == []
+		mock_frappe.db.sql.assert_not_called()
+
+	def test_pagination_and_scope_pushed_into_query(self, mock_frappe):
+		"""PO, company, txt and the page window all go into the one get_list call."""
+		mock_frappe.has_permission.side_effect = None
+		mock_frappe.has_permission.return_value = True
+		mock_frappe.db.get_value.return_value = "Test Company"
+		mock_frappe.get_list.return_value = []
+
+		purchase_receipt_link_query(
+			"Purchase Receipt", "PR-0", "name", 10, 20, {"purchase_order": "PO-00001"}
+		)
+
+		kwargs = mock_frappe.get_list.call_args.kwargs
+		assert ["Purchase Receipt Item", "purchase_order", "=", "PO-00001"] in kwargs["filters"]
+		assert ["Purchase Receipt", "company", "=", "Test Company"] in kwargs["filters"]
+		assert ["Purchase Receipt", "name", "like", "%PR-0%"] in kwargs["filters"]
+		assert kwargs["limit_start"] == 10
+		assert kwargs["limit_page_length"] == 20
 
 
 # ---------------------------------------------------------------------------